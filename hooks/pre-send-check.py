@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Quality gate before sending emails.
+
+Hook type: PreToolUse (Bash)
+Exit 0 = allow, Exit 2 = block with message
+
+Usage:
+    pre-send-check.py "<subject>" "<body>"
+    pre-send-check.py < message.eml
+
+Spam triggers and formatting rules come from subject_rules.py (which the
+subject scorer uses too) and the unsubscribe/address rules from
+compliance_rules.py, so the gate can never drift from the scorer and
+analyzer. Neither imports `re`, typing or the scorer's metrics and caches,
+and the rule dictionaries load from their compiled cache after a stat, so
+the checks add about 3 ms to interpreter startup.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'scripts'))
+
+from compliance_rules import has_physical_address, has_unsubscribe, is_marketing  # noqa: E402
+from subject_rules import check_formatting, check_spam_triggers  # noqa: E402
+
+# Bodies shorter than this many words get an advisory warning
+MIN_BODY_WORDS = 20
+
+
+def parse_message(content: str) -> tuple[str, str]:
+    """Split a raw message into (subject, body).
+
+    The body is everything after the first blank line; headers may be
+    folded across lines. Without a blank line the body is empty.
+    """
+    content = content.replace('\r\n', '\n')
+    headers, separator, body = content.partition('\n\n')
+    if not separator:
+        body = ''
+
+    subject = ''
+    lines = headers.split('\n')
+    for i, line in enumerate(lines):
+        if line[:8].lower() == 'subject:':
+            parts = [line[8:].strip()]
+            for continuation in lines[i + 1:]:
+                if not continuation[:1].isspace():
+                    break
+                parts.append(continuation.strip())
+            subject = ' '.join(part for part in parts if part)
+            break
+
+    return subject, body
+
+
+def check_message(subject: str, body: str) -> tuple[bool, list[str]]:
+    """Run the pre-send checks.
+
+    Returns:
+        (allowed, messages) where messages are block reasons or warnings
+    """
+    warnings = []
+
+    # Check 1: Spam trigger words in subject
+    _, triggers = check_spam_triggers(subject)
+    for trigger in triggers:
+        warnings.append(f"⚠️  Subject contains spam trigger word: '{trigger}'")
+
+    # Check 2: Formatting (all caps, excessive punctuation, emoji)
+    _, format_issues = check_formatting(subject)
+    for issue in format_issues:
+        warnings.append(f"⚠️  Subject formatting: {issue} — may trigger spam filters")
+
+    # Check 3: Email body too short
+    word_count = len(body.split())
+    if word_count < MIN_BODY_WORDS:
+        warnings.append(f"⚠️  Email body very short ({word_count} words) — consider adding more context")
+
+    # Check 4: Marketing emails need an unsubscribe mechanism (block) and address (advisory)
+    body_lower = body.lower()
+    if is_marketing(body_lower):
+        if not has_unsubscribe(body_lower):
+            return False, [
+                "❌ BLOCKED: Marketing email missing unsubscribe link",
+                "Add an unsubscribe mechanism to comply with CAN-SPAM and GDPR.",
+            ]
+        if not has_physical_address(body_lower):
+            warnings.append("⚠️  Marketing email has no physical address — required by CAN-SPAM")
+
+    return True, warnings
+
+
+def main():
+    subject = sys.argv[1] if len(sys.argv) > 1 else ''
+    body = sys.argv[2] if len(sys.argv) > 2 else ''
+    if not subject and not body:
+        # If no args, read a raw message from stdin
+        subject, body = parse_message(sys.stdin.read())
+
+    allowed, messages = check_message(subject, body)
+
+    if not allowed:
+        print("\n".join(messages))
+        sys.exit(2)
+
+    # Print warnings but allow send
+    if messages:
+        print("Pre-send quality checks:")
+        print("\n".join(messages))
+        print()
+        print("✓ Checks passed (warnings above are advisory)")
+
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
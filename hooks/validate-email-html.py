@@ -5,6 +5,7 @@ Hook type: PostToolUse (Edit, Write)
 Exit 0 = allow, Exit 2 = block with message
 """
 
+import mmap
 import sys
 import re
 from pathlib import Path
@@ -21,16 +22,31 @@ def validate_html_email(file_path: str) -> tuple[bool, list[str]]:
     if path.suffix.lower() != '.html':
         return True, []
 
+    # The checks below are ASCII patterns, so they run on the raw bytes:
+    # no decoding, any ASCII-compatible charset works, and the file is
+    # mapped rather than copied
     try:
-        content = path.read_text(encoding='utf-8')
+        with open(path, 'rb') as f:
+            try:
+                content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                content = b''  # empty file
     except Exception as e:
         return False, [f"❌ Cannot read file: {e}"]
 
+    try:
+        return _check_content(content)
+    finally:
+        if isinstance(content, mmap.mmap):
+            content.close()
+
+
+def _check_content(content) -> tuple[bool, list[str]]:
     errors = []
     warnings = []
 
     # Check 1: File size (Gmail clips at 102KB)
-    file_size = len(content.encode('utf-8'))
+    file_size = len(content)
     if file_size > 102 * 1024:
         errors.append(f"❌ BLOCKED: File size {file_size // 1024}KB exceeds 102KB Gmail limit")
         errors.append("   Gmail will clip your email. Reduce content or move to plain text.")
@@ -38,22 +54,22 @@ def validate_html_email(file_path: str) -> tuple[bool, list[str]]:
         warnings.append(f"⚠️  File size {file_size // 1024}KB approaching 102KB limit")
 
     # Check 2: Contains at least one <table> (email layout best practice)
-    if not re.search(r'<table[^>]*>', content, re.IGNORECASE):
+    if not re.search(rb'<table[^>]*>', content, re.IGNORECASE):
         warnings.append("⚠️  No <table> elements found — consider using table-based layout for email")
 
     # Check 3: No CSS Grid or Flexbox (poor email client support)
-    if re.search(r'display:\s*grid', content, re.IGNORECASE):
+    if re.search(rb'display:\s*grid', content, re.IGNORECASE):
         errors.append("❌ BLOCKED: CSS Grid detected — not supported in most email clients")
-    if re.search(r'display:\s*flex', content, re.IGNORECASE):
+    if re.search(rb'display:\s*flex', content, re.IGNORECASE):
         errors.append("❌ BLOCKED: CSS Flexbox detected — not supported in most email clients")
 
     # Check 4: Has viewport meta tag
-    if not re.search(r'<meta[^>]*name=["\']viewport["\']', content, re.IGNORECASE):
+    if not re.search(rb'<meta[^>]*name=["\']viewport["\']', content, re.IGNORECASE):
         warnings.append("⚠️  Missing viewport meta tag — may not render properly on mobile")
 
     # Check 5: Inline styles preferred over <style> tags
-    if re.search(r'<style[^>]*>', content, re.IGNORECASE):
-        style_count = len(re.findall(r'<style[^>]*>', content, re.IGNORECASE))
+    if re.search(rb'<style[^>]*>', content, re.IGNORECASE):
+        style_count = len(re.findall(rb'<style[^>]*>', content, re.IGNORECASE))
         warnings.append(f"⚠️  {style_count} <style> tag(s) found — inline styles have better email client support")
 
     is_valid = len(errors) == 0
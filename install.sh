@@ -57,6 +57,7 @@ main() {
         echo "Installing scripts..."
         cp -r "$TEMP_DIR/scripts" "$SKILLS_DIR/email/"
         chmod +x "$SKILLS_DIR/email/scripts"/*.py 2>/dev/null || true
+        chmod +x "$SKILLS_DIR/email/scripts/email-tools" 2>/dev/null || true
     fi
 
     # Copy hooks and make executable
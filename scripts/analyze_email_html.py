@@ -9,36 +9,66 @@ Usage:
     python analyze_email_html.py email.html
     python analyze_email_html.py email.html --json
     python analyze_email_html.py --stdin < email.html
+    python analyze_email_html.py templates/ --baseline baseline.json [--update-baseline]
+    python analyze_email_html.py templates/ --watch
+    python analyze_email_html.py --bench-parsers templates/
+    python analyze_email_html.py templates/ --export results.npz
+    python analyze_email_html.py templates/ --stats stats.json --workers 8
+    python analyze_email_html.py sequence/ --fragment-report
 """
 
 import argparse
 import json
+import os
 import re
 import sys
+import time
 from pathlib import Path
-from typing import Dict, List, Any, Optional
-
-# Try to import BeautifulSoup with graceful fallback
+from typing import Dict, FrozenSet, List, Any, NamedTuple, Optional, Sequence, Set, Tuple, Union
+from urllib.parse import urlsplit
+
+from compliance_rules import has_physical_address, has_unsubscribe
+from contrast import WCAG_AA, WCAG_AA_LARGE, analyze_contrast, is_dark_media
+from html_input import ByteSource, byte_length, open_html
+from html_parsers import DocumentFacts, parse_facts, select_backend
+from image_inspect import ImageInspector, is_local_src
+from metrics import CHECK_DURATION, DOCUMENT_SIZE, DOCUMENTS, ISSUES
+from rule_dictionaries import RULES
+
+# Parser backend (see html_parsers.py); EMAIL_HTML_PARSER pins one, otherwise
+# lxml is used when installed and the stdlib event parser when not
 try:
-    from bs4 import BeautifulSoup
-    PARSER = "lxml"
-    try:
-        # Test if lxml is available
-        BeautifulSoup("<html></html>", "lxml")
-    except:
-        PARSER = "html.parser"
-except ImportError:
-    print("WARNING: BeautifulSoup not installed. Install with: pip install beautifulsoup4 lxml", file=sys.stderr)
-    print("Falling back to basic HTML parsing (limited functionality)", file=sys.stderr)
-    BeautifulSoup = None
-    PARSER = None
-
-
-# Link shortener domains to flag
-LINK_SHORTENERS = [
-    "bit.ly", "tinyurl.com", "goo.gl", "ow.ly", "t.co", "buff.ly",
-    "is.gd", "tiny.cc", "shorturl.at", "rebrand.ly"
-]
+    PARSER = select_backend(os.environ.get("EMAIL_HTML_PARSER"))
+except ValueError as e:
+    print(f"WARNING: {e} - using automatic parser selection", file=sys.stderr)
+    PARSER = select_backend()
+
+# Local image inspection (see image_inspect.py); enabled by --asset-root or
+# EMAIL_ASSET_ROOT. Without it image weight is estimated per <img>.
+IMAGES: Optional[ImageInspector] = (
+    ImageInspector(os.environ["EMAIL_ASSET_ROOT"]) if os.environ.get("EMAIL_ASSET_ROOT") else None
+)
+
+# Shared-fragment memoization (see html_fragments.py); enabled by
+# --fragment-report. Links and compliance facts of DOM subtrees already seen
+# in the run (headers, footers, address blocks) are reused, not recomputed.
+FRAGMENTS = None
+
+# Estimated weight of an image whose file cannot be inspected
+ESTIMATED_IMAGE_BYTES = 50 * 1024
+
+# Per-image and total weight thresholds for inspected local assets
+OVERSIZED_IMAGE_BYTES = 200 * 1024
+TOTAL_IMAGE_WEIGHT_WARNING = 1024 * 1024
+
+# Intrinsic width above which an image is oversized for a 600px layout,
+# even at 2x for high-density screens
+MAX_IMAGE_WIDTH_PX = 1200
+
+
+# Link shortener domains to flag (see rule_dictionaries.py)
+LINK_SHORTENERS = RULES.link_shorteners
+LINK_SHORTENER_INDEX = RULES.link_shortener_index
 
 # Pure white color variations
 PURE_WHITE_VARIANTS = [
@@ -47,9 +77,144 @@ PURE_WHITE_VARIANTS = [
 ]
 
 
-def analyze_size(html: str, filepath: str) -> Dict[str, Any]:
+# Structural CSS tokens; strings and parenthesised groups are matched whole so
+# that `;` or `{` inside url(...) or quoted values never split a declaration.
+_CSS_TOKEN_RE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|\([^()]*\)|[{};]')
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/|<!--|-->', re.DOTALL)
+_CSS_SPACE_RE = re.compile(r'\s+')
+_CSS_PUNCT_SPACE_RE = re.compile(r'\s+(?=[,/)])|(?<=[,/(])\s+')
+_CSS_IMPORTANT_RE = re.compile(r'!\s*important$')
+
+# At-rules whose blocks contain nested rules rather than declarations
+_CSS_GROUPING_RULES = ('@media', '@supports', '@document', '@container', '@layer')
+
+
+class CssDeclaration(NamedTuple):
+    """A single normalized CSS declaration and where it came from."""
+    property: str
+    value: str
+    source: Any  # element index for inline styles, selector string for <style> rules
+    media: Optional[str]
+    order: int = 0  # position in the document's CSS, for cascade ties
+    important: bool = False
+    presentational: bool = False  # from an HTML attribute (bgcolor, <font color>)
+
+
+class CssIndex:
+    """
+    Normalized index of every CSS declaration in a document.
+
+    Built in one pass over inline `style` attributes, presentational attributes
+    (`bgcolor`, `<font color>`) and `<style>` blocks. Declarations are grouped as property -> value -> list of
+    CssDeclaration, with property names and values lowercased and whitespace
+    normalized so `display : FLEX` and `display:flex` index identically.
+    """
+
+    def __init__(self):
+        self.properties: Dict[str, Dict[str, List[CssDeclaration]]] = {}
+        self.media_queries: List[str] = []
+        self.selectors: List[str] = []
+        self._count = 0
+
+    def add(self, text: str, source: Any, media: Optional[str] = None,
+            presentational: bool = False) -> None:
+        """Parse and index a raw `property: value` declaration."""
+        prop, sep, value = text.partition(':')
+        prop = prop.strip().lower()
+        if not sep or not prop:
+            return
+        important = _CSS_IMPORTANT_RE.search(value.strip().lower()) is not None
+        value = normalize_css_value(value)
+        if not value:
+            return
+        decl = CssDeclaration(prop, value, source, media, self._count, important, presentational)
+        self._count += 1
+        self.properties.setdefault(prop, {}).setdefault(value, []).append(decl)
+
+    def values(self, prop: str) -> Dict[str, List[CssDeclaration]]:
+        """Return value -> declarations for a property (empty if unused)."""
+        return self.properties.get(prop, {})
+
+    def declarations(self, prop: str) -> List[CssDeclaration]:
+        """Return all declarations of a property, grouped by first-seen value."""
+        return [decl for decls in self.values(prop).values() for decl in decls]
+
+    def has_value(self, prop: str, *values: str) -> bool:
+        """Check whether a property is ever set to one of the given values."""
+        indexed = self.values(prop)
+        return any(value in indexed for value in values)
+
+
+def normalize_css_value(value: str) -> str:
+    """Lowercase a CSS value, drop !important and collapse whitespace."""
+    value = _CSS_SPACE_RE.sub(' ', value.strip().lower())
+    value = _CSS_IMPORTANT_RE.sub('', value).rstrip()
+    return _CSS_PUNCT_SPACE_RE.sub('', value)
+
+
+def _split_css(text: str):
+    """Yield (delimiter, chunk) pairs split on `{`, `}` and `;` outside strings."""
+    start = 0
+    for match in _CSS_TOKEN_RE.finditer(text):
+        if len(match.group()) == 1:
+            yield match.group(), text[start:match.start()]
+            start = match.end()
+    yield '', text[start:]
+
+
+def _index_stylesheet(index: CssIndex, text: str) -> None:
+    """Index the rules of a <style> block, tracking @media context."""
+    stack: List[str] = []
+    media: Optional[str] = None
+
+    for delim, chunk in _split_css(_CSS_COMMENT_RE.sub('', text)):
+        if delim == '{':
+            prelude = _CSS_SPACE_RE.sub(' ', chunk.strip().lower())
+            if prelude.startswith('@media'):
+                media = prelude[len('@media'):].strip()
+                index.media_queries.append(media)
+            elif not prelude.startswith('@'):
+                index.selectors.append(prelude)
+            stack.append(prelude)
+            continue
+
+        if stack and not stack[-1].startswith(_CSS_GROUPING_RULES):
+            index.add(chunk, stack[-1], media)
+
+        if delim == '}' and stack:
+            stack.pop()
+            media = next(
+                (p[len('@media'):].strip() for p in reversed(stack) if p.startswith('@media')),
+                None
+            )
+
+
+def build_css_index(facts: Optional[DocumentFacts]) -> CssIndex:
+    """Build a CssIndex from a document's CSS sources, in document order."""
+    index = CssIndex()
+    if not facts:
+        return index
+
+    for source in facts.css_sources:
+        if source[0] == 'sheet':
+            _index_stylesheet(index, source[1])
+            continue
+        if source[0] == 'hint':
+            _, element, prop, value = source
+            index.add(f"{prop}: {value}", element, presentational=True)
+            continue
+        for _, chunk in _split_css(source[2]):
+            index.add(chunk, source[1])
+
+    return index
+
+
+_PURE_WHITE_VALUES = {normalize_css_value(v) for v in PURE_WHITE_VARIANTS}
+
+
+def analyze_size(html: Union[str, ByteSource], filepath: str) -> Dict[str, Any]:
     """Analyze HTML file size and Gmail clip risk."""
-    size_bytes = len(html.encode('utf-8'))
+    size_bytes = byte_length(html)
     size_kb = size_bytes / 1024
 
     gmail_clip_risk = size_kb > 80
@@ -70,22 +235,81 @@ def analyze_size(html: str, filepath: str) -> Dict[str, Any]:
     }
 
 
-def analyze_images(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
-    """Analyze image usage and alt text."""
-    if not soup:
+def _inspect_images(facts: DocumentFacts, images: ImageInspector, base_dir: Optional[str]) -> Dict[str, Any]:
+    """Resolve local <img> sources and measure them from their file headers."""
+    total_bytes = 0
+    inspected = 0
+    missing = []
+    oversized = []
+    consulted: List[str] = []
+    for src, width_attr in zip(facts.image_srcs, facts.image_widths):
+        if not is_local_src(src):
+            continue
+        info = images.inspect(src, base_dir, consulted)
+        if info is None:
+            missing.append(src)
+            continue
+        inspected += 1
+        total_bytes += info.size_bytes
+
+        reasons = []
+        if info.size_bytes > OVERSIZED_IMAGE_BYTES:
+            reasons.append(f"{info.size_bytes // 1024}KB")
+        if info.width:
+            try:
+                display_width = int(str(width_attr).strip().rstrip("px"))
+            except ValueError:
+                display_width = None
+            if display_width and info.width > 2 * display_width:
+                reasons.append(f"{info.width}px wide, shown at {display_width}px")
+            elif info.width > MAX_IMAGE_WIDTH_PX:
+                reasons.append(f"{info.width}px wide")
+        if reasons:
+            oversized.append({
+                "src": src,
+                "format": info.format,
+                "width": info.width,
+                "height": info.height,
+                "size_bytes": info.size_bytes,
+                "reasons": reasons,
+            })
+
+    return {
+        "inspected": inspected,
+        "total_bytes": total_bytes,
+        "missing": missing,
+        "oversized": oversized,
+        "files": list(dict.fromkeys(consulted)),  # paths looked at, found or not
+    }
+
+
+def analyze_images(facts: DocumentFacts, html: str, images: Optional[ImageInspector] = None,
+                   base_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Analyze image usage and alt text.
+
+    With an ImageInspector, local images are weighed by their real file
+    size (remote ones are still estimated) and oversized or missing assets
+    are reported under "assets".
+    """
+    if not facts:
         return {"count": 0, "missing_alt": 0, "text_image_ratio": "unknown", "issues": []}
 
-    img_tags = soup.find_all('img')
-    img_count = len(img_tags)
-    missing_alt = sum(1 for img in img_tags if not img.get('alt'))
+    img_count = len(facts.image_alts)
+    missing_alt = sum(1 for alt in facts.image_alts if not alt)
 
     # Calculate text to image ratio
-    text_content = soup.get_text(separator=' ', strip=True)
+    text_content = facts.get_text(separator=' ', strip=True)
     text_length = len(text_content)
 
+    assets = _inspect_images(facts, images, base_dir) if images is not None else None
+
     # Rough estimate: assume average image is 50KB encoded as base64
     # For external images, we can't know size, so use conservative estimate
-    estimated_image_size = img_count * 50 * 1024  # 50KB per image
+    if assets is not None:
+        estimated_image_size = assets["total_bytes"] + (img_count - assets["inspected"]) * ESTIMATED_IMAGE_BYTES
+    else:
+        estimated_image_size = img_count * ESTIMATED_IMAGE_BYTES
 
     if text_length > 0:
         # Text ratio = text_chars / (text_chars + estimated_image_chars)
@@ -119,44 +343,56 @@ def analyze_images(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
             "message": "Image-only email detected - will fail with images disabled"
         })
 
-    return {
+    if assets is not None:
+        for image in assets["oversized"]:
+            issues.append({
+                "severity": "medium",
+                "check": "images",
+                "message": f"Oversized image {image['src']} ({', '.join(image['reasons'])})"
+            })
+        if assets["total_bytes"] > TOTAL_IMAGE_WEIGHT_WARNING:
+            issues.append({
+                "severity": "medium",
+                "check": "images",
+                "message": f"Total local image weight {assets['total_bytes'] // 1024}KB - slow to load on mobile"
+            })
+        if assets["missing"]:
+            issues.append({
+                "severity": "high",
+                "check": "images",
+                "message": f"{len(assets['missing'])} local image(s) not found: {', '.join(assets['missing'][:3])}"
+            })
+
+    results = {
         "count": img_count,
         "missing_alt": missing_alt,
         "text_image_ratio": ratio_str,
         "issues": issues
     }
+    if assets is not None:
+        results["assets"] = assets
+    return results
 
 
-def analyze_responsive(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
+def analyze_responsive(facts: DocumentFacts, html: str, css: Optional[CssIndex] = None) -> Dict[str, Any]:
     """Check responsive design implementation."""
-    if not soup:
+    if not facts:
         return {"viewport_meta": False, "media_queries": False, "max_width": None, "issues": []}
+    if css is None:
+        css = build_css_index(facts)
 
     # Check for viewport meta tag
-    viewport_meta = soup.find('meta', attrs={'name': 'viewport'}) is not None
+    viewport_meta = 'viewport' in facts.meta_names
 
     # Check for media queries
-    media_queries = '@media' in html
+    media_queries = len(css.media_queries) > 0
 
-    # Check for max-width on main container
+    # Check for max-width on main container, preferring rules outside @media
     max_width = None
-    style_tags = soup.find_all('style')
-    for style in style_tags:
-        if style.string and 'max-width' in style.string:
-            # Try to extract max-width value
-            match = re.search(r'max-width:\s*(\d+)px', style.string)
-            if match:
-                max_width = f"{match.group(1)}px"
-                break
-
-    # Also check inline styles
-    if not max_width:
-        for tag in soup.find_all(style=True):
-            if 'max-width' in tag['style']:
-                match = re.search(r'max-width:\s*(\d+)px', tag['style'])
-                if match:
-                    max_width = f"{match.group(1)}px"
-                    break
+    px_widths = [decl for decl in css.declarations('max-width') if re.fullmatch(r'\d+px', decl.value)]
+    if px_widths:
+        container = next((decl for decl in px_widths if decl.media is None), px_widths[0])
+        max_width = container.value
 
     issues = []
     if not viewport_meta:
@@ -174,7 +410,7 @@ def analyze_responsive(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
         })
 
     if max_width:
-        width_val = int(re.search(r'\d+', max_width).group())
+        width_val = int(max_width[:-2])
         if width_val > 640:
             issues.append({
                 "severity": "low",
@@ -190,35 +426,54 @@ def analyze_responsive(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
     }
 
 
-def analyze_dark_mode(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
-    """Check dark mode implementation."""
-    if not soup:
+def _contrast_issue(mode: Dict[str, Any], what: str) -> Dict[str, str]:
+    # The message stays the same while the offenders change, so baselines
+    # match it across runs; counts and offenders are in results["dark_mode"]["contrast"]
+    return {
+        "severity": "medium" if mode["worst"][0]["ratio"] < WCAG_AA_LARGE else "low",
+        "check": "dark_mode",
+        "message": f"Text {what}"
+    }
+
+
+def analyze_dark_mode(facts: DocumentFacts, html: str, css: Optional[CssIndex] = None) -> Dict[str, Any]:
+    """
+    Check dark mode implementation and text contrast.
+
+    Contrast (see contrast.py) is measured in light mode, under simulated
+    dark-mode color inversion and under the author's dark-mode rules; the
+    dark-mode counts only include text that is readable in light mode.
+    """
+    if not facts:
         return {
             "prefers_color_scheme": False,
             "color_scheme_meta": False,
             "outlook_data_attrs": False,
             "pure_white_bg": False,
+            "contrast": None,
             "issues": []
         }
+    if css is None:
+        css = build_css_index(facts)
 
     # Check for prefers-color-scheme media query
-    prefers_color_scheme = 'prefers-color-scheme' in html and 'dark' in html
+    prefers_color_scheme = any(is_dark_media(media) for media in css.media_queries)
 
     # Check for color-scheme meta tag or CSS property
     color_scheme_meta = (
-        soup.find('meta', attrs={'name': 'color-scheme'}) is not None or
-        'color-scheme:' in html
+        'color-scheme' in facts.meta_names or
+        bool(css.values('color-scheme'))
     )
 
     # Check for Outlook dark mode data attributes
-    outlook_data_attrs = '[data-ogsc]' in html or '[data-ogsb]' in html
+    outlook_data_attrs = any('[data-ogsc]' in sel or '[data-ogsb]' in sel for sel in css.selectors)
 
-    # Check for pure white backgrounds
-    pure_white_bg = False
-    for variant in PURE_WHITE_VARIANTS:
-        if variant in html.lower():
-            pure_white_bg = True
-            break
+    # Check for pure white backgrounds (light-mode rules only)
+    pure_white_bg = any(
+        not is_dark_media(decl.media) and any(token in _PURE_WHITE_VALUES for token in decl.value.split(' '))
+        for prop in ('background', 'background-color')
+        for decl in css.declarations(prop)
+    )
 
     issues = []
     if not prefers_color_scheme:
@@ -235,34 +490,44 @@ def analyze_dark_mode(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
             "message": "Pure white backgrounds detected - will blind users in dark mode"
         })
 
+    contrast = analyze_contrast(facts, css)
+    if contrast is not None:
+        for mode, what in (("light", f"below {WCAG_AA}:1 contrast"),
+                           ("dark_inverted", "unreadable when dark mode inverts colors"),
+                           ("dark_authored", "unreadable with your prefers-color-scheme: dark styles")):
+            if mode in contrast and contrast[mode]["below_aa"]:
+                issues.append(_contrast_issue(contrast[mode], what))
+
     return {
         "prefers_color_scheme": prefers_color_scheme,
         "color_scheme_meta": color_scheme_meta,
         "outlook_data_attrs": outlook_data_attrs,
         "pure_white_bg": pure_white_bg,
+        "contrast": contrast,
         "issues": issues
     }
 
 
-def analyze_layout(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
+def analyze_layout(facts: DocumentFacts, html: str, css: Optional[CssIndex] = None) -> Dict[str, Any]:
     """Analyze email layout structure."""
-    if not soup:
+    if not facts:
         return {
             "table_based": False,
             "css_grid": False,
             "flexbox": False,
             "issues": []
         }
+    if css is None:
+        css = build_css_index(facts)
 
     # Check if table-based layout (good for email)
-    tables = soup.find_all('table')
-    table_based = len(tables) > 0
+    table_based = facts.tables > 0
 
     # Check for CSS Grid (bad for email)
-    css_grid = 'display:grid' in html or 'display: grid' in html
+    css_grid = css.has_value('display', 'grid', 'inline-grid')
 
     # Check for Flexbox (bad for email)
-    flexbox = 'display:flex' in html or 'display: flex' in html
+    flexbox = css.has_value('display', 'flex', 'inline-flex')
 
     issues = []
     if not table_based:
@@ -294,36 +559,80 @@ def analyze_layout(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
     }
 
 
-def analyze_links(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
-    """Analyze links and CTAs."""
-    if not soup:
+class FragmentFacts(NamedTuple):
+    """Links and compliance facts of a run of text and links (one DOM subtree)."""
+    links: int
+    unsubscribe_link: bool
+    shortener: bool
+    domains: FrozenSet[str]
+    physical_address: bool
+    unsubscribe_text: bool
+    sender_text: bool
+
+
+def summarize_links(links: Sequence[Tuple[str, str]]) -> Tuple[bool, bool, Set[str]]:
+    """(unsubscribe link found, shortener found, distinct hosts) for (href, text) links."""
+    # Check for unsubscribe link
+    unsubscribe_found = False
+    for href, text in links:
+        if has_unsubscribe(href.lower()) or has_unsubscribe(text.lower()):
+            unsubscribe_found = True
+            break
+
+    # Check for link shorteners
+    shorteners_found = any(LINK_SHORTENER_INDEX.contains(href) for href, _ in links)
+
+    # Distinct link hosts (for corpus statistics)
+    domains = set()
+    for href, _ in links:
+        try:
+            host = urlsplit(href.strip()).hostname
+        except ValueError:
+            continue
+        if host:
+            domains.add(host)
+
+    return unsubscribe_found, shorteners_found, domains
+
+
+def fragment_facts(strings: Sequence[str], links: Sequence[Tuple[str, str]]) -> FragmentFacts:
+    """FragmentFacts for a contiguous run of visible strings and links."""
+    text = "".join(strings).lower()
+    unsubscribe_found, shorteners_found, domains = summarize_links(links)
+    return FragmentFacts(len(links), unsubscribe_found, shorteners_found, frozenset(domains),
+                         has_physical_address(text), has_unsubscribe(text), "from:" in text)
+
+
+def combine_fragment_facts(parts: List[FragmentFacts]) -> FragmentFacts:
+    return FragmentFacts(
+        sum(part.links for part in parts),
+        any(part.unsubscribe_link for part in parts),
+        any(part.shortener for part in parts),
+        frozenset().union(*(part.domains for part in parts)),
+        any(part.physical_address for part in parts),
+        any(part.unsubscribe_text for part in parts),
+        any(part.sender_text for part in parts),
+    )
+
+
+def analyze_links(facts: DocumentFacts, html: str, fragments: Optional[FragmentFacts] = None) -> Dict[str, Any]:
+    """Analyze links and CTAs (from the document's FragmentFacts when given)."""
+    if not facts:
         return {
             "count": 0,
             "has_unsubscribe": False,
             "shorteners_found": False,
+            "domains": [],
             "issues": []
         }
 
-    links = soup.find_all('a')
-    link_count = len(links)
-
-    # Check for unsubscribe link
-    has_unsubscribe = False
-    for link in links:
-        href = link.get('href', '').lower()
-        text = link.get_text().lower()
-        if 'unsubscribe' in href or 'unsubscribe' in text:
-            has_unsubscribe = True
-            break
-
-    # Check for link shorteners
-    shorteners_found = False
-    for link in links:
-        href = link.get('href', '')
-        for shortener in LINK_SHORTENERS:
-            if shortener in href:
-                shorteners_found = True
-                break
+    if fragments is not None:
+        link_count = fragments.links
+        unsubscribe_found, shorteners_found = fragments.unsubscribe_link, fragments.shortener
+        domains = fragments.domains
+    else:
+        link_count = len(facts.links)
+        unsubscribe_found, shorteners_found, domains = summarize_links(facts.links)
 
     issues = []
     if link_count > 5:
@@ -340,7 +649,7 @@ def analyze_links(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
             "message": "Link shorteners detected - may trigger spam filters"
         })
 
-    if not has_unsubscribe:
+    if not unsubscribe_found:
         issues.append({
             "severity": "high",
             "check": "links",
@@ -349,38 +658,29 @@ def analyze_links(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
 
     return {
         "count": link_count,
-        "has_unsubscribe": has_unsubscribe,
+        "has_unsubscribe": unsubscribe_found,
         "shorteners_found": shorteners_found,
+        "domains": sorted(domains),
         "issues": issues
     }
 
 
-def analyze_preheader(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
+def analyze_preheader(facts: DocumentFacts, html: str) -> Dict[str, Any]:
     """Check for preheader text."""
-    if not soup:
+    if not facts:
         return {"found": False, "length": 0, "issues": []}
 
     # Look for common preheader patterns
-    preheader = None
-
     # Check for elements with "preheader" in class or id
-    for tag in soup.find_all(['div', 'span', 'td']):
-        class_list = tag.get('class', [])
-        id_attr = tag.get('id', '')
-
-        if 'preheader' in str(class_list).lower() or 'preheader' in id_attr.lower():
-            preheader = tag.get_text(strip=True)
-            break
+    preheader = facts.preheader_tagged
 
     if not preheader:
-        # Check for hidden text at the beginning (common preheader pattern)
-        body = soup.find('body')
-        if body:
-            first_element = body.find(['div', 'span'])
-            if first_element:
-                style = first_element.get('style', '')
-                if 'display:none' in style or 'display: none' in style:
-                    preheader = first_element.get_text(strip=True)
+        # Check for hidden text at the beginning (common preheader pattern):
+        # the first div/span in <body>
+        if facts.first_body_block:
+            style, text = facts.first_body_block
+            if 'display:none' in style or 'display: none' in style:
+                preheader = text
 
     length = len(preheader) if preheader else 0
 
@@ -411,9 +711,15 @@ def analyze_preheader(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
     }
 
 
-def analyze_compliance(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
-    """Check CAN-SPAM compliance."""
-    if not soup:
+def analyze_compliance(facts: DocumentFacts, html: str, fragments: Optional[FragmentFacts] = None) -> Dict[str, Any]:
+    """
+    Check CAN-SPAM compliance.
+
+    With the document's FragmentFacts, a match inside any fragment is taken
+    from there; the full text is only scanned for what no fragment contains
+    (a match may still span two fragments).
+    """
+    if not facts:
         return {
             "physical_address": False,
             "unsubscribe": False,
@@ -421,18 +727,25 @@ def analyze_compliance(soup: BeautifulSoup, html: str) -> Dict[str, Any]:
             "issues": []
         }
 
-    text_content = soup.get_text().lower()
+    text_content = None
+
+    def text() -> str:
+        nonlocal text_content
+        if text_content is None:
+            text_content = facts.get_text().lower()
+        return text_content
 
     # Check for physical address (rough heuristic)
     # Look for patterns like street address, city, state, zip
-    physical_address = bool(re.search(r'\d+\s+\w+\s+(street|st|avenue|ave|road|rd|drive|dr|lane|ln)', text_content))
+    physical_address = (fragments is not None and fragments.physical_address) or has_physical_address(text())
 
     # Check for unsubscribe
-    unsubscribe = 'unsubscribe' in text_content
+    unsubscribe = (fragments is not None and fragments.unsubscribe_text) or has_unsubscribe(text())
 
     # Check for sender identification (company name, from address)
     # This is hard to verify automatically, so we'll check if there's a from/sender element
-    sender_id = soup.find('meta', attrs={'name': 'from'}) is not None or 'from:' in text_content
+    sender_id = ('from' in facts.meta_names or (fragments is not None and fragments.sender_text)
+                 or 'from:' in text())
 
     issues = []
     if not physical_address:
@@ -476,6 +789,95 @@ def calculate_score(results: Dict[str, Any]) -> int:
     return max(0, score)
 
 
+def analyze_html(html: Union[str, ByteSource], filepath: str = "<string>",
+                 parser: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run every check on an HTML document.
+
+    Args:
+        html: Document text, or its undecoded bytes (e.g. from open_html);
+            bytes are measured as-is and their encoding is sniffed
+        parser: Parser backend name (default: PARSER)
+
+    Returns:
+        Dict with per-check results, overall score and flattened issues
+    """
+    facts = _timed("parse", parse_facts, html, parser or PARSER)
+    return analyze_facts(facts, html, filepath)
+
+
+# Latency histogram children, bound once so timing a check is a single observe
+_CHECK_TIMERS: Dict[str, Any] = {}
+
+
+def _timed(check: str, fn, *args):
+    timer = _CHECK_TIMERS.get(check)
+    if timer is None:
+        timer = _CHECK_TIMERS.setdefault(check, CHECK_DURATION.labels(check))
+    start = time.perf_counter()
+    result = fn(*args)
+    timer.observe(time.perf_counter() - start)
+    return result
+
+
+def analyze_facts(facts: DocumentFacts, html: Union[str, ByteSource], filepath: str = "<string>") -> Dict[str, Any]:
+    """Run every check on an already parsed document."""
+    # Index CSS once for the style-driven checks
+    css = _timed("css_index", build_css_index, facts)
+
+    # Run all checks
+    size_results = _timed("size", analyze_size, html, filepath)
+    base_dir = os.path.dirname(os.path.abspath(filepath)) if not filepath.startswith("<") else None
+    image_results = _timed("images", analyze_images, facts, html, IMAGES, base_dir)
+    responsive_results = _timed("responsive", analyze_responsive, facts, html, css)
+    dark_mode_results = _timed("dark_mode", analyze_dark_mode, facts, html, css)
+    layout_results = _timed("layout", analyze_layout, facts, html, css)
+    fragments = _timed("fragments", FRAGMENTS.summarize, facts) if FRAGMENTS is not None and facts else None
+    links_results = _timed("links", analyze_links, facts, html, fragments)
+    preheader_results = _timed("preheader", analyze_preheader, facts, html)
+    compliance_results = _timed("compliance", analyze_compliance, facts, html, fragments)
+
+    # Compile results
+    results = {
+        "file": filepath,
+        "size_bytes": size_results["size_bytes"],
+        "size_kb": size_results["size_kb"],
+        "gmail_clip_risk": size_results["gmail_clip_risk"],
+        "gmail_clip_critical": size_results.get("gmail_clip_critical", False),
+        "images": {
+            "count": image_results["count"],
+            "missing_alt": image_results["missing_alt"],
+            "text_image_ratio": image_results["text_image_ratio"]
+        },
+        "responsive": responsive_results,
+        "dark_mode": dark_mode_results,
+        "layout": layout_results,
+        "links": links_results,
+        "preheader": preheader_results,
+        "compliance": compliance_results
+    }
+
+    if "assets" in image_results:
+        results["images"]["assets"] = image_results["assets"]
+
+    # Collect all issues
+    all_issues = []
+    for category in [size_results, image_results, responsive_results, dark_mode_results,
+                     layout_results, links_results, preheader_results, compliance_results]:
+        all_issues.extend(category.get("issues", []))
+
+    # Calculate score
+    results["score"] = calculate_score(results)
+    results["issues"] = all_issues
+
+    DOCUMENTS.inc()
+    DOCUMENT_SIZE.observe(size_results["size_bytes"])
+    for issue in all_issues:
+        ISSUES.labels(issue["check"], issue["severity"]).inc()
+
+    return results
+
+
 def format_human_readable(filepath: str, results: Dict) -> str:
     """Format results as human-readable report."""
     GREEN = "\033[92m"
@@ -506,10 +908,18 @@ def format_human_readable(filepath: str, results: Dict) -> str:
 
     # Images
     img = results['images']
-    output.append(f"\n{BOLD}Images:{RESET} {status(len(img['issues']) > 0)}")
+    image_issues = [issue for issue in results['issues'] if issue['check'] == 'images']
+    output.append(f"\n{BOLD}Images:{RESET} {status(len(image_issues) > 0)}")
     output.append(f"  Count: {img['count']}")
     output.append(f"  Missing alt text: {img['missing_alt']}")
     output.append(f"  Text/Image ratio: {img['text_image_ratio']}")
+    if 'assets' in img:
+        assets = img['assets']
+        output.append(f"  Local images: {assets['inspected']} ({assets['total_bytes'] / 1024:.1f} KB)")
+        for image in assets['oversized']:
+            output.append(f"  {YELLOW}⚠ Oversized: {image['src']} ({', '.join(image['reasons'])}){RESET}")
+        for src in assets['missing']:
+            output.append(f"  {RED}✗ Not found: {src}{RESET}")
 
     # Responsive
     resp = results['responsive']
@@ -524,6 +934,15 @@ def format_human_readable(filepath: str, results: Dict) -> str:
     output.append(f"  Prefers-color-scheme: {dark['prefers_color_scheme']}")
     output.append(f"  Color-scheme meta: {dark['color_scheme_meta']}")
     output.append(f"  Pure white backgrounds: {dark['pure_white_bg']}")
+    contrast = dark['contrast'] or {}
+    for mode, label in (("light", "Light"), ("dark_inverted", "Inverted"), ("dark_authored", "Dark styles")):
+        if mode not in contrast:
+            continue
+        summary = contrast[mode]
+        output.append(f"  Contrast ({label}): {summary['below_aa']} below {WCAG_AA}:1, min {summary['min_ratio']}:1")
+        for worst in summary["worst"]:
+            output.append(f"    {worst['ratio']}:1 {worst['foreground']} on {worst['background']} "
+                          f"<{worst['element']}> \"{worst['text'][:30]}\"")
 
     # Layout
     layout = results['layout']
@@ -573,8 +992,8 @@ def main():
     )
     parser.add_argument(
         "file",
-        nargs="?",
-        help="Path to HTML email file"
+        nargs="*",
+        help="Path to HTML email file (with --baseline/--watch/--bench-parsers: files or directories)"
     )
     parser.add_argument(
         "--stdin",
@@ -591,18 +1010,184 @@ def main():
         action="store_true",
         help="Show detailed analysis"
     )
+    parser.add_argument(
+        "--baseline",
+        help="Baseline file; report only new, resolved and changed issues against it"
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store the analyzed results as the new baseline"
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and print issue diffs whenever a template changes"
+    )
+    parser.add_argument(
+        "--parser",
+        help="HTML parser backend: lxml, stdlib, bs4-lxml or bs4-html.parser (default: auto)"
+    )
+    parser.add_argument(
+        "--export",
+        metavar="PATH",
+        help="Write results for all given files as columns: .csv, or compact .npz otherwise"
+    )
+    parser.add_argument(
+        "--stats",
+        metavar="PATH",
+        help="Summarize all given files as mergeable corpus statistics saved to PATH"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Worker processes for --stats (default: CPU count)"
+    )
+    parser.add_argument(
+        "--asset-root",
+        help="Directory for local <img> sources; weighs them from file headers (default: $EMAIL_ASSET_ROOT)"
+    )
+    parser.add_argument(
+        "--bench-parsers",
+        action="store_true",
+        help="Time every installed parser backend on the given files or directories"
+    )
+    parser.add_argument(
+        "--fragment-report",
+        action="store_true",
+        help="Analyze files or directories in one run, reusing facts of shared DOM fragments, and report the reuse"
+    )
 
     args = parser.parse_args()
 
-    # Read HTML
+    global PARSER, IMAGES, FRAGMENTS
+    if args.parser:
+        try:
+            PARSER = select_backend(args.parser)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.asset_root:
+        if not os.path.isdir(args.asset_root):
+            parser.error(f"--asset-root is not a directory: {args.asset_root}")
+        IMAGES = ImageInspector(args.asset_root)
+
+    if args.bench_parsers:
+        from html_baseline import iter_html_files
+        from html_parsers import benchmark_parsers, format_benchmark
+
+        if not args.file:
+            parser.error("--bench-parsers needs files or directories to measure")
+        documents = []
+        for path in iter_html_files(args.file):
+            with open(path, 'rb') as f:
+                documents.append((path, f.read()))
+        report = benchmark_parsers(
+            documents,
+            lambda html, facts: analyze_facts(facts, html, "<bench>"),
+            [args.parser] if args.parser else None
+        )
+        print(json.dumps(report, indent=2) if args.json else format_benchmark(report))
+        return
+
+    if args.fragment_report:
+        from html_baseline import iter_html_files
+        from html_fragments import FragmentCache, format_report
+
+        if not args.file:
+            parser.error("--fragment-report needs files or directories to analyze")
+        FRAGMENTS = FragmentCache(fragment_facts, combine_fragment_facts)
+        errors = []
+        for path in iter_html_files(args.file):
+            try:
+                with open_html(path) as data:
+                    analyze_html(data, path)
+            except OSError as e:
+                errors.append({"file": path, "error": str(e)})
+        report = FRAGMENTS.report()
+        if args.json:
+            print(json.dumps({**report, "errors": errors}, indent=2))
+        else:
+            print(format_report(report))
+            for error in errors:
+                print(f"ERROR: {error['file']}: {error['error']}")
+        if errors:
+            sys.exit(1)
+        return
+
+    if args.export:
+        from html_export import analyze_paths, export_results, format_summary
+
+        if not args.file:
+            parser.error("--export needs files or directories to analyze")
+        errors = []
+        summary = export_results(analyze_paths(args.file, errors), args.export)
+        summary["errors"] = errors
+        print(json.dumps(summary, indent=2) if args.json else format_summary(summary))
+        if errors:
+            sys.exit(1)
+        return
+
+    if args.stats:
+        from corpus_stats import collect_html_stats, format_human_readable as format_stats, save_stats
+
+        if not args.file:
+            parser.error("--stats needs files or directories to analyze")
+        stats, errors = collect_html_stats(args.file, args.workers)
+        save_stats(args.stats, stats)
+        summary = stats.summary()
+        if args.json:
+            print(json.dumps({**summary, "errors": errors}, indent=2))
+        else:
+            print(format_stats(summary))
+            for error in errors:
+                print(f"ERROR: {error['file']}: {error['error']}")
+        if errors:
+            sys.exit(1)
+        return
+
+    if args.watch:
+        from html_watch import watch
+
+        if not args.file:
+            parser.error("--watch needs files or directories to watch")
+        watch(args.file)
+        return
+
+    if args.baseline:
+        from html_baseline import (
+            compare_with_baseline,
+            format_human_readable as format_baseline,
+            load_baseline,
+            regressions,
+            save_baseline,
+        )
+
+        if not args.file:
+            parser.error("--baseline needs files or directories to compare")
+        baseline = load_baseline(args.baseline)
+        report = compare_with_baseline(args.file, baseline, update=args.update_baseline)
+        if args.update_baseline:
+            save_baseline(args.baseline, baseline)
+
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print(format_baseline(report))
+
+        # Exit code based on new critical issues
+        if report["errors"] or (not args.update_baseline and regressions(report) > 0):
+            sys.exit(1)
+        return
+
+    # Read HTML as bytes; the file is mapped, not copied
     if args.stdin:
-        html = sys.stdin.read()
         filepath = "<stdin>"
-    elif args.file:
-        filepath = args.file
+        results = analyze_html(sys.stdin.buffer.read(), filepath)
+    elif len(args.file) == 1:
+        filepath = args.file[0]
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                html = f.read()
+            with open_html(filepath) as data:
+                results = analyze_html(data, filepath)
         except FileNotFoundError:
             print(f"ERROR: File not found: {filepath}", file=sys.stderr)
             sys.exit(1)
@@ -610,50 +1195,7 @@ def main():
         parser.print_help()
         sys.exit(1)
 
-    # Parse HTML
-    soup = None
-    if BeautifulSoup:
-        soup = BeautifulSoup(html, PARSER)
-
-    # Run all checks
-    size_results = analyze_size(html, filepath)
-    image_results = analyze_images(soup, html)
-    responsive_results = analyze_responsive(soup, html)
-    dark_mode_results = analyze_dark_mode(soup, html)
-    layout_results = analyze_layout(soup, html)
-    links_results = analyze_links(soup, html)
-    preheader_results = analyze_preheader(soup, html)
-    compliance_results = analyze_compliance(soup, html)
-
-    # Compile results
-    results = {
-        "file": filepath,
-        "size_bytes": size_results["size_bytes"],
-        "size_kb": size_results["size_kb"],
-        "gmail_clip_risk": size_results["gmail_clip_risk"],
-        "gmail_clip_critical": size_results.get("gmail_clip_critical", False),
-        "images": {
-            "count": image_results["count"],
-            "missing_alt": image_results["missing_alt"],
-            "text_image_ratio": image_results["text_image_ratio"]
-        },
-        "responsive": responsive_results,
-        "dark_mode": dark_mode_results,
-        "layout": layout_results,
-        "links": links_results,
-        "preheader": preheader_results,
-        "compliance": compliance_results
-    }
-
-    # Collect all issues
-    all_issues = []
-    for category in [size_results, image_results, responsive_results, dark_mode_results,
-                     layout_results, links_results, preheader_results, compliance_results]:
-        all_issues.extend(category.get("issues", []))
-
-    # Calculate score
-    results["score"] = calculate_score(results)
-    results["issues"] = all_issues
+    all_issues = results["issues"]
 
     # Output
     if args.json:
@@ -668,4 +1210,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # The baseline, export, watch and stats modules import this module by
+    # name; alias it so they see the --parser/--asset-root settings
+    sys.modules.setdefault("analyze_email_html", sys.modules[__name__])
     main()
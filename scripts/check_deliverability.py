@@ -9,14 +9,21 @@ Usage:
     python check_deliverability.py example.com
     python check_deliverability.py example.com --json
     python check_deliverability.py example.com --verbose
+    python check_deliverability.py example.com --dmarc-store dmarc_reports.db
+    python check_deliverability.py example.com --trace trace.json
 """
 
 import argparse
 import json
 import subprocess
 import sys
+import time
 from datetime import datetime, timezone
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Optional, Tuple, Any
+
+from dns_resolver import DnsError, DnsTimeout
+from dns_trace import DnsTracer, format_summary, traced
+from rule_dictionaries import RULES
 
 
 # Common DKIM selectors to check
@@ -25,28 +32,28 @@ COMMON_DKIM_SELECTORS = [
     "mandrill", "dkim", "s1", "s2", "mail", "email"
 ]
 
-# MX hostname patterns to identify mail providers
-MX_PROVIDER_PATTERNS = {
-    "aspmx.l.google.com": "Google Workspace",
-    "googlemail.com": "Google Workspace",
-    "mail.protection.outlook.com": "Microsoft 365",
-    "pphosted.com": "Proofpoint",
-    "mimecast.com": "Mimecast",
-    "messagelabs.com": "Symantec",
-}
+# MX hostname patterns to identify mail providers (see rule_dictionaries.py)
+MX_PROVIDER_PATTERNS = RULES.mx_providers
 
 
-def run_dig_command(query: str, record_type: str = "TXT") -> List[str]:
+def run_dig_command(query: str, record_type: str = "TXT",
+                    tracer: Optional[DnsTracer] = None) -> List[str]:
     """
     Execute dig command and return cleaned results.
 
     Args:
         query: DNS query string
         record_type: DNS record type (TXT, MX, etc.)
+        tracer: Records a span for the query when given
 
     Returns:
-        List of result strings
+        List of result strings (empty only for a genuinely empty answer)
+
+    Raises:
+        DnsTimeout: no nameserver replied in time
+        DnsError: dig failed for any other reason
     """
+    started = time.perf_counter()
     try:
         cmd = ["dig", "+short", record_type.lower(), query]
         result = subprocess.run(
@@ -55,35 +62,94 @@ def run_dig_command(query: str, record_type: str = "TXT") -> List[str]:
             text=True,
             timeout=10
         )
-
-        if result.returncode != 0:
-            return []
-
-        # Clean and filter results
-        lines = [line.strip().strip('"') for line in result.stdout.strip().split('\n')]
-        return [line for line in lines if line]
-
     except subprocess.TimeoutExpired:
-        return []
+        _trace_dig(tracer, query, record_type, "timeout", started)
+        raise DnsTimeout(f"{record_type} {query} timed out (dig)")
     except FileNotFoundError:
         print("ERROR: 'dig' command not found. Please install dnsutils package.", file=sys.stderr)
         sys.exit(1)
-    except Exception:
+    except OSError as e:
+        _trace_dig(tracer, query, record_type, "error", started)
+        raise DnsError(f"{record_type} {query}: {e}")
+
+    # dig exits 9 when no nameserver replied
+    if result.returncode == 9:
+        _trace_dig(tracer, query, record_type, "timeout", started)
+        raise DnsTimeout(f"{record_type} {query} timed out (dig)")
+    if result.returncode != 0:
+        _trace_dig(tracer, query, record_type, "error", started)
+        raise DnsError(f"{record_type} {query}: dig exited {result.returncode}")
+
+    # Clean and filter results; ";;" lines are diagnostics from retried attempts
+    lines = [line.strip().strip('"') for line in result.stdout.strip().split('\n')]
+    records = [line for line in lines if line and not line.startswith(";;")]
+    _trace_dig(tracer, query, record_type, "answer" if records else "empty", started, len(records))
+    return records
+
+
+def _trace_dig(tracer: Optional[DnsTracer], query: str, record_type: str, outcome: str,
+               started: float, answers: Optional[int] = None) -> None:
+    if tracer is None:
+        return
+    attempt = {"nameserver": "dig", "transport": "dig", "outcome": outcome,
+               "latency_ms": round((time.perf_counter() - started) * 1000, 3)}
+    tracer.record(query, record_type.upper(), outcome, started, [attempt], "dig", answers=answers)
+
+
+def dns_failure(name: str, record_type: str, error: Exception) -> Dict[str, str]:
+    """Describe a lookup that failed, as opposed to one that answered empty."""
+    return {
+        "name": name,
+        "type": record_type,
+        "error": "timeout" if isinstance(error, DnsTimeout) else "error",
+        "message": str(error),
+    }
+
+
+def note_dns_failures(result: Dict[str, Any], failures: List[Dict[str, str]]) -> Dict[str, Any]:
+    """
+    Attach failed lookups to a check result.
+
+    A failed lookup says nothing about whether records exist, so "No ...
+    found" issues are replaced by one issue naming the failed queries.
+    """
+    if not failures:
+        return result
+    timeouts = sum(1 for failure in failures if failure["error"] == "timeout")
+    kinds = ", ".join(part for part in [
+        f"{timeouts} timed out" if timeouts else "",
+        f"{len(failures) - timeouts} failed" if len(failures) > timeouts else "",
+    ] if part)
+    names = ", ".join(f"{failure['type']} {failure['name']}" for failure in failures[:3])
+    if len(failures) > 3:
+        names += ", ..."
+    result["dns_failures"] = failures
+    result["issues"] = [f"DNS lookup incomplete ({kinds}: {names}) - records may exist"] + [
+        issue for issue in result["issues"] if not (issue.startswith("No ") and "found" in issue)
+    ]
+    return result
+
+
+def _dig(query: str, record_type: str, failures: List[Dict[str, str]],
+         tracer: Optional[DnsTracer]) -> List[str]:
+    try:
+        return run_dig_command(query, record_type, tracer)
+    except DnsError as e:
+        failures.append(dns_failure(query, record_type, e))
         return []
 
 
-def check_spf(domain: str, verbose: bool = False) -> Dict[str, Any]:
+def evaluate_spf(records: List[str]) -> Dict[str, Any]:
     """
-    Check SPF record for domain.
+    Evaluate the TXT records of a domain for SPF.
 
     Returns:
         Dict with SPF analysis results
     """
-    results = run_dig_command(domain, "TXT")
     spf_record = None
 
     # Find SPF record
-    for record in results:
+    for record in records:
         if record.startswith("v=spf1"):
             spf_record = record
             break
@@ -128,11 +194,6 @@ def check_spf(domain: str, verbose: bool = False) -> Dict[str, Any]:
     if enforcement in ["neutral", "pass_all"]:
         issues.append(f"Weak enforcement level: {enforcement}")
 
-    if verbose:
-        print(f"  SPF Record: {spf_record}")
-        print(f"  Enforcement: {enforcement}")
-        print(f"  DNS Lookups: {lookup_count}")
-
     return {
         "valid": True,
         "record": spf_record,
@@ -142,26 +203,37 @@ def check_spf(domain: str, verbose: bool = False) -> Dict[str, Any]:
     }
 
 
-def check_dkim(domain: str, verbose: bool = False) -> Dict[str, Any]:
+def check_spf(domain: str, verbose: bool = False, tracer: Optional[DnsTracer] = None) -> Dict[str, Any]:
     """
-    Check DKIM records for common selectors.
+    Check SPF record for domain.
 
     Returns:
-        Dict with DKIM analysis results
+        Dict with SPF analysis results
     """
-    found_selectors = []
+    failures: List[Dict[str, str]] = []
+    with traced(domain, "spf"):
+        spf = note_dns_failures(evaluate_spf(_dig(domain, "TXT", failures, tracer)), failures)
 
-    for selector in COMMON_DKIM_SELECTORS:
-        query = f"{selector}._domainkey.{domain}"
-        results = run_dig_command(query, "TXT")
+    if verbose and spf["valid"]:
+        print(f"  SPF Record: {spf['record']}")
+        print(f"  Enforcement: {spf['enforcement']}")
+        print(f"  DNS Lookups: {spf['lookup_count']}")
+
+    return spf
+
+
+def is_dkim_record(records: List[str]) -> bool:
+    """Return True if any TXT record at a selector looks like a DKIM key."""
+    return any("v=DKIM1" in record or "k=rsa" in record or "p=" in record for record in records)
 
-        for record in results:
-            if "v=DKIM1" in record or "k=rsa" in record or "p=" in record:
-                found_selectors.append(selector)
-                if verbose:
-                    print(f"  DKIM Selector '{selector}' found")
-                break
 
+def evaluate_dkim(found_selectors: List[str]) -> Dict[str, Any]:
+    """
+    Evaluate the DKIM selectors that were found for a domain.
+
+    Returns:
+        Dict with DKIM analysis results
+    """
     issues = []
     if not found_selectors:
         issues.append("No DKIM records found for common selectors")
@@ -175,19 +247,38 @@ def check_dkim(domain: str, verbose: bool = False) -> Dict[str, Any]:
     }
 
 
-def check_dmarc(domain: str, verbose: bool = False) -> Dict[str, Any]:
+def check_dkim(domain: str, verbose: bool = False, tracer: Optional[DnsTracer] = None) -> Dict[str, Any]:
     """
-    Check DMARC record for domain.
+    Check DKIM records for common selectors.
+
+    Returns:
+        Dict with DKIM analysis results
+    """
+    found_selectors = []
+    failures: List[Dict[str, str]] = []
+
+    with traced(domain, "dkim"):
+        for selector in COMMON_DKIM_SELECTORS:
+            query = f"{selector}._domainkey.{domain}"
+            if is_dkim_record(_dig(query, "TXT", failures, tracer)):
+                found_selectors.append(selector)
+                if verbose:
+                    print(f"  DKIM Selector '{selector}' found")
+
+    return note_dns_failures(evaluate_dkim(found_selectors), failures)
+
+
+def evaluate_dmarc(records: List[str]) -> Dict[str, Any]:
+    """
+    Evaluate the TXT records at _dmarc.<domain>.
 
     Returns:
         Dict with DMARC analysis results
     """
-    query = f"_dmarc.{domain}"
-    results = run_dig_command(query, "TXT")
     dmarc_record = None
 
     # Find DMARC record
-    for record in results:
+    for record in records:
         if record.startswith("v=DMARC1"):
             dmarc_record = record
             break
@@ -195,6 +286,7 @@ def check_dmarc(domain: str, verbose: bool = False) -> Dict[str, Any]:
     if not dmarc_record:
         return {
             "valid": False,
+            "record": None,
             "policy": None,
             "reporting": False,
             "rua": None,
@@ -221,16 +313,9 @@ def check_dmarc(domain: str, verbose: bool = False) -> Dict[str, Any]:
     if not reporting:
         issues.append("No DMARC reporting configured (rua/ruf)")
 
-    if verbose:
-        print(f"  DMARC Record: {dmarc_record}")
-        print(f"  Policy: {policy}")
-        if rua:
-            print(f"  Aggregate Reports: {rua}")
-        if ruf:
-            print(f"  Forensic Reports: {ruf}")
-
     return {
         "valid": True,
+        "record": dmarc_record,
         "policy": policy,
         "reporting": reporting,
         "rua": rua,
@@ -239,16 +324,36 @@ def check_dmarc(domain: str, verbose: bool = False) -> Dict[str, Any]:
     }
 
 
-def check_mx(domain: str, verbose: bool = False) -> Dict[str, Any]:
+def check_dmarc(domain: str, verbose: bool = False, tracer: Optional[DnsTracer] = None) -> Dict[str, Any]:
     """
-    Check MX records for domain.
+    Check DMARC record for domain.
 
     Returns:
-        Dict with MX analysis results
+        Dict with DMARC analysis results
     """
-    results = run_dig_command(domain, "MX")
+    failures: List[Dict[str, str]] = []
+    with traced(domain, "dmarc"):
+        dmarc = note_dns_failures(evaluate_dmarc(_dig(f"_dmarc.{domain}", "TXT", failures, tracer)), failures)
 
-    if not results:
+    if verbose and dmarc["valid"]:
+        print(f"  DMARC Record: {dmarc['record']}")
+        print(f"  Policy: {dmarc['policy']}")
+        if dmarc["rua"]:
+            print(f"  Aggregate Reports: {dmarc['rua']}")
+        if dmarc["ruf"]:
+            print(f"  Forensic Reports: {dmarc['ruf']}")
+
+    return dmarc
+
+
+def evaluate_mx(records: List[str]) -> Dict[str, Any]:
+    """
+    Evaluate MX records given as "<priority> <host>" strings.
+
+    Returns:
+        Dict with MX analysis results
+    """
+    if not records:
         return {
             "valid": False,
             "records": [],
@@ -260,7 +365,7 @@ def check_mx(domain: str, verbose: bool = False) -> Dict[str, Any]:
     mx_records = []
     provider = None
 
-    for record in results:
+    for record in records:
         parts = record.split()
         if len(parts) >= 2:
             try:
@@ -270,10 +375,7 @@ def check_mx(domain: str, verbose: bool = False) -> Dict[str, Any]:
 
                 # Detect provider
                 if not provider:
-                    for pattern, provider_name in MX_PROVIDER_PATTERNS.items():
-                        if pattern in host:
-                            provider = provider_name
-                            break
+                    provider = RULES.mx_provider(host)
             except ValueError:
                 continue
 
@@ -284,13 +386,6 @@ def check_mx(domain: str, verbose: bool = False) -> Dict[str, Any]:
     if len(mx_records) == 1:
         issues.append("Only one MX record - consider adding backup")
 
-    if verbose:
-        print(f"  MX Records: {len(mx_records)}")
-        for mx in mx_records:
-            print(f"    Priority {mx['priority']}: {mx['host']}")
-        if provider:
-            print(f"  Detected Provider: {provider}")
-
     return {
         "valid": True,
         "records": mx_records,
@@ -299,6 +394,27 @@ def check_mx(domain: str, verbose: bool = False) -> Dict[str, Any]:
     }
 
 
+def check_mx(domain: str, verbose: bool = False, tracer: Optional[DnsTracer] = None) -> Dict[str, Any]:
+    """
+    Check MX records for domain.
+
+    Returns:
+        Dict with MX analysis results
+    """
+    failures: List[Dict[str, str]] = []
+    with traced(domain, "mx"):
+        mx = note_dns_failures(evaluate_mx(_dig(domain, "MX", failures, tracer)), failures)
+
+    if verbose and mx["valid"]:
+        print(f"  MX Records: {len(mx['records'])}")
+        for record in mx["records"]:
+            print(f"    Priority {record['priority']}: {record['host']}")
+        if mx["provider"]:
+            print(f"  Detected Provider: {mx['provider']}")
+
+    return mx
+
+
 def calculate_health_score(spf: Dict, dkim: Dict, dmarc: Dict, mx: Dict) -> int:
     """
     Calculate DNS-only deliverability health score (0-100).
@@ -347,6 +463,46 @@ def calculate_health_score(spf: Dict, dkim: Dict, dmarc: Dict, mx: Dict) -> int:
     return int((score / 50) * 100)
 
 
+def collect_issues(spf: Dict, dkim: Dict, dmarc: Dict, mx: Dict) -> List[Dict[str, str]]:
+    """Flatten per-check issue strings into severity-tagged issue dicts."""
+    critical_issues = []
+    for check_name, check_results in [("spf", spf), ("dkim", dkim),
+                                       ("dmarc", dmarc), ("mx", mx)]:
+        for issue in check_results.get("issues", []):
+            # Determine severity
+            severity = "medium"
+            if "No" in issue and "found" in issue:
+                severity = "high"
+            elif issue.startswith("DNS lookup incomplete"):
+                severity = "high"
+            elif check_name == "dkim" and "Only one" in issue:
+                severity = "low"
+
+            critical_issues.append({
+                "severity": severity,
+                "check": check_name,
+                "message": issue
+            })
+
+    return critical_issues
+
+
+def build_report(domain: str, spf: Dict, dkim: Dict, dmarc: Dict, mx: Dict) -> Dict[str, Any]:
+    """Assemble the full report dict printed by --json."""
+    return {
+        "domain": domain,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "health_score": calculate_health_score(spf, dkim, dmarc, mx),
+        "spf": spf,
+        "dkim": dkim,
+        "dmarc": dmarc,
+        "mx": mx,
+        "issues": collect_issues(spf, dkim, dmarc, mx),
+        # False when any lookup failed, i.e. the score may understate the domain
+        "complete": not any(check.get("dns_failures") for check in (spf, dkim, dmarc, mx))
+    }
+
+
 def format_human_readable(domain: str, results: Dict) -> str:
     """
     Format results as human-readable report with ANSI colors.
@@ -415,9 +571,23 @@ def format_human_readable(domain: str, results: Dict) -> str:
             output.append(f"  Priority {record['priority']}: {record['host']}")
         if results['mx']['provider']:
             output.append(f"  Provider: {results['mx']['provider']}")
+    for probe in results['mx'].get('smtp', []):
+        if not probe['reachable']:
+            output.append(f"  {RED}✗{RESET} SMTP {probe['host']}: unreachable")
+        else:
+            tls = probe['tls']['version'] if probe['tls'] else "no TLS"
+            output.append(f"  SMTP {probe['host']}: {tls}, {probe['latency_ms']['total']:.0f} ms")
     for issue in results['mx']['issues']:
         output.append(f"  {YELLOW}⚠{RESET} {issue}")
 
+    # DMARC aggregate reports (--dmarc-store)
+    reports = results.get('dmarc_reports')
+    if reports and reports['messages']:
+        output.append(f"\n{BOLD}DMARC Aggregate Reports:{RESET} {reports['reports']} reports, "
+                      f"{reports['messages']} messages, {reports['pass_rate']}% aligned")
+        for source in reports['top_failing_sources'][:5]:
+            output.append(f"  {RED}✗{RESET} {source['source_ip']}: {source['messages']} unaligned messages")
+
     # Overall issues
     if results['issues']:
         output.append(f"\n{BOLD}Critical Issues:{RESET}")
@@ -446,8 +616,17 @@ def main():
         action="store_true",
         help="Show detailed progress"
     )
+    parser.add_argument(
+        "--dmarc-store",
+        help="Include aggregate report results from a dmarc_reports.py store"
+    )
+    parser.add_argument(
+        "--trace",
+        help="Write a JSON trace of every DNS query (spans plus slowest-query summary)"
+    )
 
     args = parser.parse_args()
+    tracer = DnsTracer() if args.trace else None
     domain = args.domain.lower().strip()
 
     if args.verbose and not args.json:
@@ -456,58 +635,41 @@ def main():
     # Run all checks
     if args.verbose and not args.json:
         print("Checking SPF...")
-    spf_results = check_spf(domain, args.verbose and not args.json)
+    spf_results = check_spf(domain, args.verbose and not args.json, tracer)
 
     if args.verbose and not args.json:
         print("\nChecking DKIM...")
-    dkim_results = check_dkim(domain, args.verbose and not args.json)
+    dkim_results = check_dkim(domain, args.verbose and not args.json, tracer)
 
     if args.verbose and not args.json:
         print("\nChecking DMARC...")
-    dmarc_results = check_dmarc(domain, args.verbose and not args.json)
+    dmarc_results = check_dmarc(domain, args.verbose and not args.json, tracer)
 
     if args.verbose and not args.json:
         print("\nChecking MX records...")
-    mx_results = check_mx(domain, args.verbose and not args.json)
+    mx_results = check_mx(domain, args.verbose and not args.json, tracer)
 
-    # Calculate health score
-    health_score = calculate_health_score(spf_results, dkim_results, dmarc_results, mx_results)
+    results = build_report(domain, spf_results, dkim_results, dmarc_results, mx_results)
+    health_score = results["health_score"]
 
-    # Collect critical issues
-    critical_issues = []
-    for check_name, check_results in [("spf", spf_results), ("dkim", dkim_results),
-                                       ("dmarc", dmarc_results), ("mx", mx_results)]:
-        for issue in check_results.get("issues", []):
-            # Determine severity
-            severity = "medium"
-            if "No" in issue and "found" in issue:
-                severity = "high"
-            elif check_name == "dkim" and "Only one" in issue:
-                severity = "low"
-
-            critical_issues.append({
-                "severity": severity,
-                "check": check_name,
-                "message": issue
-            })
+    if args.dmarc_store:
+        from dmarc_reports import summarize
+        try:
+            results["dmarc_reports"] = summarize(args.dmarc_store, domain)
+        except FileNotFoundError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(1)
 
-    # Build final results
-    results = {
-        "domain": domain,
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "health_score": health_score,
-        "spf": spf_results,
-        "dkim": dkim_results,
-        "dmarc": dmarc_results,
-        "mx": mx_results,
-        "issues": critical_issues
-    }
+    if tracer is not None:
+        tracer.save(args.trace)
 
     # Output
     if args.json:
         print(json.dumps(results, indent=2))
     else:
         print(format_human_readable(domain, results))
+        if tracer is not None:
+            print("\n" + format_summary(tracer.summary()))
 
     # Exit code based on health score
     if health_score < 60:
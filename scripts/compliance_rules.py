@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Compliance Rules
+
+Text-level CAN-SPAM heuristics shared by analyze_email_html.py and the
+pre-send hook. Kept free of third-party imports (and of `re`, which alone
+costs the hook more than its checks) so the hook can load it without
+paying for BeautifulSoup/lxml.
+
+All functions expect lowercased text.
+"""
+
+
+# Keywords that mark a message as marketing (and so subject to CAN-SPAM)
+MARKETING_KEYWORDS = [
+    "newsletter", "unsubscribe", "marketing", "promotion", "offer", "discount"
+]
+
+# Rough street address heuristic: number, street name, street suffix
+STREET_SUFFIXES = ("street", "st", "avenue", "ave", "road", "rd", "drive", "dr", "lane", "ln")
+
+
+def has_unsubscribe(text: str) -> bool:
+    """Check for an unsubscribe mechanism (link text, href or plain text)."""
+    return 'unsubscribe' in text
+
+
+def has_physical_address(text: str) -> bool:
+    """
+    Check for something that looks like a postal street address.
+
+    Same as re.search(r'\\d+\\s+\\w+\\s+(street|st|...)', text): a word ending
+    in a digit, a word of word characters only, then a word starting with a
+    street suffix.
+    """
+    words = text.split()
+    for number, name, suffix in zip(words, words[1:], words[2:]):
+        if (number[-1].isdecimal() and suffix.startswith(STREET_SUFFIXES)
+                and all(char.isalnum() or char == "_" for char in name)):
+            return True
+    return False
+
+
+def is_marketing(text: str) -> bool:
+    """Check whether the content reads as a marketing message."""
+    return any(keyword in text for keyword in MARKETING_KEYWORDS)
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Text Contrast Engine
+
+Resolves the effective foreground and background color of every element
+with visible text from the CSS cascade (inline styles, bgcolor and
+<font color>, and simple `tag`, `.class`, `#id` rules in <style> blocks,
+with `!important` declarations outranking normal ones), then computes WCAG 2.x
+contrast ratios for light mode, for a simulated dark-mode inversion, and for
+the author's own `prefers-color-scheme: dark` rules when present.
+
+Python work is per distinct CSS value and selector, not per element.
+Specified colors are assigned to elements with array indexing, inheritance
+is resolved by pointer jumping over the parent array (log2(depth) passes),
+and luminance and dark-mode inversion are computed once per palette color,
+so templates with thousands of styled cells cost a few array operations.
+
+Dark-mode inversion follows the partial-inversion clients (Gmail apps,
+Outlook.com): light backgrounds and dark text have their HLS lightness
+inverted with hue and saturation kept, while dark backgrounds and light text
+are left alone. For a color with channel maximum M and minimum m that is
+exactly rgb + (1 - M - m).
+
+Requires NumPy; without it analyze_contrast() returns None.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# NumPy is imported on the first analyze_contrast() call, so importing this
+# module (and the analyzer, e.g. for --help) does not pay for it
+np = None
+
+
+# WCAG 2.x AA minimum for normal text (font sizes are not resolved, so large
+# text is held to the same bar)
+WCAG_AA = 4.5
+WCAG_AA_LARGE = 3.0
+
+WORST_OFFENDERS = 5
+
+# Client defaults where nothing is specified
+DEFAULT_FOREGROUND = (0, 0, 0)
+DEFAULT_BACKGROUND = (255, 255, 255)
+DEFAULT_LINK_COLOR = (0, 0, 238)
+
+NAMED_COLORS = {
+    "black": (0, 0, 0), "white": (255, 255, 255), "red": (255, 0, 0), "green": (0, 128, 0),
+    "blue": (0, 0, 255), "yellow": (255, 255, 0), "orange": (255, 165, 0), "purple": (128, 0, 128),
+    "gray": (128, 128, 128), "grey": (128, 128, 128), "silver": (192, 192, 192),
+    "lightgray": (211, 211, 211), "lightgrey": (211, 211, 211), "darkgray": (169, 169, 169),
+    "darkgrey": (169, 169, 169), "dimgray": (105, 105, 105), "dimgrey": (105, 105, 105),
+    "gainsboro": (220, 220, 220), "whitesmoke": (245, 245, 245), "navy": (0, 0, 128),
+    "maroon": (128, 0, 0), "olive": (128, 128, 0), "teal": (0, 128, 128), "aqua": (0, 255, 255),
+    "cyan": (0, 255, 255), "fuchsia": (255, 0, 255), "magenta": (255, 0, 255), "lime": (0, 255, 0),
+    "pink": (255, 192, 203), "gold": (255, 215, 0), "beige": (245, 245, 220), "ivory": (255, 255, 240),
+    "snow": (255, 250, 250), "ghostwhite": (248, 248, 255), "aliceblue": (240, 248, 255),
+    "darkblue": (0, 0, 139), "darkred": (139, 0, 0), "darkgreen": (0, 100, 0),
+}
+
+# Inline declarations outrank any selector; presentational attributes rank
+# below every selector, and the `a` default below those
+_INLINE_PRIORITY = 1 << 20
+_SELECTOR_PRIORITY = 2
+_HINT_PRIORITY = 1
+_UA_PRIORITY = 0
+# Author dark-mode rules apply on top of the light cascade
+_DARK_OFFSET = 1 << 21
+# !important outranks all normal declarations; inline !important outranks every rule
+_IMPORTANT_OFFSET = 1 << 22
+_INLINE_IMPORTANT_PRIORITY = 1 << 23
+
+_HEX_RE = re.compile(r'^#([0-9a-f]{3,4}|[0-9a-f]{6}|[0-9a-f]{8})$')
+_RGB_RE = re.compile(r'^rgba?\(([^)]*)\)$')
+_COMPOUND_RE = re.compile(r'^([a-z][a-z0-9]*|\*)?((?:[.#][-_a-z0-9]+)*)$')
+_SIMPLE_PART_RE = re.compile(r'[.#][-_a-z0-9]+')
+
+
+def parse_color(value: str) -> Optional[Tuple[int, int, int]]:
+    """Parse a normalized CSS color; None for transparent, currentcolor or unknown values."""
+    if value in NAMED_COLORS:
+        return NAMED_COLORS[value]
+    match = _HEX_RE.match(value)
+    if match:
+        digits = match.group(1)
+        if len(digits) in (3, 4):
+            if len(digits) == 4 and digits[3] == "0":
+                return None
+            return tuple(int(c * 2, 16) for c in digits[:3])
+        if len(digits) == 8 and digits[6:] == "00":
+            return None
+        return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+    match = _RGB_RE.match(value)
+    if match:
+        parts = re.split(r'[,\s/]+', match.group(1).strip())
+        if len(parts) < 3:
+            return None
+        try:
+            channels = [
+                round(float(p[:-1]) * 2.55) if p.endswith("%") else round(float(p))
+                for p in parts[:3]
+            ]
+            if len(parts) > 3:
+                alpha = float(parts[3][:-1]) / 100 if parts[3].endswith("%") else float(parts[3])
+                if alpha == 0:
+                    return None
+        except ValueError:
+            return None
+        return tuple(max(0, min(255, c)) for c in channels)
+    return None
+
+
+def _background_color(value: str) -> Optional[Tuple[int, int, int]]:
+    """First color token of a `background` shorthand (or background-color value)."""
+    for token in value.split(" "):
+        color = parse_color(token)
+        if color is not None:
+            return color
+    return None
+
+
+def compile_selector(selector: str) -> List[Tuple[int, Optional[str], List[str], List[str]]]:
+    """
+    Split a selector list into matchable compounds.
+
+    Returns:
+        (specificity, tag, ids, classes) for each comma-separated part that is
+        a single `tag.class#id` compound; parts with combinators, pseudo-classes
+        or attribute selectors are skipped
+    """
+    compiled = []
+    for part in selector.split(","):
+        part = part.strip()
+        match = _COMPOUND_RE.match(part)
+        if not part or not match:
+            continue
+        tag = match.group(1) if match.group(1) != "*" else None
+        simple = _SIMPLE_PART_RE.findall(match.group(2))
+        ids = [token[1:] for token in simple if token[0] == "#"]
+        classes = [token[1:] for token in simple if token[0] == "."]
+        specificity = len(ids) * 10000 + len(classes) * 100 + (1 if tag else 0)
+        compiled.append((specificity, tag, ids, classes))
+    return compiled
+
+
+class _ElementIndex:
+    """Tag, class and id lookups over a document's elements, built lazily."""
+
+    def __init__(self, facts):
+        self.facts = facts
+        self.count = len(facts.element_tags)
+        self._tags: Optional[Dict[str, List[int]]] = None
+        self._classes: Optional[Dict[str, List[int]]] = None
+        self._ids: Optional[Dict[str, List[int]]] = None
+
+    def by_tag(self, tag: str):
+        if self._tags is None:
+            self._tags = {}
+            for index, name in enumerate(self.facts.element_tags):
+                self._tags.setdefault(name, []).append(index)
+        return np.array(self._tags.get(tag, []), dtype=np.int64)
+
+    def by_class(self, name: str):
+        if self._classes is None:
+            self._classes = {}
+            for index, value in self.facts.element_classes.items():
+                for cls in value.lower().split():
+                    self._classes.setdefault(cls, []).append(index)
+        return np.array(self._classes.get(name, []), dtype=np.int64)
+
+    def by_id(self, name: str):
+        if self._ids is None:
+            self._ids = {}
+            for index, value in self.facts.element_ids.items():
+                self._ids.setdefault(value.strip().lower(), []).append(index)
+        return np.array(self._ids.get(name, []), dtype=np.int64)
+
+    def match(self, tag: Optional[str], ids: List[str], classes: List[str]):
+        sets = [self.by_id(name) for name in ids] + [self.by_class(name) for name in classes]
+        if tag:
+            sets.append(self.by_tag(tag))
+        if not sets:
+            return np.arange(self.count, dtype=np.int64)
+        matched = sets[0]
+        for other in sets[1:]:
+            matched = np.intersect1d(matched, other, assume_unique=False)
+        return matched
+
+
+class _Candidates:
+    """Accumulates (element, cascade key, color) triples for one property."""
+
+    def __init__(self, palette: Dict[Tuple[int, int, int], int]):
+        self.palette = palette
+        self.elements: List[Any] = []
+        self.keys: List[Any] = []
+        self.colors: List[Any] = []
+
+    def add(self, elements, priority: int, order: int, color: Tuple[int, int, int]) -> None:
+        if len(elements) == 0:
+            return
+        elements = np.asarray(elements, dtype=np.int64)
+        color_id = self.palette.setdefault(color, len(self.palette))
+        self.elements.append(elements)
+        self.keys.append(np.full(len(elements), (priority << 32) + order, dtype=np.int64))
+        self.colors.append(np.full(len(elements), color_id, dtype=np.int64))
+
+    def add_each(self, elements: List[int], orders: List[int], priority: int,
+                 color: Tuple[int, int, int]) -> None:
+        if not elements:
+            return
+        color_id = self.palette.setdefault(color, len(self.palette))
+        self.elements.append(np.array(elements, dtype=np.int64))
+        self.keys.append((np.int64(priority) << 32) + np.array(orders, dtype=np.int64))
+        self.colors.append(np.full(len(elements), color_id, dtype=np.int64))
+
+    def merged(self, other: "_Candidates") -> "_Candidates":
+        combined = _Candidates(self.palette)
+        for name in ("elements", "keys", "colors"):
+            setattr(combined, name, getattr(self, name) + getattr(other, name))
+        return combined
+
+    def winners(self, size: int):
+        """Per element: whether any candidate applies, and the winning color id."""
+        has = np.zeros(size, dtype=bool)
+        color = np.zeros(size, dtype=np.int64)
+        if not self.elements:
+            return has, color
+        elements = np.concatenate(self.elements)
+        keys = np.concatenate(self.keys)
+        colors = np.concatenate(self.colors)
+        order = np.lexsort((keys, elements))
+        elements = elements[order]
+        last = np.ones(len(elements), dtype=bool)
+        last[:-1] = elements[1:] != elements[:-1]
+        has[elements[last]] = True
+        color[elements[last]] = colors[order][last]
+        return has, color
+
+
+def _nearest(has, parents):
+    """Index of the nearest ancestor-or-self with `has` set (pointer jumping)."""
+    nearest = np.where(has, np.arange(len(has)), parents)
+    while True:
+        jumped = nearest[nearest]
+        if (jumped == nearest).all():
+            return nearest
+        nearest = jumped
+
+
+def relative_luminance(rgb):
+    """WCAG relative luminance of an (n, 3) array of 0..1 sRGB colors."""
+    linear = np.where(rgb <= 0.03928, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    return linear @ np.array([0.2126, 0.7152, 0.0722])
+
+
+def invert_lightness(rgb, mask):
+    """Invert HLS lightness (keeping hue and saturation) of the rows selected by mask."""
+    shift = 1.0 - rgb.max(axis=1) - rgb.min(axis=1)
+    return np.where(mask[:, None], np.clip(rgb + shift[:, None], 0.0, 1.0), rgb)
+
+
+def _lightness(rgb):
+    return (rgb.max(axis=1) + rgb.min(axis=1)) / 2
+
+
+def is_dark_media(media: Optional[str]) -> bool:
+    """True for a media query that targets `prefers-color-scheme: dark`."""
+    return bool(media) and 'prefers-color-scheme' in media and 'dark' in media
+
+
+def _collect(css, elements: _ElementIndex, palette: Dict[Tuple[int, int, int], int],
+             props: Tuple[str, ...], parse) -> Tuple[_Candidates, Optional[_Candidates]]:
+    """
+    Candidates for a property group: (light, dark) where light holds inline
+    declarations, presentational attributes and rules outside @media, and
+    dark holds `prefers-color-scheme: dark` rules (None if there are none).
+    """
+    light = _Candidates(palette)
+    dark: Optional[_Candidates] = None
+    compiled: Dict[str, list] = {}
+    for prop in props:
+        for value, decls in css.values(prop).items():
+            color = parse(value)
+            if color is None:
+                continue
+            inline: Dict[int, Tuple[List[int], List[int]]] = {}  # priority -> (elements, orders)
+            for decl in decls:
+                if isinstance(decl.source, int):
+                    if decl.presentational:
+                        priority = _HINT_PRIORITY
+                    else:
+                        priority = _INLINE_IMPORTANT_PRIORITY if decl.important else _INLINE_PRIORITY
+                    owners, orders = inline.setdefault(priority, ([], []))
+                    owners.append(decl.source)
+                    orders.append(decl.order)
+                    continue
+                if decl.media is None:
+                    target, offset = light, 0
+                elif is_dark_media(decl.media):
+                    if dark is None:
+                        dark = _Candidates(palette)
+                    target, offset = dark, _DARK_OFFSET
+                else:
+                    continue
+                offset += _SELECTOR_PRIORITY + (_IMPORTANT_OFFSET if decl.important else 0)
+                selector = compiled.get(decl.source)
+                if selector is None:
+                    selector = compiled[decl.source] = compile_selector(decl.source)
+                for specificity, tag, ids, classes in selector:
+                    target.add(elements.match(tag, ids, classes), specificity + offset, decl.order, color)
+            for priority, (inline_elements, inline_orders) in inline.items():
+                light.add_each(inline_elements, inline_orders, priority, color)
+    return light, dark
+
+
+def _resolve(facts, css, elements: _ElementIndex):
+    """
+    Effective foreground and background palette ids for every element (plus a
+    virtual root) in light mode and, if the author has dark-mode color rules,
+    in dark mode; and the palette as an (n, 3) array of 0..1 colors.
+
+    Returns:
+        (light_fg, light_bg, dark_fg, dark_bg, palette); the dark ids are None
+        without author dark rules
+    """
+    size = elements.count + 1
+    root = elements.count
+    palette: Dict[Tuple[int, int, int], int] = {DEFAULT_FOREGROUND: 0, DEFAULT_BACKGROUND: 1}
+
+    parents = np.array(facts.element_parents + [root], dtype=np.int64)
+    parents[parents < 0] = root
+
+    foreground, dark_foreground = _collect(css, elements, palette, ("color",), parse_color)
+    foreground.add(elements.by_tag("a"), _UA_PRIORITY, 0, DEFAULT_LINK_COLOR)
+    background, dark_background = _collect(css, elements, palette, ("background-color", "background"),
+                                           _background_color)
+
+    def inherit(candidates: _Candidates, default_id: int):
+        has, color = candidates.winners(size)
+        has[root] = True
+        color[root] = default_id
+        return color[_nearest(has, parents)]
+
+    light = [inherit(foreground, 0), inherit(background, 1)]
+    dark = [None, None]
+    if dark_foreground is not None or dark_background is not None:
+        # Dark rules rank above every light candidate, so they merge into the light cascade
+        dark = [
+            inherit(candidates.merged(extra), default_id) if extra is not None else ids
+            for candidates, extra, default_id, ids in (
+                (foreground, dark_foreground, 0, light[0]),
+                (background, dark_background, 1, light[1]),
+            )
+        ]
+    colors = np.array(sorted(palette, key=palette.get), dtype=float) / 255.0
+    return light[0], light[1], dark[0], dark[1], colors
+
+
+def _shades(palette):
+    """Relative luminance and hex name of each palette color."""
+    names = ["#%02x%02x%02x" % tuple(rgb) for rgb in np.rint(palette * 255).astype(int).tolist()]
+    return relative_luminance(palette), names
+
+
+def _ratios(fg_ids, bg_ids, fg_luminance, bg_luminance):
+    fg = fg_luminance[fg_ids]
+    bg = bg_luminance[bg_ids]
+    return (np.maximum(fg, bg) + 0.05) / (np.minimum(fg, bg) + 0.05)
+
+
+def _summarize(ratios, fg_ids, bg_ids, fg_names: List[str], bg_names: List[str], text_ids: List[int],
+               facts, mask=None, limit: int = WORST_OFFENDERS) -> Dict[str, Any]:
+    failing = ratios < WCAG_AA
+    if mask is not None:
+        failing &= mask
+    candidates = np.flatnonzero(failing)
+    worst = candidates[np.argsort(ratios[candidates], kind="stable")[:limit]].tolist()
+    return {
+        "below_aa": len(candidates),
+        "min_ratio": round(float(ratios.min()), 2),
+        "worst": [
+            {
+                "element": facts.element_tags[text_ids[i]],
+                "text": " ".join(facts.element_text[text_ids[i]].split())[:60],
+                "foreground": fg_names[fg_ids[i]],
+                "background": bg_names[bg_ids[i]],
+                "ratio": round(float(ratios[i]), 2),
+            }
+            for i in worst
+        ],
+    }
+
+
+def analyze_contrast(facts, css, limit: int = WORST_OFFENDERS) -> Optional[Dict[str, Any]]:
+    """
+    Contrast of every text-bearing element in light mode and dark mode.
+
+    Args:
+        facts: DocumentFacts from html_parsers
+        css: The document's CssIndex
+
+    Returns:
+        None without NumPy, otherwise a dict with "text_elements" and, for
+        "light", "dark_inverted" and (with author dark rules) "dark_authored",
+        the count below WCAG AA, the minimum ratio and the worst offenders.
+        Dark-mode counts include only text that passes in light mode.
+    """
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:  # contrast analysis is skipped without NumPy
+            return None
+
+    text_ids = sorted(facts.element_text)
+    result: Dict[str, Any] = {"text_elements": len(text_ids)}
+    if not text_ids:
+        return result
+
+    elements = _ElementIndex(facts)
+    index = np.array(text_ids, dtype=np.int64)
+
+    fg_ids, bg_ids, dark_fg, dark_bg, palette = _resolve(facts, css, elements)
+    fg_ids, bg_ids = fg_ids[index], bg_ids[index]
+    luminance, names = _shades(palette)
+    light = _ratios(fg_ids, bg_ids, luminance, luminance)
+    passes_light = light >= WCAG_AA
+    result["light"] = _summarize(light, fg_ids, bg_ids, names, names, text_ids, facts, limit=limit)
+
+    # Inversion depends only on the color and its role, so it is applied to the palette
+    lightness = _lightness(palette)
+    fg_luminance, fg_names = _shades(invert_lightness(palette, lightness < 0.5))
+    bg_luminance, bg_names = _shades(invert_lightness(palette, lightness > 0.5))
+    inverted = _ratios(fg_ids, bg_ids, fg_luminance, bg_luminance)
+    result["dark_inverted"] = _summarize(inverted, fg_ids, bg_ids, fg_names, bg_names, text_ids, facts,
+                                         passes_light, limit)
+
+    if dark_fg is not None:
+        dark_fg, dark_bg = dark_fg[index], dark_bg[index]
+        authored = _ratios(dark_fg, dark_bg, luminance, luminance)
+        result["dark_authored"] = _summarize(authored, dark_fg, dark_bg, names, names,
+                                             text_ids, facts, passes_light, limit)
+
+    return result
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Corpus Statistics Sketches
+
+Bounded-memory statistics over millions of analyzed emails or subject lines,
+built from mergeable sketches instead of kept result dicts:
+
+    TDigest      score, size and length distributions (percentiles)
+    Counter      issue frequencies by check/severity, spam triggers, ...
+    HyperLogLog  distinct link domains
+
+Every sketch merges losslessly with another of its kind, so batch workers
+each build their own and the parent merges them at the end; saved stats
+files from separate runs merge the same way. Memory is fixed by the
+t-digest compression and HyperLogLog precision, not by corpus size.
+
+Usage:
+    python analyze_email_html.py templates/ --stats html-stats.json --workers 8
+    python score_subject_line.py --csv export.csv --output scored.csv --stats subject-stats.json
+    python corpus_stats.py html-stats.json other-run.json --output merged.json
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+STATS_VERSION = 1
+
+# t-digest compression; a digest keeps roughly half this many centroids
+COMPRESSION = 200
+
+# HyperLogLog registers = 2**precision; standard error is 1.04 / sqrt(2**precision)
+HLL_PRECISION = 14
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+# Entries shown per counter in summaries (counters themselves keep every key)
+TOP_N = 20
+
+# Templates analyzed per worker task
+FILES_PER_TASK = 256
+
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+
+class TDigest:
+    """
+    Merging t-digest (Dunning & Ertl) for streaming quantiles.
+
+    Values are buffered and periodically merged into centroids sized by the
+    arcsine scale function, which keeps the tails (p99, p1) accurate.
+    """
+
+    def __init__(self, compression: float = COMPRESSION):
+        self.compression = compression
+        self.means: List[float] = []
+        self.weights: List[float] = []
+        self.count = 0.0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer: List[float] = []
+
+    def add(self, value: float) -> None:
+        self._buffer.append(value)
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+
+    def add_many(self, values: Iterable[float]) -> None:
+        self._buffer.extend(values)
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+
+    def merge(self, other: "TDigest") -> None:
+        other._compress()
+        self._compress()
+        if not other.count:
+            return
+        self.means += other.means
+        self.weights += other.weights
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(force=True)
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _q(self, k: float) -> float:
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self, force: bool = False) -> None:
+        buffer = self._buffer
+        if not buffer and not force:
+            return
+        if buffer:
+            self.count += len(buffer)
+            self.total += math.fsum(buffer)
+            self.min = min(self.min, min(buffer))
+            self.max = max(self.max, max(buffer))
+        items = sorted(zip(self.means + buffer, self.weights + [1.0] * len(buffer)))
+        self._buffer = []
+        if not items:
+            return
+
+        means, weights = [], []
+        cur_mean, cur_weight = items[0]
+        done = 0.0
+        limit = self._q(self._k(0.0) + 1)
+        for mean, weight in items[1:]:
+            if (done + cur_weight + weight) / self.count <= limit:
+                cur_weight += weight
+                cur_mean += (mean - cur_mean) * weight / cur_weight
+            else:
+                means.append(cur_mean)
+                weights.append(cur_weight)
+                done += cur_weight
+                limit = self._q(self._k(done / self.count) + 1)
+                cur_mean, cur_weight = mean, weight
+        means.append(cur_mean)
+        weights.append(cur_weight)
+        self.means, self.weights = means, weights
+
+    def quantile(self, q: float) -> float:
+        """Estimated value at quantile q (0-1); NaN when empty."""
+        self._compress()
+        if not self.count:
+            return math.nan
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        target = q * self.count
+        means, weights = self.means, self.weights
+        if target < weights[0] / 2:
+            return self.min + (means[0] - self.min) * target / (weights[0] / 2)
+        cumulative = weights[0] / 2
+        for i in range(len(means) - 1):
+            step = (weights[i] + weights[i + 1]) / 2
+            if cumulative + step > target:
+                return means[i] + (means[i + 1] - means[i]) * (target - cumulative) / step
+            cumulative += step
+        tail = weights[-1] / 2
+        return means[-1] + (self.max - means[-1]) * min(1.0, (target - cumulative) / tail)
+
+    def to_dict(self) -> Dict[str, Any]:
+        self._compress()
+        return {
+            "compression": self.compression,
+            "count": self.count,
+            "total": self.total,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "means": self.means,
+            "weights": self.weights,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TDigest":
+        digest = cls(data["compression"])
+        digest.means = list(data["means"])
+        digest.weights = list(data["weights"])
+        digest.count = data["count"]
+        digest.total = data["total"]
+        if digest.count:
+            digest.min, digest.max = data["min"], data["max"]
+        return digest
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over 64-bit BLAKE2 hashes."""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item: str) -> None:
+        h = int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big")
+        bits = 64 - self.precision
+        index = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge HyperLogLog precisions {self.precision} and {other.precision}")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / math.fsum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "precision": self.precision,
+            "registers": base64.b64encode(zlib.compress(bytes(self.registers))).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HyperLogLog":
+        hll = cls(data["precision"])
+        hll.registers = bytearray(zlib.decompress(base64.b64decode(data["registers"])))
+        return hll
+
+
+class CorpusStats:
+    """Named t-digests, counters and HyperLogLogs over a corpus, created on first use."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.count = 0
+        self.digests: Dict[str, TDigest] = {}
+        self.counters: Dict[str, Counter] = {}
+        self.distinct: Dict[str, HyperLogLog] = {}
+
+    def digest(self, name: str) -> TDigest:
+        if name not in self.digests:
+            self.digests[name] = TDigest()
+        return self.digests[name]
+
+    def counter(self, name: str) -> Counter:
+        if name not in self.counters:
+            self.counters[name] = Counter()
+        return self.counters[name]
+
+    def hll(self, name: str) -> HyperLogLog:
+        if name not in self.distinct:
+            self.distinct[name] = HyperLogLog()
+        return self.distinct[name]
+
+    def merge(self, other: "CorpusStats") -> None:
+        if other.kind != self.kind:
+            raise ValueError(f"Cannot merge {other.kind} statistics into {self.kind} statistics")
+        self.count += other.count
+        for name, digest in other.digests.items():
+            self.digest(name).merge(digest)
+        for name, counter in other.counters.items():
+            self.counter(name).update(counter)
+        for name, hll in other.distinct.items():
+            self.hll(name).merge(hll)
+
+    def summary(self, quantiles: Tuple[float, ...] = QUANTILES, top: int = TOP_N) -> Dict[str, Any]:
+        """Percentiles per distribution, top counter entries and distinct estimates."""
+        distributions = {}
+        for name, digest in self.digests.items():
+            entry = {"count": int(digest.count)}
+            if digest.count:
+                entry.update({"min": digest.min, "max": digest.max,
+                              "mean": round(digest.total / digest.count, 2)})
+                entry.update({f"p{round(q * 100):g}": round(digest.quantile(q), 2) for q in quantiles})
+            distributions[name] = entry
+        return {
+            "kind": self.kind,
+            "count": self.count,
+            "distributions": distributions,
+            "counters": {name: dict(counter.most_common(top)) for name, counter in self.counters.items()},
+            "distinct": {name: hll.count() for name, hll in self.distinct.items()},
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": STATS_VERSION,
+            "kind": self.kind,
+            "count": self.count,
+            "digests": {name: digest.to_dict() for name, digest in self.digests.items()},
+            "counters": {name: dict(counter) for name, counter in self.counters.items()},
+            "distinct": {name: hll.to_dict() for name, hll in self.distinct.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CorpusStats":
+        if data.get("version") != STATS_VERSION:
+            raise ValueError(f"Unsupported statistics version {data.get('version')}")
+        stats = cls(data["kind"])
+        stats.count = data["count"]
+        stats.digests = {name: TDigest.from_dict(d) for name, d in data["digests"].items()}
+        stats.counters = {name: Counter(c) for name, c in data["counters"].items()}
+        stats.distinct = {name: HyperLogLog.from_dict(h) for name, h in data["distinct"].items()}
+        return stats
+
+
+def add_html_result(stats: CorpusStats, results: Dict[str, Any]) -> None:
+    """Fold one analyze_email_html.analyze_html result into `stats`."""
+    stats.count += 1
+    stats.digest("score").add(results["score"])
+    stats.digest("size_bytes").add(results["size_bytes"])
+    stats.digest("issue_count").add(len(results["issues"]))
+
+    issues = stats.counter("issues")
+    messages = stats.counter("messages")
+    for issue in results["issues"]:
+        issues[f"{issue['check']}/{issue['severity']}"] += 1
+        messages[_NUMBER_RE.sub("#", issue["message"])] += 1
+    stats.counter("documents_with_check").update({issue["check"] for issue in results["issues"]})
+
+    domains = stats.hll("link_domains")
+    for domain in results["links"].get("domains", ()):
+        domains.add(domain)
+
+
+def add_subject_result(stats: CorpusStats, result: Dict[str, Any]) -> None:
+    """Fold one score_subject_line.score_subject_line result into `stats`."""
+    stats.count += 1
+    stats.digest("score").add(result["score"])
+    stats.digest("char_count").add(result["char_count"])
+    stats.digest("word_count").add(result["word_count"])
+
+    breakdown = result["breakdown"]
+    stats.counter("spam_triggers").update(breakdown["spam_triggers"]["triggers_found"])
+    stats.counter("power_words").update(breakdown["power_words"]["words_found"])
+    stats.counter("formatting_issues").update(
+        _NUMBER_RE.sub("#", issue) for issue in breakdown["formatting"]["issues"]
+    )
+
+
+def add_subject_columns(stats: CorpusStats, columns: Dict[str, Any]) -> None:
+    """
+    Fold a subject_columns.score_subject_columns chunk into `stats`.
+
+    Columnar scoring has no per-subject breakdown, so only the
+    distributions are updated.
+    """
+    scores = columns["score"]
+    stats.count += len(scores)
+    for name in ("score", "char_count", "word_count"):
+        values = columns[name]
+        stats.digest(name).add_many(values.tolist() if hasattr(values, "tolist") else values)
+
+
+def _html_stats_for(paths: List[str]) -> Tuple[Dict[str, Any], List[Dict[str, str]]]:
+    """Worker task: analyze a shard of templates into its own sketch."""
+    from html_export import analyze_paths
+
+    stats = CorpusStats("html")
+    errors: List[Dict[str, str]] = []
+    for results in analyze_paths(paths, errors):
+        add_html_result(stats, results)
+    return stats.to_dict(), errors
+
+
+def collect_html_stats(paths: List[str], workers: Optional[int] = None) -> Tuple[CorpusStats, List[Dict[str, str]]]:
+    """
+    Analyze every template under `paths` into one merged CorpusStats.
+
+    Args:
+        paths: Files and/or directories
+        workers: Worker processes (default: CPU count; 1 analyzes in-process)
+
+    Returns:
+        (stats, read errors)
+    """
+    from html_baseline import iter_html_files
+
+    files = list(iter_html_files(paths))
+    shards = [files[i:i + FILES_PER_TASK] for i in range(0, len(files), FILES_PER_TASK)]
+    stats = CorpusStats("html")
+    errors: List[Dict[str, str]] = []
+
+    def merge_all(results) -> None:
+        for sketch, shard_errors in results:
+            stats.merge(CorpusStats.from_dict(sketch))
+            errors.extend(shard_errors)
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(shards) <= 1:
+        merge_all(map(_html_stats_for, shards))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            merge_all(executor.map(_html_stats_for, shards))
+    return stats, errors
+
+
+def load_stats(path: str) -> CorpusStats:
+    with open(path, "r", encoding="utf-8") as f:
+        return CorpusStats.from_dict(json.load(f)["sketches"])
+
+
+def save_stats(path: str, stats: CorpusStats) -> None:
+    """Write the summary (for dashboards) and the mergeable sketches."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"summary": stats.summary(), "sketches": stats.to_dict()}, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def format_human_readable(summary: Dict[str, Any]) -> str:
+    """Format a statistics summary."""
+    BOLD = "\033[1m"
+    RESET = "\033[0m"
+
+    output = [f"\n{BOLD}Corpus Statistics ({summary['kind']}): {summary['count']} analyzed{RESET}"]
+    for name, dist in summary["distributions"].items():
+        if not dist["count"]:
+            continue
+        percentiles = "  ".join(f"{key} {value:g}" for key, value in dist.items() if key.startswith("p"))
+        output.append(f"  {name:<14} mean {dist['mean']:g}  {percentiles}  (min {dist['min']:g}, max {dist['max']:g})")
+    for name, estimate in summary["distinct"].items():
+        output.append(f"  {name:<14} ~{estimate} distinct")
+    for name, counter in summary["counters"].items():
+        if not counter:
+            continue
+        output.append(f"\n{BOLD}{name}{RESET}")
+        for key, count in counter.items():
+            output.append(f"  {count:>8}  {key}")
+    return "\n".join(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge saved corpus statistics and print the combined summary"
+    )
+    parser.add_argument(
+        "files",
+        nargs="+",
+        help="Statistics files written with --stats"
+    )
+    parser.add_argument(
+        "--output", "-o",
+        help="Write the merged statistics here"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Output summary as JSON"
+    )
+
+    args = parser.parse_args()
+    try:
+        stats = load_stats(args.files[0])
+        for path in args.files[1:]:
+            stats.merge(load_stats(path))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.output:
+        save_stats(args.output, stats)
+    summary = stats.summary()
+    print(json.dumps(summary, indent=2) if args.json else format_human_readable(summary))
+
+
+if __name__ == "__main__":
+    main()
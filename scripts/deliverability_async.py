@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Async Deliverability Checks
+
+Asyncio counterparts of the checks in check_deliverability.py for embedding in
+services. All checks for all domains share one AsyncResolver, run on the
+caller's event loop without threads or subprocesses, and report progress as
+structured event dicts instead of printing.
+
+Usage (library):
+    async with AsyncResolver() as resolver:
+        report = await check_domain("example.com", resolver, timeout=10)
+
+Usage (CLI):
+    python deliverability_async.py example.com other.com --json
+    python deliverability_async.py example.com --adaptive-dkim --selector-stats stats.json
+    python deliverability_async.py example.com other.com --trace trace.json
+    python deliverability_async.py example.com other.com --smtp
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from typing import Any, Callable, Dict, List, Optional
+
+from check_deliverability import (
+    COMMON_DKIM_SELECTORS,
+    build_report,
+    dns_failure,
+    evaluate_dkim,
+    evaluate_dmarc,
+    evaluate_mx,
+    evaluate_spf,
+    format_human_readable,
+    is_dkim_record,
+    note_dns_failures,
+)
+from dkim_selectors import SelectorDiscovery, SelectorStats, load_selector_dictionary
+from dns_resolver import AsyncResolver, DnsError, DnsTimeout
+from dns_trace import DnsTracer, format_summary, traced
+from metrics import DOMAINS
+from smtp_probe import SmtpProber, probe_mx
+
+
+# Receives one event dict per progress step, e.g.
+# {"event": "check_finished", "domain": "example.com", "check": "spf", "result": {...}}
+EventCallback = Callable[[Dict[str, Any]], None]
+
+
+def _emit(on_event: Optional[EventCallback], event: str, domain: str, **fields) -> None:
+    if on_event is not None:
+        on_event({"event": event, "domain": domain, **fields})
+
+
+async def _lookup(resolver: AsyncResolver, name: str, rtype: str,
+                  on_event: Optional[EventCallback], domain: str, check: str,
+                  failures: List[Dict[str, str]]) -> List[str]:
+    """
+    Resolve a name. A failed lookup returns no records, but is appended to
+    `failures` and emitted as an event so it is not mistaken for an empty answer.
+    """
+    try:
+        with traced(domain, check):
+            return await resolver.lookup(name, rtype)
+    except DnsError as e:
+        failures.append(dns_failure(name, rtype, e))
+        _emit(on_event, "query_failed", domain, check=check, name=name, type=rtype, error=str(e),
+              timeout=isinstance(e, DnsTimeout))
+        return []
+
+
+async def check_spf(domain: str, resolver: AsyncResolver,
+                    on_event: Optional[EventCallback] = None) -> Dict[str, Any]:
+    """Check SPF record for domain."""
+    _emit(on_event, "check_started", domain, check="spf")
+    failures: List[Dict[str, str]] = []
+    records = await _lookup(resolver, domain, "TXT", on_event, domain, "spf", failures)
+    spf = note_dns_failures(evaluate_spf(records), failures)
+    _emit(on_event, "check_finished", domain, check="spf", result=spf)
+    return spf
+
+
+async def check_dkim(domain: str, resolver: AsyncResolver,
+                     on_event: Optional[EventCallback] = None,
+                     selectors: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Check DKIM records, probing all selectors concurrently."""
+    _emit(on_event, "check_started", domain, check="dkim")
+    selectors = selectors or COMMON_DKIM_SELECTORS
+    failures: List[Dict[str, str]] = []
+
+    answers = await asyncio.gather(*[
+        _lookup(resolver, f"{selector}._domainkey.{domain}", "TXT", on_event, domain, "dkim", failures)
+        for selector in selectors
+    ])
+
+    found_selectors = []
+    for selector, records in zip(selectors, answers):
+        if is_dkim_record(records):
+            found_selectors.append(selector)
+            _emit(on_event, "dkim_selector_found", domain, check="dkim", selector=selector)
+
+    dkim = note_dns_failures(evaluate_dkim(found_selectors), failures)
+    _emit(on_event, "check_finished", domain, check="dkim", result=dkim)
+    return dkim
+
+
+async def check_dmarc(domain: str, resolver: AsyncResolver,
+                      on_event: Optional[EventCallback] = None) -> Dict[str, Any]:
+    """Check DMARC record for domain."""
+    _emit(on_event, "check_started", domain, check="dmarc")
+    failures: List[Dict[str, str]] = []
+    records = await _lookup(resolver, f"_dmarc.{domain}", "TXT", on_event, domain, "dmarc", failures)
+    dmarc = note_dns_failures(evaluate_dmarc(records), failures)
+    _emit(on_event, "check_finished", domain, check="dmarc", result=dmarc)
+    return dmarc
+
+
+async def check_mx(domain: str, resolver: AsyncResolver,
+                   on_event: Optional[EventCallback] = None) -> Dict[str, Any]:
+    """Check MX records for domain."""
+    _emit(on_event, "check_started", domain, check="mx")
+    failures: List[Dict[str, str]] = []
+    mx = note_dns_failures(evaluate_mx(await _lookup(resolver, domain, "MX", on_event, domain, "mx", failures)), failures)
+    _emit(on_event, "check_finished", domain, check="mx", result=mx)
+    return mx
+
+
+async def check_mx_hosts(domain: str, resolver: AsyncResolver, prober: SmtpProber,
+                         on_event: Optional[EventCallback] = None) -> Dict[str, Any]:
+    """Check MX records, then probe every MX host over SMTP."""
+    mx = await check_mx(domain, resolver, on_event)
+    _emit(on_event, "check_started", domain, check="smtp")
+    await probe_mx(mx, prober)
+    _emit(on_event, "check_finished", domain, check="smtp", result=mx.get("smtp", []))
+    return mx
+
+
+async def check_domain(domain: str, resolver: Optional[AsyncResolver] = None,
+                       on_event: Optional[EventCallback] = None,
+                       timeout: Optional[float] = None,
+                       discovery: Optional[SelectorDiscovery] = None,
+                       prober: Optional[SmtpProber] = None) -> Dict[str, Any]:
+    """
+    Run all four checks concurrently and build the same report as the CLI.
+
+    Args:
+        domain: Domain to check
+        resolver: Shared resolver; a private one is created and closed if omitted
+        on_event: Optional progress callback
+        timeout: Overall deadline in seconds for the whole domain
+        discovery: Adaptive DKIM selector discovery; when given, DKIM runs after
+            SPF/MX so the detected providers can order and prune selectors
+        prober: SMTP prober; when given, every MX host is probed for
+            reachability and STARTTLS (results under mx["smtp"])
+
+    Raises:
+        asyncio.TimeoutError: the deadline passed before all checks finished
+    """
+    domain = domain.lower().strip()
+    owns_resolver = resolver is None
+    if owns_resolver:
+        resolver = AsyncResolver()
+
+    async def run() -> Dict[str, Any]:
+        if prober is None:
+            mx_check = check_mx(domain, resolver, on_event)
+        else:
+            mx_check = check_mx_hosts(domain, resolver, prober, on_event)
+        if discovery is None:
+            spf, dkim, dmarc, mx = await asyncio.gather(
+                check_spf(domain, resolver, on_event),
+                check_dkim(domain, resolver, on_event),
+                check_dmarc(domain, resolver, on_event),
+                mx_check,
+            )
+        else:
+            spf, dmarc, mx = await asyncio.gather(
+                check_spf(domain, resolver, on_event),
+                check_dmarc(domain, resolver, on_event),
+                mx_check,
+            )
+            _emit(on_event, "check_started", domain, check="dkim")
+            dkim = await discovery.check(domain, mx, spf, on_event)
+            _emit(on_event, "check_finished", domain, check="dkim", result=dkim)
+        DOMAINS.inc()
+        return build_report(domain, spf, dkim, dmarc, mx)
+
+    try:
+        report = await asyncio.wait_for(run(), timeout)
+    finally:
+        if owns_resolver:
+            resolver.close()
+
+    _emit(on_event, "domain_finished", domain, health_score=report["health_score"])
+    return report
+
+
+async def check_domains(domains: List[str], resolver: Optional[AsyncResolver] = None,
+                        on_event: Optional[EventCallback] = None,
+                        timeout: Optional[float] = None,
+                        discovery: Optional[SelectorDiscovery] = None,
+                        prober: Optional[SmtpProber] = None) -> List[Dict[str, Any]]:
+    """
+    Check many domains concurrently over one shared resolver (and, if given,
+    one shared SelectorDiscovery so selector statistics carry across domains,
+    and one SmtpProber so MX hosts shared by several domains are probed once).
+
+    A domain that misses its deadline yields {"domain": ..., "error": "timeout"}
+    instead of failing the whole batch.
+    """
+    owns_resolver = resolver is None
+    if owns_resolver:
+        resolver = AsyncResolver()
+
+    async def one(domain: str) -> Dict[str, Any]:
+        try:
+            return await check_domain(domain, resolver, on_event, timeout, discovery, prober)
+        except asyncio.TimeoutError:
+            _emit(on_event, "domain_timeout", domain, timeout=timeout)
+            return {"domain": domain, "error": "timeout"}
+
+    try:
+        return list(await asyncio.gather(*[one(domain) for domain in domains]))
+    finally:
+        if owns_resolver:
+            resolver.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check deliverability for one or more domains concurrently"
+    )
+    parser.add_argument(
+        "domains",
+        nargs="+",
+        help="Domains to check"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Output results as JSON"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=30.0,
+        help="Deadline in seconds per domain (default: 30)"
+    )
+    parser.add_argument(
+        "--events",
+        action="store_true",
+        help="Stream progress events as JSON lines on stderr"
+    )
+    parser.add_argument(
+        "--adaptive-dkim",
+        action="store_true",
+        help="Choose DKIM selectors from the providers detected in MX/SPF"
+    )
+    parser.add_argument(
+        "--selector-stats",
+        help="JSON file of selector hit statistics to load and update (implies --adaptive-dkim)"
+    )
+    parser.add_argument(
+        "--selector-dictionary",
+        help="Alternative selector dictionary JSON (default: dkim_selectors.json)"
+    )
+    parser.add_argument(
+        "--smtp",
+        action="store_true",
+        help="Probe every MX host for reachability, STARTTLS and certificate names"
+    )
+    parser.add_argument(
+        "--trace",
+        help="Write a JSON trace of every DNS query (spans plus slowest-query summary)"
+    )
+
+    args = parser.parse_args()
+    tracer = DnsTracer() if args.trace else None
+
+    def print_event(event: Dict[str, Any]) -> None:
+        print(json.dumps(event), file=sys.stderr)
+
+    async def run() -> List[Dict[str, Any]]:
+        # One-shot audit: answers can be cached for the length of the run
+        async with AsyncResolver(tracer=tracer, cache_size=4096) as resolver:
+            discovery = None
+            if args.adaptive_dkim or args.selector_stats or args.selector_dictionary:
+                discovery = SelectorDiscovery(
+                    resolver,
+                    dictionary=load_selector_dictionary(args.selector_dictionary),
+                    stats=SelectorStats.load(args.selector_stats) if args.selector_stats else None
+                )
+            reports = await check_domains(
+                args.domains,
+                resolver,
+                on_event=print_event if args.events else None,
+                timeout=args.timeout,
+                discovery=discovery,
+                prober=SmtpProber() if args.smtp else None
+            )
+            if discovery is not None and args.selector_stats:
+                discovery.stats.save(args.selector_stats)
+            return reports
+
+    reports = asyncio.run(run())
+    if tracer is not None:
+        tracer.save(args.trace)
+
+    if args.json:
+        print(json.dumps(reports if len(reports) > 1 else reports[0], indent=2))
+    else:
+        for report in reports:
+            if "error" in report:
+                print(f"\n{report['domain']}: {report['error']}")
+            else:
+                print(format_human_readable(report["domain"], report))
+        if tracer is not None:
+            print("\n" + format_summary(tracer.summary()))
+
+    # Exit code based on health score
+    if any(report.get("health_score", 0) < 60 for report in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
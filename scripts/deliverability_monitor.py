@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+Deliverability Monitor
+
+Long-running replacement for a daily cron of check_deliverability.py. The
+last-known SPF, DKIM, DMARC and MX state of every domain is kept (and
+persisted to a state file). Each record set is re-queried when its TTL
+expires, using a single priority queue for all domains, so nothing is
+queried before it can have changed. Only differences are reported: a DMARC
+policy downgrade, a new SPF include, a vanished DKIM selector, and so on,
+each with the recomputed health score.
+
+Failed (SERVFAIL, REFUSED) or timed-out queries never count as a change;
+the record set is retried later and the last-known state is kept. A
+re-check that fails in any other way is counted, reported and retried the
+same way, so one bad record set never stops the monitor. Domains that
+cannot be queried at all (empty or over-long labels, names IDNA cannot
+encode) are rejected when loaded.
+
+Usage:
+    python deliverability_monitor.py example.com other.com --state monitor.json
+    python deliverability_monitor.py --domains-file domains.txt --state monitor.json --json
+    python deliverability_monitor.py --domains-file domains.txt --state monitor.json --once
+    python deliverability_monitor.py --domains-file domains.txt --metrics-port 9108
+"""
+
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from check_deliverability import (
+    COMMON_DKIM_SELECTORS,
+    calculate_health_score,
+    evaluate_dkim,
+    evaluate_dmarc,
+    evaluate_mx,
+    evaluate_spf,
+    is_dkim_record,
+)
+from dns_resolver import RCODE_NOERROR, RCODE_NXDOMAIN, AsyncResolver, DnsAnswer, DnsError
+from metrics import start_http_server
+
+
+# Weakest to strongest; moving left is a downgrade
+DMARC_POLICY_ORDER = ["none", "quarantine", "reject"]
+SPF_ENFORCEMENT_ORDER = ["pass_all", "none", "neutral", "soft_fail", "hard_fail"]
+
+# Longest domain name in presentation form (RFC 1035)
+MAX_DOMAIN_LENGTH = 253
+
+# Scheduling bounds in seconds
+MIN_INTERVAL = 300
+MAX_INTERVAL = 86400
+NEGATIVE_INTERVAL = 3600    # empty answers carry no TTL of their own
+RETRY_INTERVAL = 300        # after a failed or timed-out query
+SCAN_INTERVAL = 86400       # full DKIM selector scan, to find new selectors
+SAVE_INTERVAL = 60
+
+_SPF_INCLUDE_RE = re.compile(r'\binclude:(\S+)')
+
+# (check, selector) - selector is only set for per-selector DKIM re-checks
+WorkItem = Tuple[str, Optional[str]]
+ChangeCallback = Callable[[Dict[str, Any]], None]
+ErrorCallback = Callable[[str, str, Optional[str], Exception], None]
+
+
+def domain_error(domain: str) -> Optional[str]:
+    """Why a domain cannot be queried, or None if it can."""
+    labels = domain.rstrip(".").split(".")
+    if not domain or any(not label for label in labels):
+        return "empty label"
+    try:
+        encoded = [label.encode("idna") for label in labels]
+    except UnicodeError as e:
+        return f"not encodable as IDNA: {e}"
+    if sum(len(label) + 1 for label in encoded) - 1 > MAX_DOMAIN_LENGTH:
+        return f"longer than {MAX_DOMAIN_LENGTH} characters"
+    return None
+
+
+def _change(check: str, change: str, severity: str, old: Any = None, new: Any = None) -> Dict[str, Any]:
+    return {"check": check, "change": change, "severity": severity, "old": old, "new": new}
+
+
+def diff_spf(old: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Describe SPF changes between two evaluate_spf results."""
+    if old["record"] == new["record"]:
+        return []
+    if not new["valid"]:
+        return [_change("spf", "spf_removed", "high", old["record"], None)]
+    if not old["valid"]:
+        return [_change("spf", "spf_added", "info", None, new["record"])]
+
+    changes = []
+    old_includes = _SPF_INCLUDE_RE.findall(old["record"])
+    new_includes = _SPF_INCLUDE_RE.findall(new["record"])
+    for include in new_includes:
+        if include not in old_includes:
+            changes.append(_change("spf", "spf_include_added", "medium", None, include))
+    for include in old_includes:
+        if include not in new_includes:
+            changes.append(_change("spf", "spf_include_removed", "low", include, None))
+
+    if old["enforcement"] != new["enforcement"]:
+        weaker = (SPF_ENFORCEMENT_ORDER.index(new["enforcement"]) <
+                  SPF_ENFORCEMENT_ORDER.index(old["enforcement"]))
+        changes.append(_change(
+            "spf", "spf_enforcement_weakened" if weaker else "spf_enforcement_strengthened",
+            "high" if weaker else "info", old["enforcement"], new["enforcement"]
+        ))
+    if new["lookup_count"] > 10 >= old["lookup_count"]:
+        changes.append(_change("spf", "spf_lookup_limit_exceeded", "high",
+                               old["lookup_count"], new["lookup_count"]))
+
+    return changes or [_change("spf", "spf_record_changed", "low", old["record"], new["record"])]
+
+
+def diff_dmarc(old: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Describe DMARC changes between two evaluate_dmarc results."""
+    if old["record"] == new["record"]:
+        return []
+    if not new["valid"]:
+        return [_change("dmarc", "dmarc_removed", "high", old["record"], None)]
+    if not old["valid"]:
+        return [_change("dmarc", "dmarc_added", "info", None, new["record"])]
+
+    changes = []
+    if old["policy"] != new["policy"]:
+        rank = {policy: i for i, policy in enumerate(DMARC_POLICY_ORDER)}
+        downgrade = rank.get(new["policy"], 0) < rank.get(old["policy"], 0)
+        changes.append(_change(
+            "dmarc", "dmarc_policy_downgraded" if downgrade else "dmarc_policy_upgraded",
+            "high" if downgrade else "info", old["policy"], new["policy"]
+        ))
+    for tag in ("rua", "ruf"):
+        if old[tag] != new[tag]:
+            severity = "medium" if old[tag] and not new[tag] else "low"
+            changes.append(_change("dmarc", f"dmarc_{tag}_changed", severity, old[tag], new[tag]))
+
+    return changes or [_change("dmarc", "dmarc_record_changed", "low", old["record"], new["record"])]
+
+
+def diff_mx(old: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Describe MX changes between two evaluate_mx results."""
+    if old["records"] == new["records"]:
+        return []
+    if not new["valid"]:
+        return [_change("mx", "mx_removed", "high", [r["host"] for r in old["records"]], None)]
+
+    changes = []
+    old_hosts = [record["host"] for record in old["records"]]
+    new_hosts = [record["host"] for record in new["records"]]
+    for host in new_hosts:
+        if host not in old_hosts:
+            changes.append(_change("mx", "mx_host_added", "medium", None, host))
+    for host in old_hosts:
+        if host not in new_hosts:
+            changes.append(_change("mx", "mx_host_removed", "medium", host, None))
+    if old["provider"] != new["provider"]:
+        changes.append(_change("mx", "mx_provider_changed", "medium", old["provider"], new["provider"]))
+
+    return changes or [_change("mx", "mx_priority_changed", "low", old["records"], new["records"])]
+
+
+def diff_dkim(old: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Describe DKIM selector changes between two evaluate_dkim results."""
+    changes = []
+    for selector in old["selectors"]:
+        if selector not in new["selectors"]:
+            changes.append(_change("dkim", "dkim_selector_vanished", "high", selector, None))
+    for selector in new["selectors"]:
+        if selector not in old["selectors"]:
+            changes.append(_change("dkim", "dkim_selector_added", "info", None, selector))
+    return changes
+
+
+DIFFS = {"spf": diff_spf, "dkim": diff_dkim, "dmarc": diff_dmarc, "mx": diff_mx}
+
+
+class DeliverabilityMonitor:
+    """
+    TTL-scheduled re-checks over many domains with change detection.
+
+    Args:
+        resolver: Shared AsyncResolver
+        domains: Domains to monitor
+        state: Previously saved state (see `state`); domains in it keep their
+            last-known records and due times
+        on_change: Called with one event dict per re-check that changed something
+        on_error: Called with (domain, check, selector, exception) when a
+            re-check fails other than by a DNS error; it is retried later
+        concurrency: Record sets re-checked at once
+        min_interval / max_interval: Bounds applied to record TTLs
+    """
+
+    def __init__(self, resolver: AsyncResolver, domains: List[str],
+                 state: Optional[Dict[str, Any]] = None,
+                 on_change: Optional[ChangeCallback] = None,
+                 on_error: Optional[ErrorCallback] = None,
+                 concurrency: int = 256,
+                 min_interval: int = MIN_INTERVAL, max_interval: int = MAX_INTERVAL,
+                 selectors: Optional[List[str]] = None):
+        self.resolver = resolver
+        self.on_change = on_change
+        self.on_error = on_error
+        self.concurrency = max(1, concurrency)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.selectors = selectors or COMMON_DKIM_SELECTORS
+        self.state: Dict[str, Any] = {}
+        self.queries = 0
+        self.failures = 0
+        self.errors = 0
+        self.rejected: Dict[str, str] = {}  # domain -> why it cannot be monitored
+        self._heap: List[Tuple[float, int, str, str, Optional[str]]] = []
+        self._seq = 0
+
+        saved = state or {}
+        now = time.time()
+        for domain in dict.fromkeys(d.lower().strip() for d in domains):
+            error = domain_error(domain)
+            if error is not None:
+                self.rejected[domain] = error
+                continue
+            domain_state = saved.get(domain) or {"checks": {}, "dkim_selectors": [], "due": {}}
+            self.state[domain] = domain_state
+            due = domain_state["due"]
+            for check in ("spf", "dmarc", "mx"):
+                self._schedule(domain, (check, None), due.get(check, now))
+            self._schedule(domain, ("dkim_scan", None), due.get("dkim_scan", now))
+            for selector in domain_state["dkim_selectors"]:
+                self._schedule(domain, ("dkim", selector), due.get(f"dkim:{selector}", now))
+
+    def _schedule(self, domain: str, item: WorkItem, when: float) -> None:
+        check, selector = item
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, domain, check, selector))
+        key = f"dkim:{selector}" if selector else check
+        self.state[domain]["due"][key] = when
+
+    def _interval(self, answer: Optional[DnsAnswer]) -> int:
+        ttl = answer.min_ttl if answer is not None else None
+        if ttl is None:
+            return NEGATIVE_INTERVAL
+        return max(self.min_interval, min(self.max_interval, ttl))
+
+    async def _query(self, name: str, rtype: str) -> Optional[DnsAnswer]:
+        """The answer, or None if the query failed (including SERVFAIL and REFUSED)."""
+        self.queries += 1
+        try:
+            answer = await self.resolver.query(name, rtype)
+        except DnsError:
+            self.failures += 1
+            return None
+        if answer.rcode not in (RCODE_NOERROR, RCODE_NXDOMAIN):
+            # An empty answer from a failing server is not a removed record
+            self.failures += 1
+            return None
+        return answer
+
+    async def _run_item(self, domain: str, check: str, selector: Optional[str]) -> None:
+        domain_state = self.state[domain]
+        checks = domain_state["checks"]
+        now = time.time()
+
+        if check == "dkim_scan":
+            answers = await asyncio.gather(*[
+                self._query(f"{candidate}._domainkey.{domain}", "TXT") for candidate in self.selectors
+            ])
+            found = [
+                candidate for candidate, answer in zip(self.selectors, answers)
+                if answer is not None and is_dkim_record([r.data for r in answer.records])
+            ]
+            # Only additions come from the scan; each known selector is
+            # re-checked on its own TTL, which is what reports it vanishing
+            known = domain_state["dkim_selectors"]
+            added = [candidate for candidate in found if candidate not in known]
+            for candidate in added:
+                known.append(candidate)
+                answer = answers[self.selectors.index(candidate)]
+                self._schedule(domain, ("dkim", candidate), now + self._interval(answer))
+            self._schedule(domain, ("dkim_scan", None), now + SCAN_INTERVAL)
+            if added or "dkim" not in checks:
+                self._update(domain, "dkim", evaluate_dkim(list(known)))
+            return
+
+        if check == "dkim":
+            answer = await self._query(f"{selector}._domainkey.{domain}", "TXT")
+            if answer is None:
+                self._schedule(domain, (check, selector), now + RETRY_INTERVAL)
+                return
+            if is_dkim_record([r.data for r in answer.records]):
+                self._schedule(domain, (check, selector), now + self._interval(answer))
+                return
+            domain_state["dkim_selectors"].remove(selector)
+            domain_state["due"].pop(f"dkim:{selector}", None)
+            self._update(domain, "dkim", evaluate_dkim(list(domain_state["dkim_selectors"])))
+            return
+
+        name, rtype, evaluate = {
+            "spf": (domain, "TXT", evaluate_spf),
+            "dmarc": (f"_dmarc.{domain}", "TXT", evaluate_dmarc),
+            "mx": (domain, "MX", evaluate_mx),
+        }[check]
+        answer = await self._query(name, rtype)
+        if answer is None:
+            self._schedule(domain, (check, None), now + RETRY_INTERVAL)
+            return
+        self._schedule(domain, (check, None), now + self._interval(answer))
+        self._update(domain, check, evaluate([r.data for r in answer.records]))
+
+    async def _run_guarded(self, domain: str, check: str, selector: Optional[str]) -> None:
+        """Run one re-check; on an unexpected failure, report it and retry later."""
+        key = f"dkim:{selector}" if selector else check
+        due = self.state[domain]["due"].get(key)
+        try:
+            await self._run_item(domain, check, selector)
+        except Exception as e:
+            self.errors += 1
+            if self.on_error is not None:
+                self.on_error(domain, check, selector, e)
+            # Unless the item got as far as rescheduling itself
+            if self.state[domain]["due"].get(key) == due:
+                self._schedule(domain, (check, selector), time.time() + RETRY_INTERVAL)
+
+    def _update(self, domain: str, check: str, result: Dict[str, Any]) -> None:
+        """Store a fresh result and emit its diff against the last-known one."""
+        domain_state = self.state[domain]
+        checks = domain_state["checks"]
+        previous = checks.get(check)
+        checks[check] = result
+
+        if len(checks) < 4:
+            return
+        health_score = calculate_health_score(checks["spf"], checks["dkim"], checks["dmarc"], checks["mx"])
+        previous_score = domain_state.get("health_score")
+        domain_state["health_score"] = health_score
+
+        if previous is None:
+            return  # first observation is the baseline
+        changes = DIFFS[check](previous, result)
+        if changes and self.on_change is not None:
+            self.on_change({
+                "domain": domain,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "health_score": health_score,
+                "previous_health_score": previous_score,
+                "changes": changes,
+            })
+
+    async def run(self, once: bool = False, duration: Optional[float] = None,
+                  state_path: Optional[str] = None) -> None:
+        """
+        Process the queue until stopped.
+
+        Args:
+            once: Only run re-checks that are already due, then return
+            duration: Stop after this many seconds
+            state_path: Save state here periodically and on return
+        """
+        started = time.time()
+        cutoff = started if once else None
+        last_save = started
+        running: set = set()
+
+        try:
+            while True:
+                now = time.time()
+                if duration is not None and now - started >= duration:
+                    break
+                while self._heap and self._heap[0][0] <= now and len(running) < self.concurrency:
+                    when, _, domain, check, selector = heapq.heappop(self._heap)
+                    if cutoff is not None and when > cutoff:
+                        heapq.heappush(self._heap, (when, 0, domain, check, selector))
+                        break
+                    running.add(asyncio.ensure_future(self._run_guarded(domain, check, selector)))
+
+                next_due = self._heap[0][0] if self._heap else None
+                if cutoff is not None and not running and (next_due is None or next_due > cutoff):
+                    break
+
+                wait = max(0.0, next_due - now) if next_due is not None else SAVE_INTERVAL
+                if duration is not None:
+                    wait = min(wait, max(0.0, started + duration - now))
+                if running:
+                    _, running = await asyncio.wait(
+                        running, timeout=wait, return_when=asyncio.FIRST_COMPLETED
+                    )
+                else:
+                    await asyncio.sleep(min(wait, SAVE_INTERVAL))
+
+                if state_path and time.time() - last_save >= SAVE_INTERVAL:
+                    save_state(state_path, self.state)
+                    last_save = time.time()
+        finally:
+            for task in running:
+                task.cancel()
+            if state_path:
+                save_state(state_path, self.state)
+
+
+def load_state(path: str) -> Dict[str, Any]:
+    """Load monitor state, starting empty if the file does not exist."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(path: str, state: Dict[str, Any]) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def format_change_event(event: Dict[str, Any]) -> str:
+    """Format a change event as one line per change with ANSI colors."""
+    RED = "\033[91m"
+    YELLOW = "\033[93m"
+    RESET = "\033[0m"
+    colors = {"high": RED, "medium": YELLOW}
+
+    score = f"health {event['previous_health_score']} -> {event['health_score']}"
+    lines = []
+    for change in event["changes"]:
+        color = colors.get(change["severity"], "")
+        lines.append(
+            f"{event['timestamp']} {event['domain']}: {color}[{change['severity'].upper()}]"
+            f"{RESET if color else ''} {change['change']} "
+            f"({change['old']} -> {change['new']}), {score}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Monitor deliverability DNS records and report changes"
+    )
+    parser.add_argument(
+        "domains",
+        nargs="*",
+        help="Domains to monitor"
+    )
+    parser.add_argument(
+        "--domains-file",
+        help="File with one domain per line"
+    )
+    parser.add_argument(
+        "--state",
+        help="State file for last-known records and due times"
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Re-check only what is due now, then exit (for cron)"
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        help="Stop after this many seconds"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=256,
+        help="Record sets re-checked at once (default: 256)"
+    )
+    parser.add_argument(
+        "--min-interval",
+        type=int,
+        default=MIN_INTERVAL,
+        help=f"Lower bound on re-check interval in seconds (default: {MIN_INTERVAL})"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Output change events as JSON lines"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve OpenMetrics at http://127.0.0.1:PORT/metrics"
+    )
+
+    args = parser.parse_args()
+
+    domains = list(args.domains)
+    if args.domains_file:
+        with open(args.domains_file, "r", encoding="utf-8") as f:
+            domains.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    if not domains:
+        parser.error("no domains given")
+
+    if args.metrics_port is not None:
+        start_http_server(args.metrics_port)
+
+    def print_event(event: Dict[str, Any]) -> None:
+        print(json.dumps(event) if args.json else format_change_event(event), flush=True)
+
+    def print_error(domain: str, check: str, selector: Optional[str], error: Exception) -> None:
+        item = f"dkim:{selector}" if selector else check
+        print(f"{domain} {item}: re-check failed ({type(error).__name__}: {error}); "
+              f"retrying in {RETRY_INTERVAL}s", file=sys.stderr, flush=True)
+
+    async def run() -> None:
+        async with AsyncResolver() as resolver:
+            monitor = DeliverabilityMonitor(
+                resolver, domains,
+                state=load_state(args.state) if args.state else None,
+                on_change=print_event,
+                on_error=print_error,
+                concurrency=args.concurrency,
+                min_interval=args.min_interval
+            )
+            for domain, error in monitor.rejected.items():
+                print(f"{domain}: not monitored ({error})", file=sys.stderr)
+            if not monitor.state:
+                sys.exit("no valid domains to monitor")
+            await monitor.run(once=args.once, duration=args.duration, state_path=args.state)
+            if monitor.errors:
+                print(f"{monitor.errors} re-checks failed and were rescheduled", file=sys.stderr)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+DKIM Selector Discovery
+
+Provider-aware replacement for probing a fixed selector list. The versioned
+dictionary in dkim_selectors.json maps mail providers to their MX hostname
+patterns, SPF include patterns and DKIM selectors. For each domain the
+providers detected from MX and SPF decide which selectors are probed first
+and which provider-specific selectors are pruned; probes run concurrently
+and stop early once enough selectors are found. Hit statistics are kept
+across a batch (and optionally persisted) so later domains probe the
+selectors that actually exist first.
+
+Usage (library):
+    discovery = SelectorDiscovery(resolver)
+    dkim = await discovery.check(domain, mx_results, spf_results)
+
+Usage (CLI):
+    python deliverability_async.py example.com --adaptive-dkim --selector-stats stats.json
+"""
+
+import asyncio
+import json
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from check_deliverability import dns_failure, evaluate_dkim, is_dkim_record, note_dns_failures
+from dns_resolver import AsyncResolver, DnsError
+from dns_trace import traced
+
+
+DEFAULT_DICTIONARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dkim_selectors.json")
+
+_SPF_TARGET_RE = re.compile(r'(?:include:|redirect=)(\S+)')
+
+
+def load_selector_dictionary(path: Optional[str] = None) -> Dict[str, Any]:
+    """Load a selector dictionary ({"version", "generic", "providers"})."""
+    with open(path or DEFAULT_DICTIONARY_PATH, "r", encoding="utf-8") as f:
+        dictionary = json.load(f)
+    for key in ("version", "generic", "providers"):
+        if key not in dictionary:
+            raise ValueError(f"Selector dictionary missing '{key}'")
+    return dictionary
+
+
+class SelectorStats:
+    """
+    Per-selector hit counters shared across a batch of domains.
+
+    The probe order uses a smoothed hit rate, (hits + 1) / (probes + 2), so
+    unseen selectors start at 0.5 and sink as they keep missing.
+    """
+
+    def __init__(self, counts: Optional[Dict[str, List[int]]] = None):
+        self.counts: Dict[str, List[int]] = counts or {}
+
+    def record(self, selector: str, hit: bool) -> None:
+        entry = self.counts.setdefault(selector, [0, 0])
+        entry[0] += int(hit)
+        entry[1] += 1
+
+    def rate(self, selector: str) -> float:
+        hits, probes = self.counts.get(selector, (0, 0))
+        return (hits + 1) / (probes + 2)
+
+    def hits(self, selector: str) -> int:
+        return self.counts.get(selector, (0, 0))[0]
+
+    @classmethod
+    def load(cls, path: str) -> "SelectorStats":
+        """Load counters from a JSON file, starting empty if it does not exist."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls({k: list(v) for k, v in json.load(f).items()})
+        except FileNotFoundError:
+            return cls()
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.counts, f)
+        os.replace(tmp_path, path)
+
+
+def detect_providers(dictionary: Dict[str, Any], mx_hosts: List[str],
+                     spf_record: Optional[str]) -> List[str]:
+    """Return providers whose MX or SPF include patterns match, in dictionary order."""
+    spf_targets = _SPF_TARGET_RE.findall(spf_record or "")
+    detected = []
+    for name, profile in dictionary["providers"].items():
+        if any(pattern in host for pattern in profile.get("mx", []) for host in mx_hosts) or \
+                any(pattern in target for pattern in profile.get("spf", []) for target in spf_targets):
+            detected.append(name)
+    return detected
+
+
+class SelectorDiscovery:
+    """
+    Adaptive DKIM selector prober.
+
+    Args:
+        resolver: Shared AsyncResolver
+        dictionary: Selector dictionary (defaults to dkim_selectors.json)
+        stats: Shared SelectorStats; a fresh one is created if omitted
+        concurrency: Probes in flight per domain
+        max_probes: Upper bound on selectors probed per domain
+        stop_after: Stop once this many selectors are found (0 = probe the whole plan)
+    """
+
+    def __init__(self, resolver: AsyncResolver, dictionary: Optional[Dict[str, Any]] = None,
+                 stats: Optional[SelectorStats] = None, concurrency: int = 8,
+                 max_probes: int = 30, stop_after: int = 2):
+        self.resolver = resolver
+        self.dictionary = dictionary or load_selector_dictionary()
+        self.stats = stats or SelectorStats()
+        self.concurrency = max(1, concurrency)
+        self.max_probes = max_probes
+        self.stop_after = stop_after
+
+    def plan(self, providers: List[str]) -> List[str]:
+        """Order and prune selectors to probe for a domain using the given providers."""
+        profiles = self.dictionary["providers"]
+        preferred: List[str] = []
+        for name in providers:
+            preferred.extend(profiles[name].get("selectors", []))
+
+        others = [
+            selector
+            for name, profile in profiles.items() if name not in providers
+            for selector in profile.get("selectors", [])
+        ]
+        if providers:
+            # Other providers' selectors only stay if they have hit before
+            others = [selector for selector in others if self.stats.hits(selector) > 0]
+
+        def by_rate(selectors: List[str]) -> List[str]:
+            unique = list(dict.fromkeys(selectors))
+            return sorted(unique, key=lambda s: -self.stats.rate(s))
+
+        ordered = by_rate(preferred) + by_rate(self.dictionary["generic"] + others)
+        return list(dict.fromkeys(ordered))[:self.max_probes]
+
+    async def _probe(self, domain: str, selector: str, failures: List[Dict[str, str]]) -> Optional[bool]:
+        """Return whether the selector has a DKIM key, or None if the lookup failed."""
+        name = f"{selector}._domainkey.{domain}"
+        try:
+            records = await self.resolver.lookup(name, "TXT")
+        except DnsError as e:
+            failures.append(dns_failure(name, "TXT", e))
+            return None
+        return is_dkim_record(records)
+
+    async def discover(self, domain: str, providers: List[str],
+                       on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Probe planned selectors with a sliding window of concurrent queries.
+
+        Returns:
+            Dict with found selectors (plan order), probe count, whether
+            the plan was probed exhaustively and any failed lookups
+        """
+        plan = self.plan(providers)
+        found = set()
+        failures: List[Dict[str, str]] = []
+        probed = 0
+        pending: Dict[asyncio.Task, str] = {}
+        queue = list(reversed(plan))
+        stopped_early = False
+
+        try:
+            while queue or pending:
+                while queue and len(pending) < self.concurrency:
+                    selector = queue.pop()
+                    pending[asyncio.ensure_future(self._probe(domain, selector, failures))] = selector
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    selector = pending.pop(task)
+                    hit = task.result()
+                    probed += 1
+                    if hit is None:
+                        continue  # unknown, so not a miss either
+                    self.stats.record(selector, hit)
+                    if hit:
+                        found.add(selector)
+                        if on_event is not None:
+                            on_event({"event": "dkim_selector_found", "domain": domain,
+                                      "check": "dkim", "selector": selector})
+                if self.stop_after and len(found) >= self.stop_after and (queue or pending):
+                    stopped_early = True
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+
+        return {
+            "selectors": [selector for selector in plan if selector in found],
+            "probes": probed,
+            "planned": len(plan),
+            "exhaustive": not stopped_early,
+            "dns_failures": failures,
+        }
+
+    async def check(self, domain: str, mx: Dict[str, Any], spf: Dict[str, Any],
+                    on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Run discovery using MX/SPF results and return a check_dkim-style dict.
+
+        Extra keys: providers, probes, planned, exhaustive, dictionary_version.
+        """
+        mx_hosts = [record["host"] for record in mx.get("records", [])]
+        providers = detect_providers(self.dictionary, mx_hosts, spf.get("record"))
+        with traced(domain, "dkim"):
+            discovery = await self.discover(domain, providers, on_event)
+
+        dkim = note_dns_failures(evaluate_dkim(discovery["selectors"]), discovery["dns_failures"])
+        dkim.update({
+            "providers": providers,
+            "probes": discovery["probes"],
+            "planned": discovery["planned"],
+            "exhaustive": discovery["exhaustive"],
+            "dictionary_version": self.dictionary["version"],
+        })
+        return dkim
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+DMARC Aggregate Report Ingester
+
+Streams DMARC aggregate (rua) reports - plain XML, gzip or zip, detected by
+content rather than extension - with incremental XML parsing, so a report is
+never held in memory as a whole. Each report is reduced to pass/fail message
+counts per header-from domain, source IP, disposition and DKIM/SPF alignment.
+Files are parsed in parallel worker processes and the aggregates are written
+to a compact SQLite store; re-ingesting a report (same org and report ID) is
+a no-op.
+
+Usage:
+    python dmarc_reports.py reports/ --store dmarc.db
+    python dmarc_reports.py reports/*.zip --store dmarc.db --workers 8
+    python dmarc_reports.py --store dmarc.db --domain example.com --json
+    python check_deliverability.py example.com --dmarc-store dmarc.db
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZIP_MAGIC = b"PK\x03\x04"
+
+# Failing sources listed per summary
+TOP_FAILING_SOURCES = 10
+
+# (header_from, source_ip, disposition, dkim_aligned, spf_aligned)
+RowKey = Tuple[str, str, str, int, int]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    org TEXT, report_id TEXT, domain TEXT, policy TEXT,
+    date_begin INTEGER, date_end INTEGER, source TEXT,
+    PRIMARY KEY (org, report_id)
+);
+CREATE TABLE IF NOT EXISTS rows (
+    org TEXT, report_id TEXT, header_from TEXT, source_ip TEXT,
+    disposition TEXT, dkim_aligned INTEGER, spf_aligned INTEGER, count INTEGER
+);
+CREATE INDEX IF NOT EXISTS rows_domain ON rows (header_from, source_ip);
+"""
+
+
+def _local(tag: str) -> str:
+    """Strip an XML namespace ('{urn:...}record' -> 'record')."""
+    return tag.rpartition("}")[2]
+
+
+def _text(elem: ET.Element, *path: str) -> str:
+    """Text of a descendant found by namespace-agnostic child names."""
+    for name in path:
+        for child in elem:
+            if _local(child.tag) == name:
+                elem = child
+                break
+        else:
+            return ""
+    return (elem.text or "").strip()
+
+
+def open_report_streams(path: str) -> Iterator[Tuple[str, IO[bytes]]]:
+    """
+    Yield (name, binary stream) for each XML report in a file.
+
+    Gzip and zip are detected from magic bytes; a zip may hold several reports.
+    """
+    with open(path, "rb") as f:
+        magic = f.read(4)
+
+    if magic.startswith(GZIP_MAGIC):
+        with gzip.open(path, "rb") as stream:
+            yield path, stream
+    elif magic == ZIP_MAGIC:
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                if not member.is_dir() and member.filename.lower().endswith(".xml"):
+                    with archive.open(member) as stream:
+                        yield f"{path}:{member.filename}", stream
+    else:
+        with open(path, "rb") as stream:
+            yield path, stream
+
+
+def parse_report(stream: IO[bytes]) -> Dict[str, Any]:
+    """
+    Incrementally parse one aggregate report.
+
+    Returns:
+        Dict with org, report_id, domain, policy, date_begin, date_end and
+        rows (Counter of RowKey -> message count)
+    """
+    report: Dict[str, Any] = {
+        "org": "", "report_id": "", "domain": "", "policy": "",
+        "date_begin": 0, "date_end": 0, "rows": Counter(),
+    }
+    root = None
+
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+
+        tag = _local(elem.tag)
+        if tag == "record":
+            try:
+                count = int(_text(elem, "row", "count") or 0)
+            except ValueError:
+                count = 0
+            key = (
+                _text(elem, "identifiers", "header_from").lower(),
+                _text(elem, "row", "source_ip"),
+                _text(elem, "row", "policy_evaluated", "disposition") or "none",
+                int(_text(elem, "row", "policy_evaluated", "dkim") == "pass"),
+                int(_text(elem, "row", "policy_evaluated", "spf") == "pass"),
+            )
+            report["rows"][key] += count
+            # Drop parsed records so memory stays flat on very large reports
+            root.clear()
+        elif tag == "report_metadata":
+            report["org"] = _text(elem, "org_name")
+            report["report_id"] = _text(elem, "report_id")
+            for field, name in (("date_begin", "begin"), ("date_end", "end")):
+                try:
+                    report[field] = int(_text(elem, "date_range", name) or 0)
+                except ValueError:
+                    pass
+        elif tag == "policy_published":
+            report["domain"] = _text(elem, "domain").lower()
+            report["policy"] = _text(elem, "p")
+
+    if not report["report_id"]:
+        raise ValueError("missing report_metadata/report_id")
+    return report
+
+
+def parse_file(path: str) -> List[Dict[str, Any]]:
+    """Parse every report in a file; failures are returned as {"source", "error"}."""
+    reports = []
+    try:
+        for name, stream in open_report_streams(path):
+            try:
+                report = parse_report(stream)
+            except (ET.ParseError, ValueError, EOFError, OSError) as e:
+                reports.append({"source": name, "error": str(e)})
+                continue
+            report["source"] = name
+            report["rows"] = list(report["rows"].items())
+            reports.append(report)
+    except (OSError, zipfile.BadZipFile) as e:
+        reports.append({"source": path, "error": str(e)})
+    return reports
+
+
+def iter_report_files(paths: List[str]) -> Iterator[str]:
+    """Expand directories into the files beneath them."""
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    yield os.path.join(dirpath, filename)
+        else:
+            yield path
+
+
+class ReportStore:
+    """
+    SQLite store of aggregated report rows.
+
+    Args:
+        path: Database file
+        create: Create the file and schema if missing; otherwise only an
+            existing store is opened (read-only if the file is write protected)
+
+    Raises:
+        FileNotFoundError: not create and the store does not exist
+    """
+
+    def __init__(self, path: str, create: bool = True):
+        if not create:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"DMARC report store not found: {path}")
+            # mode=rw never creates the file; unlike mode=ro it lets this
+            # connection remove the WAL files it opens when it closes
+            uri = f"file:{quote(os.path.abspath(path))}?mode=rw"
+            self._db = sqlite3.connect(uri, uri=True, timeout=30)
+            return
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self) -> "ReportStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._db.commit()
+        self._db.close()
+
+    def add(self, report: Dict[str, Any]) -> bool:
+        """Insert a parsed report; returns False if it was already stored."""
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO reports VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (report["org"], report["report_id"], report["domain"], report["policy"],
+             report["date_begin"], report["date_end"], report["source"])
+        )
+        if cursor.rowcount == 0:
+            return False
+        self._db.executemany(
+            "INSERT INTO rows VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(report["org"], report["report_id"], *key, count) for key, count in report["rows"]]
+        )
+        return True
+
+    def summarize(self, domain: Optional[str] = None,
+                  top: int = TOP_FAILING_SOURCES) -> Dict[str, Any]:
+        """
+        Aggregate stored rows, optionally for one header-from domain.
+
+        Returns:
+            Dict with message totals by alignment outcome, the DMARC pass rate
+            and the top failing source IPs
+        """
+        where, params = ("WHERE header_from = ?", (domain.lower(),)) if domain else ("", ())
+        totals = self._db.execute(
+            "SELECT COALESCE(SUM(count), 0),"
+            " COALESCE(SUM(CASE WHEN dkim_aligned AND spf_aligned THEN count END), 0),"
+            " COALESCE(SUM(CASE WHEN dkim_aligned AND NOT spf_aligned THEN count END), 0),"
+            " COALESCE(SUM(CASE WHEN spf_aligned AND NOT dkim_aligned THEN count END), 0),"
+            " COALESCE(SUM(CASE WHEN NOT dkim_aligned AND NOT spf_aligned THEN count END), 0),"
+            " COUNT(DISTINCT org || '/' || report_id)"
+            f" FROM rows {where}", params
+        ).fetchone()
+        messages, both, dkim_only, spf_only, failed, report_count = totals
+
+        failing = self._db.execute(
+            "SELECT source_ip, header_from, SUM(count) AS total,"
+            " GROUP_CONCAT(DISTINCT disposition)"
+            f" FROM rows {where}{' AND' if where else ' WHERE'} NOT dkim_aligned AND NOT spf_aligned"
+            " GROUP BY source_ip, header_from ORDER BY total DESC LIMIT ?",
+            params + (top,)
+        ).fetchall()
+
+        dates = self._db.execute(
+            "SELECT MIN(date_begin), MAX(date_end) FROM reports"
+            + (" WHERE domain = ?" if domain else ""), params
+        ).fetchone()
+
+        return {
+            "domain": domain,
+            "reports": report_count,
+            "messages": messages,
+            "aligned_both": both,
+            "aligned_dkim_only": dkim_only,
+            "aligned_spf_only": spf_only,
+            "failed": failed,
+            "pass_rate": round((messages - failed) / messages * 100, 1) if messages else None,
+            "date_begin": dates[0],
+            "date_end": dates[1],
+            "top_failing_sources": [
+                {"source_ip": ip, "header_from": header_from, "messages": total,
+                 "dispositions": (dispositions or "").split(",")}
+                for ip, header_from, total, dispositions in failing
+            ],
+        }
+
+
+def ingest(paths: List[str], store_path: str, workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Parse report files in parallel and add them to the store.
+
+    Args:
+        paths: Files and/or directories of reports
+        store_path: SQLite store path
+        workers: Worker processes (default: CPU count; 1 parses in-process)
+
+    Returns:
+        Dict with counts of files, new and duplicate reports, messages and errors
+    """
+    files = list(iter_report_files(paths))
+    stats: Dict[str, Any] = {"files": len(files), "reports": 0, "duplicates": 0,
+                             "messages": 0, "errors": []}
+
+    with ReportStore(store_path) as store:
+        def add_all(parsed_files) -> None:
+            for reports in parsed_files:
+                for report in reports:
+                    if "error" in report:
+                        stats["errors"].append(report)
+                    elif store.add(report):
+                        stats["reports"] += 1
+                        stats["messages"] += sum(count for _, count in report["rows"])
+                    else:
+                        stats["duplicates"] += 1
+
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1 or len(files) <= 1:
+            add_all(map(parse_file, files))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                add_all(executor.map(parse_file, files, chunksize=8))
+
+    return stats
+
+
+def summarize(store_path: str, domain: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Open an existing store and summarize it.
+
+    Raises:
+        FileNotFoundError: the store does not exist
+    """
+    with ReportStore(store_path, create=False) as store:
+        return store.summarize(domain)
+
+
+def format_human_readable(summary: Dict[str, Any]) -> str:
+    """Format a store summary with ANSI colors."""
+    GREEN = "\033[92m"
+    YELLOW = "\033[93m"
+    RED = "\033[91m"
+    BOLD = "\033[1m"
+    RESET = "\033[0m"
+
+    output = []
+    output.append(f"\n{BOLD}DMARC Aggregate Reports: {summary['domain'] or 'all domains'}{RESET}")
+    output.append(f"Reports: {summary['reports']}  Messages: {summary['messages']}")
+    if summary["pass_rate"] is None:
+        output.append("No report data")
+        return "\n".join(output)
+
+    rate = summary["pass_rate"]
+    color = GREEN if rate >= 98 else YELLOW if rate >= 90 else RED
+    output.append(f"\n{BOLD}DMARC Pass Rate: {color}{rate}%{RESET}")
+    output.append(f"  DKIM + SPF aligned: {summary['aligned_both']}")
+    output.append(f"  DKIM aligned only:  {summary['aligned_dkim_only']}")
+    output.append(f"  SPF aligned only:   {summary['aligned_spf_only']}")
+    output.append(f"  Not aligned:        {summary['failed']}")
+
+    if summary["top_failing_sources"]:
+        output.append(f"\n{BOLD}Top Failing Sources:{RESET}")
+        for source in summary["top_failing_sources"]:
+            output.append(
+                f"  {RED}✗{RESET} {source['source_ip']} ({source['header_from']}): "
+                f"{source['messages']} messages, {'/'.join(source['dispositions'])}"
+            )
+    return "\n".join(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ingest DMARC aggregate reports and summarize alignment"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="Report files (.xml, .gz, .zip) or directories to ingest"
+    )
+    parser.add_argument(
+        "--store",
+        default="dmarc_reports.db",
+        help="SQLite store path (default: dmarc_reports.db)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Parallel parser processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--domain",
+        help="Summarize one header-from domain"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Output results as JSON"
+    )
+
+    args = parser.parse_args()
+
+    result: Dict[str, Any] = {}
+    if args.paths:
+        result["ingest"] = ingest(args.paths, args.store, args.workers)
+    try:
+        result["summary"] = summarize(args.store, args.domain)
+    except FileNotFoundError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        if "ingest" in result:
+            stats = result["ingest"]
+            print(f"Ingested {stats['reports']} reports ({stats['messages']} messages) "
+                  f"from {stats['files']} files, {stats['duplicates']} duplicates skipped")
+            for error in stats["errors"]:
+                print(f"  ERROR: {error['source']}: {error['error']}", file=sys.stderr)
+        print(format_human_readable(result["summary"]))
+
+    if result.get("ingest", {}).get("errors"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
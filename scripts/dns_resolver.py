@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Async DNS Resolver
+
+Minimal stub resolver built on asyncio and the standard library only. One
+AsyncResolver instance keeps a single UDP socket per nameserver and
+multiplexes every in-flight query over it by message ID, so many concurrent
+checks can share one event loop without threads or `dig` subprocesses.
+Truncated answers are retried over TCP. With a DnsTracer attached every
+query is recorded as a span (see dns_trace.py), and an optional TTL-bounded
+answer cache serves repeated questions within one audit.
+
+Usage:
+    async with AsyncResolver() as resolver:
+        records = await resolver.lookup("example.com", "TXT")
+        answer = await resolver.query("example.com", "MX")
+"""
+
+import asyncio
+import ipaddress
+import random
+import struct
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from dns_trace import DnsTracer
+from metrics import DNS_QUERY_DURATION, DNS_TIMEOUTS
+
+
+RECORD_TYPES = {
+    "A": 1,
+    "NS": 2,
+    "CNAME": 5,
+    "PTR": 12,
+    "MX": 15,
+    "TXT": 16,
+    "AAAA": 28,
+}
+RECORD_TYPE_NAMES = {value: name for name, value in RECORD_TYPES.items()}
+
+RCODE_NOERROR = 0
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+RCODE_REFUSED = 5
+RCODE_NAMES = {0: "NOERROR", 1: "FORMERR", 2: "SERVFAIL", 3: "NXDOMAIN", 4: "NOTIMP", 5: "REFUSED"}
+
+# Cache lifetime for NXDOMAIN and empty answers (the SOA minimum is not parsed)
+NEGATIVE_CACHE_TTL = 60
+
+# Used when /etc/resolv.conf is missing or lists no nameservers (e.g. Windows)
+FALLBACK_NAMESERVERS = ["1.1.1.1", "8.8.8.8"]
+
+# Advertised EDNS0 UDP payload size (DNS flag day 2020 recommendation)
+EDNS_PAYLOAD_SIZE = 1232
+
+
+class DnsError(Exception):
+    """Raised when a DNS response cannot be obtained or parsed."""
+
+
+class DnsTimeout(DnsError):
+    """Raised when every attempt for a query timed out."""
+
+
+class DnsRecord(NamedTuple):
+    """A single answer record; `data` is rendered like `dig +short`."""
+    name: str
+    rtype: str
+    ttl: int
+    data: str
+
+
+class DnsAnswer(NamedTuple):
+    """Parsed response for one query."""
+    name: str
+    rtype: str
+    rcode: int
+    records: List[DnsRecord]
+    nameserver: str
+
+    @property
+    def min_ttl(self) -> Optional[int]:
+        """Smallest TTL among the answer records, or None if empty."""
+        return min((r.ttl for r in self.records), default=None)
+
+
+def answer_outcome(rcode: int, records: List[DnsRecord]) -> str:
+    """Classify a response: answer, empty (NODATA), nxdomain, servfail, refused, ..."""
+    if rcode == RCODE_NOERROR:
+        return "answer" if records else "empty"
+    return RCODE_NAMES.get(rcode, f"rcode{rcode}").lower()
+
+
+def system_nameservers(path: str = "/etc/resolv.conf") -> List[str]:
+    """Read nameserver addresses from resolv.conf, falling back to public resolvers."""
+    servers = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver":
+                    servers.append(parts[1])
+    except OSError:
+        pass
+    return servers or list(FALLBACK_NAMESERVERS)
+
+
+def encode_query(query_id: int, name: str, rtype: str) -> bytes:
+    """Build a recursive DNS query message with an EDNS0 OPT record."""
+    header = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 1)
+    return header + _encode_question(name, rtype) + struct.pack(
+        "!BHHIH", 0, 41, EDNS_PAYLOAD_SIZE, 0, 0
+    )
+
+
+def _encode_question(name: str, rtype: str) -> bytes:
+    qname = b""
+    for label in name.rstrip(".").split("."):
+        if label:
+            encoded = label.encode("idna")
+            qname += bytes([len(encoded)]) + encoded
+    return qname + b"\x00" + struct.pack("!HH", RECORD_TYPES[rtype], 1)
+
+
+def _read_name(message: bytes, offset: int) -> Tuple[str, int]:
+    """Read a possibly-compressed domain name; return (name, offset after it)."""
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        if offset >= len(message):
+            raise DnsError("Truncated name in DNS response")
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | message[offset + 1]
+            jumps += 1
+            if jumps > 64:
+                raise DnsError("Compression loop in DNS response")
+            continue
+        if length == 0:
+            offset += 1
+            break
+        labels.append(message[offset + 1:offset + 1 + length].decode("ascii", "replace"))
+        offset += 1 + length
+    return ".".join(labels), (end if end is not None else offset)
+
+
+def _render_rdata(message: bytes, rtype: int, start: int, length: int) -> str:
+    rdata = message[start:start + length]
+    if rtype == 16:  # TXT: concatenate the character-strings
+        parts = []
+        pos = 0
+        while pos < len(rdata):
+            size = rdata[pos]
+            parts.append(rdata[pos + 1:pos + 1 + size].decode("utf-8", "replace"))
+            pos += 1 + size
+        return "".join(parts)
+    if rtype == 15:  # MX
+        preference = struct.unpack("!H", rdata[:2])[0]
+        host, _ = _read_name(message, start + 2)
+        return f"{preference} {host}."
+    if rtype in (2, 5, 12):  # NS, CNAME, PTR
+        host, _ = _read_name(message, start)
+        return f"{host}."
+    if rtype == 1 and length == 4:
+        return str(ipaddress.IPv4Address(rdata))
+    if rtype == 28 and length == 16:
+        return str(ipaddress.IPv6Address(rdata))
+    return rdata.hex()
+
+
+def decode_response(message: bytes) -> Tuple[int, int, bool, List[DnsRecord]]:
+    """Parse a response into (id, rcode, truncated, answer records)."""
+    if len(message) < 12:
+        raise DnsError("Short DNS response")
+    query_id, flags, qdcount, ancount, _, _ = struct.unpack("!HHHHHH", message[:12])
+    rcode = flags & 0x000F
+    truncated = bool(flags & 0x0200)
+
+    offset = 12
+    for _ in range(qdcount):
+        _, offset = _read_name(message, offset)
+        offset += 4
+
+    records = []
+    for _ in range(ancount):
+        name, offset = _read_name(message, offset)
+        if offset + 10 > len(message):
+            raise DnsError("Truncated record in DNS response")
+        rtype, _, ttl, rdlength = struct.unpack("!HHIH", message[offset:offset + 10])
+        offset += 10
+        if rtype in RECORD_TYPE_NAMES:
+            records.append(DnsRecord(
+                name=name,
+                rtype=RECORD_TYPE_NAMES[rtype],
+                ttl=ttl,
+                data=_render_rdata(message, rtype, offset, rdlength)
+            ))
+        offset += rdlength
+
+    return query_id, rcode, truncated, records
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    """Routes datagrams from one nameserver to the waiting query futures."""
+
+    def __init__(self, pending: Dict[int, asyncio.Future]):
+        self.pending = pending
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if len(data) < 2:
+            return
+        future = self.pending.get(struct.unpack("!H", data[:2])[0])
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    def error_received(self, exc: Exception) -> None:
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(DnsError(str(exc)))
+
+
+class AsyncResolver:
+    """
+    Shared asyncio stub resolver.
+
+    Args:
+        nameservers: Resolver addresses (defaults to resolv.conf)
+        timeout: Seconds to wait for each attempt
+        attempts: Attempts per query, rotating across nameservers
+        max_concurrency: Upper bound on simultaneous in-flight queries
+        port: Nameserver port (non-default only for local stand-in servers)
+        tracer: Records a span per query when given
+        cache_size: Answers kept until their TTL expires (0 disables the cache;
+            long-running monitors that schedule by TTL should leave it off)
+    """
+
+    def __init__(self, nameservers: Optional[List[str]] = None, timeout: float = 3.0,
+                 attempts: int = 2, max_concurrency: int = 64, port: int = 53,
+                 tracer: Optional[DnsTracer] = None, cache_size: int = 0):
+        self.nameservers = nameservers or system_nameservers()
+        self.port = port
+        self.timeout = timeout
+        self.attempts = max(1, attempts)
+        self.tracer = tracer
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, DnsAnswer]]" = OrderedDict()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._transports: Dict[str, asyncio.DatagramTransport] = {}
+        self._pending: Dict[str, Dict[int, asyncio.Future]] = {}
+        self._lock = asyncio.Lock()
+        self._closed = False
+
+    async def __aenter__(self) -> "AsyncResolver":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close sockets and fail any queries still waiting."""
+        self._closed = True
+        for transport in self._transports.values():
+            transport.close()
+        for pending in self._pending.values():
+            for future in pending.values():
+                if not future.done():
+                    future.cancel()
+        self._transports.clear()
+        self._pending.clear()
+
+    async def _transport(self, nameserver: str) -> asyncio.DatagramTransport:
+        if self._closed:
+            raise DnsError("Resolver is closed")
+        transport = self._transports.get(nameserver)
+        if transport is not None and not transport.is_closing():
+            return transport
+        async with self._lock:
+            transport = self._transports.get(nameserver)
+            if transport is None or transport.is_closing():
+                pending = self._pending.setdefault(nameserver, {})
+                transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                    lambda: _UdpProtocol(pending), remote_addr=(nameserver, self.port)
+                )
+                self._transports[nameserver] = transport
+        return transport
+
+    async def _query_udp(self, nameserver: str, name: str, rtype: str) -> bytes:
+        transport = await self._transport(nameserver)
+        pending = self._pending[nameserver]
+        query_id = random.getrandbits(16)
+        while query_id in pending:
+            query_id = random.getrandbits(16)
+
+        future = asyncio.get_running_loop().create_future()
+        pending[query_id] = future
+        try:
+            transport.sendto(encode_query(query_id, name, rtype))
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            pending.pop(query_id, None)
+
+    async def _query_tcp(self, nameserver: str, name: str, rtype: str) -> bytes:
+        query = encode_query(random.getrandbits(16), name, rtype)
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(nameserver, self.port), self.timeout
+        )
+        try:
+            writer.write(struct.pack("!H", len(query)) + query)
+            await writer.drain()
+            size = struct.unpack("!H", await asyncio.wait_for(reader.readexactly(2), self.timeout))[0]
+            return await asyncio.wait_for(reader.readexactly(size), self.timeout)
+        finally:
+            writer.close()
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[DnsAnswer]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires, answer = entry
+        if expires <= time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return answer
+
+    def _remember(self, key: Tuple[str, str], answer: DnsAnswer) -> None:
+        if answer.rcode not in (RCODE_NOERROR, RCODE_NXDOMAIN):
+            return
+        ttl = answer.min_ttl if answer.records else NEGATIVE_CACHE_TTL
+        if ttl <= 0:
+            return
+        self._cache[key] = (time.monotonic() + ttl, answer)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def query(self, name: str, rtype: str = "TXT") -> DnsAnswer:
+        """
+        Resolve one name/type pair.
+
+        Raises:
+            DnsTimeout: every attempt timed out
+            DnsError: the response could not be obtained or parsed
+        """
+        rtype = rtype.upper()
+        if rtype not in RECORD_TYPES:
+            raise ValueError(f"Unsupported record type: {rtype}")
+        name = name.rstrip(".").lower()
+        tracer = self.tracer
+
+        cache = "off"
+        if self.cache_size:
+            answer = self._cached((name, rtype))
+            if answer is not None:
+                if tracer is not None:
+                    tracer.record(name, rtype, answer_outcome(answer.rcode, answer.records), time.perf_counter(),
+                                  [], answer.nameserver, RCODE_NAMES.get(answer.rcode), len(answer.records), "hit")
+                return answer
+            cache = "miss"
+
+        last_error: Optional[Exception] = None
+        attempts: List[Dict[str, object]] = []
+        nameserver = None
+        queued = time.perf_counter()
+        async with self._semaphore:
+            start = time.perf_counter()
+            for attempt in range(self.attempts):
+                nameserver = self.nameservers[attempt % len(self.nameservers)]
+                sent = time.perf_counter()
+                transport = "udp"
+                try:
+                    message = await self._query_udp(nameserver, name, rtype)
+                    _, rcode, truncated, records = decode_response(message)
+                    if truncated:
+                        transport = "tcp"
+                        message = await self._query_tcp(nameserver, name, rtype)
+                        _, rcode, _, records = decode_response(message)
+                except asyncio.TimeoutError:
+                    DNS_TIMEOUTS.labels(rtype).inc()
+                    attempts.append(_attempt(nameserver, transport, "timeout", sent))
+                    last_error = DnsTimeout(f"{rtype} {name} timed out via {nameserver}")
+                    continue
+                except (OSError, DnsError) as e:
+                    attempts.append(_attempt(nameserver, transport, "error", sent))
+                    last_error = e if isinstance(e, DnsError) else DnsError(str(e))
+                    continue
+                records = [r for r in records if r.rtype == rtype]
+                outcome = answer_outcome(rcode, records)
+                attempts.append(_attempt(nameserver, transport, outcome, sent))
+                if rcode == RCODE_SERVFAIL and attempt + 1 < self.attempts:
+                    continue
+                DNS_QUERY_DURATION.labels(rtype).observe(time.perf_counter() - start)
+                answer = DnsAnswer(name, rtype, rcode, records, nameserver)
+                if tracer is not None:
+                    tracer.record(name, rtype, outcome, start, attempts, nameserver,
+                                  RCODE_NAMES.get(rcode, str(rcode)), len(records), cache, queued)
+                if self.cache_size:
+                    self._remember((name, rtype), answer)
+                return answer
+
+        error = last_error or DnsError(f"{rtype} {name} failed")
+        if tracer is not None:
+            tracer.record(name, rtype, "timeout" if isinstance(error, DnsTimeout) else "error",
+                          start, attempts, nameserver, cache=cache, queued=queued)
+        raise error
+
+    async def lookup(self, name: str, rtype: str = "TXT") -> List[str]:
+        """
+        Resolve and return record data only, like `dig +short`.
+
+        Raises:
+            DnsError: as query(), and also for SERVFAIL/REFUSED responses, so
+                a failed lookup is never mistaken for an empty one
+        """
+        answer = await self.query(name, rtype)
+        if answer.rcode not in (RCODE_NOERROR, RCODE_NXDOMAIN):
+            raise DnsError(f"{rtype} {name}: {RCODE_NAMES.get(answer.rcode, answer.rcode)} from {answer.nameserver}")
+        return [record.data for record in answer.records]
+
+
+def _attempt(nameserver: str, transport: str, outcome: str, sent: float) -> Dict[str, object]:
+    return {
+        "nameserver": nameserver,
+        "transport": transport,
+        "outcome": outcome,
+        "latency_ms": round((time.perf_counter() - sent) * 1000, 3),
+    }
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+DNS Query Tracing
+
+Structured spans for every DNS query made during a deliverability audit, so
+a slow audit shows which lookup stalled and a timeout is never mistaken for
+a missing record. AsyncResolver (and the `dig` path of
+check_deliverability.py) record one span per query into a DnsTracer; the
+domain and check a query belongs to come from the `traced()` context, which
+follows asyncio tasks.
+
+Span fields:
+    domain, check     what the query was for (None outside a traced() block)
+    name, type        the question
+    nameserver        server that produced the outcome ("dig" for dig)
+    outcome           answer | empty | nxdomain | servfail | refused | timeout | error
+    rcode, answers    response code name and answer count (None without a response)
+    cache             hit | miss | off
+    attempts          per-attempt nameserver, transport, outcome and latency
+    retries           attempts beyond the first
+    start_ms          offset from tracer creation
+    queue_ms          wait for a concurrency slot
+    latency_ms        time from first attempt to outcome
+
+Usage:
+    python deliverability_async.py example.com --trace trace.json
+    python check_deliverability.py example.com --trace trace.json
+"""
+
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+SLOWEST_QUERIES = 10
+
+# Outcomes that mean the record's state is unknown rather than absent
+FAILED_OUTCOMES = ("timeout", "error", "servfail", "refused")
+
+_CONTEXT: ContextVar[Tuple[Optional[str], Optional[str]]] = ContextVar("dns_trace_context", default=(None, None))
+
+
+@contextmanager
+def traced(domain: str, check: str) -> Iterator[None]:
+    """Attribute queries made inside the block (and tasks it starts) to domain/check."""
+    token = _CONTEXT.set((domain, check))
+    try:
+        yield
+    finally:
+        _CONTEXT.reset(token)
+
+
+class DnsTracer:
+    """Collects query spans and summarizes them."""
+
+    def __init__(self):
+        self.spans: List[Dict[str, Any]] = []
+        self._origin = time.perf_counter()
+
+    def offset_ms(self, when: float) -> float:
+        return round((when - self._origin) * 1000, 3)
+
+    def record(self, name: str, rtype: str, outcome: str, started: float,
+               attempts: List[Dict[str, Any]], nameserver: Optional[str] = None,
+               rcode: Optional[str] = None, answers: Optional[int] = None,
+               cache: str = "off", queued: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Add a span for one query.
+
+        Args:
+            started: perf_counter() when the first attempt began
+            queued: perf_counter() when the query was issued, if it waited for a slot
+        """
+        domain, check = _CONTEXT.get()
+        span = {
+            "domain": domain,
+            "check": check,
+            "name": name,
+            "type": rtype,
+            "nameserver": nameserver,
+            "outcome": outcome,
+            "rcode": rcode,
+            "answers": answers,
+            "cache": cache,
+            "attempts": attempts,
+            "retries": max(0, len(attempts) - 1),
+            "start_ms": self.offset_ms(queued if queued is not None else started),
+            "queue_ms": round((started - queued) * 1000, 3) if queued is not None else 0.0,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+        self.spans.append(span)
+        return span
+
+    def summary(self, slowest: int = SLOWEST_QUERIES) -> Dict[str, Any]:
+        """Totals by outcome, cache status and check, plus the slowest queries."""
+        outcomes: Dict[str, int] = {}
+        cache: Dict[str, int] = {}
+        by_check: Dict[str, Dict[str, Any]] = {}
+        for span in self.spans:
+            outcomes[span["outcome"]] = outcomes.get(span["outcome"], 0) + 1
+            cache[span["cache"]] = cache.get(span["cache"], 0) + 1
+            key = f"{span['domain']}/{span['check']}"
+            entry = by_check.setdefault(key, {"queries": 0, "failed": 0, "latency_ms": 0.0})
+            entry["queries"] += 1
+            entry["failed"] += span["outcome"] in FAILED_OUTCOMES
+            entry["latency_ms"] = round(entry["latency_ms"] + span["latency_ms"], 3)
+
+        ranked = sorted(self.spans, key=lambda span: span["latency_ms"] + span["queue_ms"], reverse=True)
+        return {
+            "queries": len(self.spans),
+            "timeouts": outcomes.get("timeout", 0),
+            "retries": sum(span["retries"] for span in self.spans),
+            "outcomes": outcomes,
+            "cache": cache,
+            "by_check": by_check,
+            "slowest": [
+                {key: span[key] for key in ("domain", "check", "name", "type", "nameserver",
+                                            "outcome", "retries", "queue_ms", "latency_ms")}
+                for span in ranked[:slowest]
+            ],
+        }
+
+    def to_dict(self, slowest: int = SLOWEST_QUERIES) -> Dict[str, Any]:
+        return {"spans": self.spans, "summary": self.summary(slowest)}
+
+    def save(self, path: str, slowest: int = SLOWEST_QUERIES) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(slowest), f, indent=2)
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """Human-readable trace summary with the slowest queries."""
+    outcomes = ", ".join(f"{count} {outcome}" for outcome, count in sorted(summary["outcomes"].items()))
+    lines = [f"DNS queries: {summary['queries']} ({outcomes or 'none'}), {summary['retries']} retries"]
+    if summary["slowest"]:
+        lines.append("Slowest queries:")
+        for span in summary["slowest"]:
+            queued = f", queued {span['queue_ms']:.0f} ms" if span["queue_ms"] >= 1 else ""
+            lines.append(
+                f"  {span['latency_ms']:8.1f} ms  {span['type']:<5} {span['name']}  "
+                f"{span['outcome']} via {span['nameserver']}{queued}  [{span['domain']}/{span['check']}]"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Email Analysis HTTP Service
+
+Local HTTP/JSON front end for the HTML analyzer, subject scorer and
+deliverability checker. Heavy imports (BeautifulSoup, lxml, compiled rule
+sets) are loaded and warmed once in the parent, then a pre-forked pool of
+worker processes shares the listening socket. Each worker serves keep-alive
+HTTP/1.1 connections from a fixed thread pool fed by a bounded queue; when
+the queue is full new connections get 429 immediately.
+
+Endpoints (POST, JSON body):
+    /html/analyze    {"html": "..."} or {"documents": [{"html": "...", "file": "..."}]}
+    /subject/score   {"subject": "..."} or {"subjects": ["...", ...]}
+    /domain/check    {"domain": "..."} or {"domains": ["...", ...], "timeout": 10}
+    GET /health      {"status": "ok", "pid": ...}
+    GET /metrics     OpenMetrics text, merged across all workers
+
+Usage:
+    python email_service.py
+    python email_service.py --port 8025 --workers 4 --threads 8 --queue-size 64
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import math
+import os
+import queue
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import analyze_email_html
+import score_subject_line
+from deliverability_async import check_domains
+from dns_resolver import AsyncResolver
+from metrics import CONTENT_TYPE, REGISTRY
+
+
+# Largest request body accepted (bytes); Gmail clips at 102KB so this is generous
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+# Largest number of items accepted in one batched request
+MAX_BATCH_SIZE = 1000
+
+# Bounds on the per-request DNS timeout for /domain/check, in seconds
+DEFAULT_DOMAIN_TIMEOUT = 30
+MAX_DOMAIN_TIMEOUT = 120
+
+# Seconds an idle keep-alive connection may hold a worker thread
+KEEP_ALIVE_TIMEOUT = 15
+
+
+class RequestError(Exception):
+    """Raised by endpoint handlers to produce a JSON error response."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _batch(payload: Dict[str, Any], single: str, many: str) -> Tuple[List[Any], bool]:
+    """Return (items, is_batch) from a {single: x} or {many: [x, ...]} payload."""
+    if many in payload:
+        items = payload[many]
+        if not isinstance(items, list):
+            raise RequestError(400, f"'{many}' must be a list")
+        if len(items) > MAX_BATCH_SIZE:
+            raise RequestError(413, f"Batch exceeds {MAX_BATCH_SIZE} items")
+        return items, True
+    if single in payload:
+        return [payload[single]], False
+    raise RequestError(400, f"Expected '{single}' or '{many}'")
+
+
+def handle_html_analyze(payload: Dict[str, Any], worker: "WorkerContext") -> Any:
+    documents, is_batch = _batch(payload, "html", "documents")
+    results = []
+    for doc in documents:
+        if isinstance(doc, str):
+            html, filepath = doc, "<request>"
+        elif isinstance(doc, dict) and isinstance(doc.get("html"), str):
+            html, filepath = doc["html"], str(doc.get("file", "<request>"))
+        else:
+            raise RequestError(400, "Each document must be a string or {\"html\": ...}")
+        results.append(analyze_email_html.analyze_html(html, filepath))
+    return {"results": results} if is_batch else results[0]
+
+
+def handle_subject_score(payload: Dict[str, Any], worker: "WorkerContext") -> Any:
+    subjects, is_batch = _batch(payload, "subject", "subjects")
+    if not all(isinstance(subject, str) for subject in subjects):
+        raise RequestError(400, "Subjects must be strings")
+    results = [score_subject_line.score_subject_line(subject) for subject in subjects]
+    return {"results": results} if is_batch else results[0]
+
+
+def handle_domain_check(payload: Dict[str, Any], worker: "WorkerContext") -> Any:
+    domains, is_batch = _batch(payload, "domain", "domains")
+    if not all(isinstance(domain, str) and domain.strip() for domain in domains):
+        raise RequestError(400, "Domains must be non-empty strings")
+    timeout = payload.get("timeout", DEFAULT_DOMAIN_TIMEOUT)
+    if (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or not math.isfinite(timeout)
+            or not 0 < timeout <= MAX_DOMAIN_TIMEOUT):
+        raise RequestError(400, f"'timeout' must be a number of seconds in (0, {MAX_DOMAIN_TIMEOUT}]")
+    try:
+        results = worker.run_async(
+            lambda resolver: check_domains(domains, resolver, timeout=timeout),
+            timeout + 5
+        )
+    except concurrent.futures.TimeoutError:
+        raise RequestError(504, f"Domain checks did not finish within {timeout + 5:g} seconds") from None
+    return {"results": results} if is_batch else results[0]
+
+
+ROUTES: Dict[str, Callable[[Dict[str, Any], "WorkerContext"], Any]] = {
+    "/html/analyze": handle_html_analyze,
+    "/subject/score": handle_subject_score,
+    "/domain/check": handle_domain_check,
+}
+
+
+class WorkerContext:
+    """
+    Per-process state: an asyncio loop thread with one shared DNS resolver.
+
+    Created after fork, since threads and sockets do not survive it.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.resolver: Optional[AsyncResolver] = None
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _resolver(self) -> AsyncResolver:
+        if self.resolver is None:
+            self.resolver = AsyncResolver()
+        return self.resolver
+
+    def run_async(self, factory: Callable[[AsyncResolver], Any], timeout: float) -> Any:
+        """
+        Run factory(resolver) on the worker loop and wait for its result.
+
+        Raises:
+            concurrent.futures.TimeoutError: not done within timeout; the
+                coroutine is cancelled rather than left running on the loop
+        """
+        async def run():
+            return await factory(await self._resolver())
+        future = asyncio.run_coroutine_threadsafe(run(), self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    """JSON request handler; one instance per connection, reused for keep-alive."""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "EmailAnalysis/1.0"
+    timeout = KEEP_ALIVE_TIMEOUT
+
+    def _send_json(self, status: int, body: Any) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "pid": os.getpid()})
+        elif self.path == "/metrics":
+            data = REGISTRY.exposition().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint: {self.path}"})
+
+    def do_POST(self) -> None:
+        handler = ROUTES.get(self.path)
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_json(413, {"error": "Missing or oversized Content-Length"})
+            return
+
+        body = self.rfile.read(length)
+        if handler is None:
+            self._send_json(404, {"error": f"Unknown endpoint: {self.path}"})
+            return
+
+        try:
+            payload = json.loads(body or b"{}")
+            if not isinstance(payload, dict):
+                raise RequestError(400, "Request body must be a JSON object")
+            self._send_json(200, handler(payload, self.server.worker))
+        except json.JSONDecodeError as e:
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+        except RequestError as e:
+            self._send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            sys.stderr.write(f"[{os.getpid()}] {self.address_string()} {format % args}\n")
+
+
+class AnalysisServer(HTTPServer):
+    """
+    HTTPServer on a pre-bound socket with a fixed thread pool and bounded queue.
+
+    The accept loop never blocks on analysis: accepted connections are queued
+    for the pool, and rejected with 429 when the queue is full.
+    """
+
+    def __init__(self, sock: socket.socket, threads: int, queue_size: int, verbose: bool = False):
+        super().__init__(sock.getsockname()[:2], AnalysisRequestHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.verbose = verbose
+        self.worker = WorkerContext()
+        self._queue: "queue.Queue[Tuple[socket.socket, Any]]" = queue.Queue(maxsize=queue_size)
+        for _ in range(threads):
+            threading.Thread(target=self._serve_queue, daemon=True).start()
+
+    def process_request(self, request: socket.socket, client_address: Any) -> None:
+        try:
+            self._queue.put_nowait((request, client_address))
+        except queue.Full:
+            self._reject(request)
+
+    def _serve_queue(self) -> None:
+        while True:
+            request, client_address = self._queue.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def _reject(self, request: socket.socket) -> None:
+        """Answer 429 without parsing the request, then close the connection."""
+        body = b'{"error": "Server saturated, retry later"}'
+        try:
+            # Drain what has arrived so closing does not reset the connection
+            request.settimeout(0.05)
+            try:
+                request.recv(65536)
+            except OSError:
+                pass
+            request.sendall(
+                b"HTTP/1.1 429 Too Many Requests\r\n"
+                b"Content-Type: application/json\r\n"
+                b"Retry-After: 1\r\n"
+                b"Connection: close\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+
+def warm_up() -> None:
+    """Import and exercise parsers and rule sets once, before forking."""
+    analyze_email_html.analyze_html(
+        "<html><head><style>td { color: #333; }</style></head>"
+        "<body><table><tr><td><a href='#'>unsubscribe</a></td></tr></table></body></html>"
+    )
+    score_subject_line.score_subject_line("Warm up: 5 proven tips for {first_name}")
+
+
+def _run_worker(sock: socket.socket, threads: int, queue_size: int, verbose: bool) -> None:
+    server = AnalysisServer(sock, threads, queue_size, verbose)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def serve(host: str, port: int, workers: int, threads: int, queue_size: int,
+          verbose: bool = False, ready: Optional[Callable[[int], None]] = None) -> None:
+    """
+    Bind, warm up and serve until interrupted.
+
+    Args:
+        ready: Called with the bound port once the socket is listening
+               (useful with port 0 in tests)
+    """
+    warm_up()
+    REGISTRY.reset()
+    sock = socket.create_server((host, port), backlog=max(128, queue_size))
+    bound_port = sock.getsockname()[1]
+    if verbose:
+        print(f"Listening on http://{host}:{bound_port} ({workers} worker(s))", file=sys.stderr)
+    if ready:
+        ready(bound_port)
+
+    # Windows and single-worker mode serve in-process
+    if workers <= 1 or not hasattr(os, "fork"):
+        try:
+            _run_worker(sock, threads, queue_size, verbose)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # Each worker publishes its metrics here so any of them can serve the total
+    metrics_dir = tempfile.mkdtemp(prefix="email-metrics-")
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, lambda signum, frame: os._exit(0))
+            REGISTRY.share(metrics_dir)
+            try:
+                _run_worker(sock, threads, queue_size, verbose)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        sock.close()
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve the email analyzers over local HTTP/JSON"
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to bind (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8025,
+        help="Port to bind (default: 8025, 0 for any free port)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Pre-forked worker processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=8,
+        help="Request threads per worker (default: 8)"
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=64,
+        help="Queued connections per worker before returning 429 (default: 64)"
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Log requests to stderr"
+    )
+
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.threads, args.queue_size, args.verbose)
+
+
+if __name__ == "__main__":
+    main()
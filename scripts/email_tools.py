@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Email Tools Command Line
+
+One entry point for the analyzers and hooks:
+
+    email-tools html        analyze_email_html.py
+    email-tools subject     score_subject_line.py
+    email-tools domain      check_deliverability.py
+    email-tools validate    hooks/validate-email-html.py
+    email-tools presend     hooks/pre-send-check.py
+
+Only the chosen subcommand's module is imported and its arguments are
+passed through unchanged, so `email-tools subject ...` starts as fast as
+the subject scorer alone: NumPy, asyncio, lxml and http.server are loaded
+by the subcommands (and code paths) that use them, never by the dispatcher.
+
+`--check-startup` imports each subcommand in a fresh interpreter and fails
+when one exceeds its STARTUP_BUDGET_MS or loads a module listed in
+HEAVY_MODULES, so a stray top-level import is caught before it ships (CI runs
+it on every push and pull request, see .github/workflows/startup.yml).
+
+Usage:
+    email-tools subject "Your order has shipped" --json
+    email-tools html template.html --json
+    email-tools domain example.com --json
+    email-tools validate template.html
+    email-tools presend "Subject line" "Body text"
+    email-tools --check-startup [--json]
+"""
+
+# Annotations use builtin generics: importing typing would cost the
+# validate subcommand more than the hook itself
+import os
+import sys
+from collections.abc import Callable
+
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+HOOKS_DIR = os.path.join(SCRIPTS_DIR, os.pardir, "hooks")
+
+# Subcommand -> (module in scripts/, or file in hooks/; description)
+COMMANDS = {
+    "html": ("analyze_email_html", "Score an HTML email for rendering, accessibility and compliance"),
+    "subject": ("score_subject_line", "Score subject lines for length, spam triggers and formatting"),
+    "domain": ("check_deliverability", "Check a sending domain's SPF, DKIM, DMARC and MX records"),
+    "validate": ("validate-email-html.py", "HTML quality gate (the PostToolUse hook)"),
+    "presend": ("pre-send-check.py", "Subject and body gate before sending (the PreToolUse hook)"),
+}
+
+# Import time per subcommand, in milliseconds, including the dispatcher itself
+STARTUP_BUDGET_MS = {"html": 80, "subject": 50, "validate": 30, "presend": 25}
+
+# Modules the budgeted subcommands must not import
+HEAVY_MODULES = ("numpy", "lxml", "bs4", "asyncio", "http.server", "ssl", "subprocess")
+
+# Fresh interpreters per subcommand; the fastest is reported
+STARTUP_SAMPLES = 5
+
+_STARTUP_PROBE = """
+import sys, time
+started = time.perf_counter()
+sys.path.insert(0, {scripts!r})
+import email_tools
+email_tools.load({name!r})
+elapsed = time.perf_counter() - started
+print(elapsed * 1000, *(module for module in {heavy!r} if module in sys.modules))
+"""
+
+
+def load(name: str) -> Callable[[], None]:
+    """Import a subcommand's module and return its main()."""
+    target, _ = COMMANDS[name]
+    if target.endswith(".py"):
+        import importlib.util
+
+        path = os.path.join(HOOKS_DIR, target)
+        spec = importlib.util.spec_from_file_location(target[:-3].replace("-", "_"), path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    else:
+        import importlib
+
+        if SCRIPTS_DIR not in sys.path:
+            sys.path.insert(0, SCRIPTS_DIR)
+        module = importlib.import_module(target)
+    return module.main
+
+
+def check_startup(samples: int = STARTUP_SAMPLES) -> dict:
+    """
+    Time each subcommand's imports in fresh interpreters.
+
+    Returns:
+        Dict with per-subcommand milliseconds (fastest sample), budget, heavy
+        modules loaded, and whether everything is within budget
+    """
+    import subprocess
+
+    commands = []
+    for name in COMMANDS:
+        code = _STARTUP_PROBE.format(scripts=SCRIPTS_DIR, name=name, heavy=HEAVY_MODULES)
+        timings = []
+        heavy: list[str] = []
+        for _ in range(samples):
+            output = subprocess.run(
+                [sys.executable, "-c", code], capture_output=True, text=True, check=True
+            ).stdout.split()
+            timings.append(float(output[0]))
+            heavy = output[1:]
+        budget = STARTUP_BUDGET_MS.get(name)
+        commands.append({
+            "command": name,
+            "ms": round(min(timings), 1),
+            "budget_ms": budget,
+            "heavy_modules": heavy if budget is not None else [],
+            "ok": budget is None or (min(timings) <= budget and not heavy),
+        })
+    return {"commands": commands, "ok": all(command["ok"] for command in commands)}
+
+
+def format_startup(report: dict) -> str:
+    lines = ["Subcommand import time (fastest of fresh interpreters):"]
+    for command in report["commands"]:
+        budget = f"budget {command['budget_ms']} ms" if command["budget_ms"] is not None else "no budget"
+        status = "OK  " if command["ok"] else "FAIL"
+        line = f"  {status} {command['command']:<9} {command['ms']:7.1f} ms  ({budget})"
+        if command["heavy_modules"]:
+            line += f"  imports {', '.join(command['heavy_modules'])}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def usage() -> str:
+    lines = ["usage: email-tools <command> [args...]", "       email-tools --check-startup [--json]", "",
+             "commands:"]
+    for name, (_, description) in COMMANDS.items():
+        lines.append(f"  {name:<10} {description}")
+    lines.append("")
+    lines.append("Run 'email-tools <command> --help' for a command's options.")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage(), file=sys.stdout if argv else sys.stderr)
+        sys.exit(0 if argv else 2)
+
+    if argv[0] == "--check-startup":
+        report = check_startup()
+        if "--json" in argv[1:]:
+            import json
+
+            print(json.dumps(report, indent=2))
+        else:
+            print(format_startup(report))
+        sys.exit(0 if report["ok"] else 1)
+
+    name = argv[0]
+    if name not in COMMANDS:
+        print(f"email-tools: unknown command '{name}' (choose from {', '.join(COMMANDS)})", file=sys.stderr)
+        sys.exit(2)
+
+    command = load(name)
+    # argparse names the program after argv[0]
+    sys.argv = [f"email-tools {name}", *argv[1:]]
+    command()
+
+
+if __name__ == "__main__":
+    main()
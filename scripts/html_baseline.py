@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+HTML Analyzer Baselines
+
+Stores a compact snapshot (score, size and issues) of analyze_email_html.py
+results per template and compares new runs against it, reporting only new,
+resolved and changed issues plus score deltas. Each entry also records the
+file's size, mtime and content hash: files whose stat matches are skipped
+without being read, and files whose content hash matches are skipped without
+being parsed, so CI runs over thousands of templates only analyze what
+changed. A change to the analyzer rules or the asset root invalidates the
+hashes, and a template is re-analyzed when a local image it references
+changes, appears or disappears. Templates in the baseline that no longer
+exist are reported as removed (and dropped on update).
+
+Usage:
+    python analyze_email_html.py templates/ --baseline baseline.json --update-baseline
+    python analyze_email_html.py templates/ --baseline baseline.json
+    python analyze_email_html.py templates/ --baseline baseline.json --json
+"""
+
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import analyze_email_html
+from analyze_email_html import analyze_html
+from html_input import open_html
+from rule_dictionaries import RULES
+
+
+BASELINE_VERSION = 1
+
+HTML_EXTENSIONS = (".html", ".htm")
+
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+SEVERITY_ORDER = {"high": 0, "medium": 1, "low": 2}
+
+# Sources whose changes can change analyze_html results
+ANALYZER_MODULES = (
+    "analyze_email_html.py", "compliance_rules.py", "contrast.py",
+    "html_input.py", "html_parsers.py", "image_inspect.py",
+)
+
+
+def rules_fingerprint() -> str:
+    """Hash of the analyzer sources, rule dictionaries, parser and asset root; changes invalidate stored hashes."""
+    images = analyze_email_html.IMAGES
+    asset_root = images.asset_root if images is not None else None
+    digest = hashlib.sha256(f"{analyze_email_html.PARSER}:{RULES.fingerprint}:{asset_root}".encode("utf-8"))
+    for module in ANALYZER_MODULES:
+        try:
+            with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), module), "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            pass
+    return digest.hexdigest()[:16]
+
+
+def issue_key(issue: Dict[str, Any]) -> Tuple[str, str]:
+    """Identity of an issue across runs: its check and message with numbers masked."""
+    return issue["check"], _NUMBER_RE.sub("#", issue["message"])
+
+
+def snapshot(results: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce analyze_html results to the fields baselines compare."""
+    return {
+        "score": results["score"],
+        "size_kb": results["size_kb"],
+        "issues": [[i["check"], i["severity"], i["message"]] for i in results["issues"]],
+    }
+
+
+def diff_snapshots(old: Optional[Dict[str, Any]], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compare two snapshots.
+
+    Returns:
+        Dict with score, previous_score, score_delta and lists of new,
+        resolved and changed ({"old", "new"}) issues
+    """
+    def as_issues(snap: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not snap:
+            return []
+        return [{"check": c, "severity": s, "message": m} for c, s, m in snap["issues"]]
+
+    old_by_key: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for issue in as_issues(old):
+        old_by_key.setdefault(issue_key(issue), []).append(issue)
+
+    added, changed = [], []
+    for issue in as_issues(new):
+        previous = old_by_key.get(issue_key(issue))
+        if not previous:
+            added.append(issue)
+            continue
+        before = previous.pop(0)
+        if before["message"] != issue["message"] or before["severity"] != issue["severity"]:
+            changed.append({"old": before, "new": issue})
+    resolved = [issue for remaining in old_by_key.values() for issue in remaining]
+
+    previous_score = old["score"] if old else None
+    return {
+        "score": new["score"],
+        "previous_score": previous_score,
+        "score_delta": new["score"] - previous_score if previous_score is not None else None,
+        "new": added,
+        "resolved": resolved,
+        "changed": changed,
+    }
+
+
+def has_differences(diff: Dict[str, Any]) -> bool:
+    return bool(diff["new"] or diff["resolved"] or diff["changed"] or diff["score_delta"])
+
+
+def iter_html_files(paths: List[str]) -> Iterator[str]:
+    """Expand directories into the HTML files beneath them."""
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(HTML_EXTENSIONS):
+                        yield os.path.join(dirpath, filename)
+        else:
+            yield path
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    """Load a baseline file, starting empty if missing or from another format version."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+    if baseline.get("version") != BASELINE_VERSION:
+        baseline = {"version": BASELINE_VERSION, "rules": None, "files": {}}
+    return baseline
+
+
+def save_baseline(path: str, baseline: Dict[str, Any]) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def asset_stats(files: List[str]) -> List[List[Any]]:
+    """[path, size, mtime_ns] per file, with None for files that do not exist."""
+    stats = []
+    for path in files:
+        try:
+            stat = os.stat(path)
+            stats.append([path, stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            stats.append([path, None, None])
+    return stats
+
+
+def _assets_unchanged(entry: Dict[str, Any]) -> bool:
+    assets = entry.get("assets", [])
+    return asset_stats([path for path, _, _ in assets]) == assets
+
+
+def _in_scope(path: str, paths: List[str]) -> bool:
+    """Whether a baseline entry is covered by the files and directories compared."""
+    path = os.path.abspath(path)
+    for root in paths:
+        root = os.path.abspath(root)
+        if path == root or (os.path.isdir(root) and os.path.commonpath([root, path]) == root):
+            return True
+    return False
+
+
+def compare_with_baseline(paths: List[str], baseline: Dict[str, Any],
+                          update: bool = False) -> Dict[str, Any]:
+    """
+    Analyze changed templates and diff them against their baseline snapshots.
+
+    Args:
+        paths: Files and/or directories
+        baseline: Loaded baseline (modified in place when update is True)
+        update: Store the new snapshots as the baseline
+
+    Returns:
+        Dict with file counts, per-file diffs that differ from the baseline,
+        files not in the baseline yet, baseline files that no longer exist
+        (their issues as resolved), and read errors
+    """
+    rules = rules_fingerprint()
+    reuse_hashes = baseline.get("rules") == rules
+    entries = baseline["files"]
+    report: Dict[str, Any] = {
+        "files": 0, "unchanged": 0, "analyzed": 0,
+        "diffs": [], "added": [], "removed": [], "errors": [],
+    }
+    seen = set()
+
+    for path in iter_html_files(paths):
+        report["files"] += 1
+        seen.add(path)
+        entry = entries.get(path)
+        try:
+            stat = os.stat(path)
+            reusable = reuse_hashes and entry and _assets_unchanged(entry)
+            if reusable and entry["stat"] == [stat.st_size, stat.st_mtime_ns]:
+                report["unchanged"] += 1
+                continue
+            with open_html(path) as data:
+                content_hash = hashlib.sha256(data).hexdigest()[:32]
+                unchanged = reusable and entry["hash"] == content_hash
+                if not unchanged:
+                    results = analyze_html(data, path)
+                    snap = snapshot(results)
+                    assets = asset_stats(results["images"].get("assets", {}).get("files", []))
+        except OSError as e:
+            report["errors"].append({"file": path, "error": str(e)})
+            continue
+
+        if unchanged:
+            report["unchanged"] += 1
+            if update:
+                entry["stat"] = [stat.st_size, stat.st_mtime_ns]
+            continue
+
+        report["analyzed"] += 1
+        previous = entry["snapshot"] if entry else None
+        diff = diff_snapshots(previous, snap)
+        if previous is None:
+            report["added"].append({"file": path, **diff})
+        elif has_differences(diff):
+            report["diffs"].append({"file": path, **diff})
+
+        if update:
+            entries[path] = {
+                "stat": [stat.st_size, stat.st_mtime_ns],
+                "hash": content_hash,
+                "snapshot": snap,
+                "assets": assets,
+            }
+
+    for path in [path for path in entries if path not in seen and _in_scope(path, paths)]:
+        if os.path.exists(path):
+            continue  # not an HTML file iter_html_files yields, e.g. renamed extension
+        previous = entries[path]["snapshot"]
+        report["removed"].append({
+            "file": path,
+            "previous_score": previous["score"],
+            "resolved": [{"check": c, "severity": s, "message": m} for c, s, m in previous["issues"]],
+        })
+        if update:
+            del entries[path]
+
+    if update:
+        baseline["rules"] = rules
+    return report
+
+
+def regressions(report: Dict[str, Any]) -> int:
+    """Count new high-severity issues across a comparison report."""
+    return sum(
+        1
+        for diff in report["diffs"] + report["added"]
+        for issue in diff["new"] + [change["new"] for change in diff["changed"]]
+        if issue["severity"] == "high"
+    )
+
+
+def format_diff(diff: Dict[str, Any]) -> str:
+    """Format one file's diff as compact +/-/~ lines with ANSI colors."""
+    GREEN = "\033[92m"
+    YELLOW = "\033[93m"
+    RED = "\033[91m"
+    BOLD = "\033[1m"
+    RESET = "\033[0m"
+
+    if diff["previous_score"] is None:
+        header = f"{BOLD}{diff['file']}{RESET}: score {diff['score']} (new)"
+    else:
+        delta = diff["score_delta"]
+        color = GREEN if delta > 0 else RED if delta < 0 else ""
+        header = (f"{BOLD}{diff['file']}{RESET}: score {diff['previous_score']} -> {diff['score']} "
+                  f"({color}{delta:+d}{RESET if color else ''})")
+
+    lines = [header]
+    for issue in sorted(diff["new"], key=lambda i: SEVERITY_ORDER[i["severity"]]):
+        lines.append(f"  {RED}+{RESET} [{issue['severity'].upper()}] {issue['message']}")
+    for change in diff["changed"]:
+        lines.append(f"  {YELLOW}~{RESET} [{change['new']['severity'].upper()}] "
+                     f"{change['old']['message']} -> {change['new']['message']}")
+    for issue in diff["resolved"]:
+        lines.append(f"  {GREEN}-{RESET} [{issue['severity'].upper()}] {issue['message']}")
+    return "\n".join(lines)
+
+
+def format_human_readable(report: Dict[str, Any]) -> str:
+    """Format a comparison report."""
+    output = [
+        f"\nBaseline comparison: {report['files']} files, {report['analyzed']} analyzed, "
+        f"{report['unchanged']} unchanged, {len(report['diffs'])} differ, {len(report['added'])} new, "
+        f"{len(report['removed'])} removed"
+    ]
+    for diff in report["diffs"]:
+        output.append(format_diff(diff))
+    for diff in report["added"]:
+        output.append(f"{diff['file']}: score {diff['score']} (not in baseline, {len(diff['new'])} issues)")
+    for removed in report["removed"]:
+        output.append(f"{removed['file']}: removed (was score {removed['previous_score']}, "
+                      f"{len(removed['resolved'])} issues resolved)")
+    for error in report["errors"]:
+        output.append(f"ERROR: {error['file']}: {error['error']}")
+    return "\n".join(output)
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Columnar Export of HTML Analysis Results
+
+Writes analyze_email_html.py results for large corpora as typed columns
+(score, size, per-check booleans and counts) instead of indented JSON.
+Issues become small integer codes against a message dictionary: messages
+are keyed like baselines (check, severity and message with numbers masked,
+see html_baseline.py), so the dictionary stays a few dozen entries however
+many documents are exported.
+
+Two formats, both streamed in row groups so memory stays flat:
+
+    .csv  One row per document; issue_codes is a space-separated list.
+          The dictionary is written next to it as <name>.messages.csv.
+    .npz  A zip of .npy arrays, one per column per row group
+          (rg00000/score.npy, ...) plus schema.json with the dtypes, row
+          group sizes and dictionary. Strings and issue codes are stored
+          as offsets + values. Written with the stdlib only; np.load()
+          reads any member, and load_export() concatenates row groups.
+
+Usage:
+    python analyze_email_html.py templates/ --export results.npz
+    python html_export.py templates/ --output results.csv
+
+    from html_export import load_export
+    columns, messages = load_export("results.npz")
+    df = pandas.DataFrame(columns)
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import zipfile
+from array import array
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from analyze_email_html import analyze_html
+from html_baseline import issue_key, iter_html_files
+from html_input import open_html
+
+
+EXPORT_VERSION = 1
+
+ROW_GROUP_SIZE = 65536
+
+SEVERITIES = ("high", "medium", "low")
+
+
+def _max_width_px(results: Dict[str, Any]) -> int:
+    max_width = results["responsive"]["max_width"]
+    return int(max_width[:-2]) if max_width else -1
+
+
+def _text_ratio(results: Dict[str, Any]) -> float:
+    text, _, _ = results["images"]["text_image_ratio"].partition("/")
+    return float(text) if text.isdigit() else math.nan
+
+
+def _issue_count(severity: str) -> Callable[[Dict[str, Any]], int]:
+    return lambda results: sum(1 for issue in results["issues"] if issue["severity"] == severity)
+
+
+# (column, NumPy dtype, value from analyze_html results); -1 and NaN mean "not applicable"
+EXPORT_COLUMNS: List[Tuple[str, str, Callable[[Dict[str, Any]], Any]]] = [
+    ("score", "<i2", lambda r: r["score"]),
+    ("size_bytes", "<i8", lambda r: r["size_bytes"]),
+    ("gmail_clip_risk", "|b1", lambda r: r["gmail_clip_risk"]),
+    ("gmail_clip_critical", "|b1", lambda r: r["gmail_clip_critical"]),
+    ("image_count", "<i4", lambda r: r["images"]["count"]),
+    ("images_missing_alt", "<i4", lambda r: r["images"]["missing_alt"]),
+    ("text_ratio", "<f4", _text_ratio),
+    ("viewport_meta", "|b1", lambda r: r["responsive"]["viewport_meta"]),
+    ("media_queries", "|b1", lambda r: r["responsive"]["media_queries"]),
+    ("max_width_px", "<i4", _max_width_px),
+    ("prefers_color_scheme", "|b1", lambda r: r["dark_mode"]["prefers_color_scheme"]),
+    ("color_scheme_meta", "|b1", lambda r: r["dark_mode"]["color_scheme_meta"]),
+    ("outlook_data_attrs", "|b1", lambda r: r["dark_mode"]["outlook_data_attrs"]),
+    ("pure_white_bg", "|b1", lambda r: r["dark_mode"]["pure_white_bg"]),
+    ("table_based", "|b1", lambda r: r["layout"]["table_based"]),
+    ("css_grid", "|b1", lambda r: r["layout"]["css_grid"]),
+    ("flexbox", "|b1", lambda r: r["layout"]["flexbox"]),
+    ("link_count", "<i4", lambda r: r["links"]["count"]),
+    ("has_unsubscribe_link", "|b1", lambda r: r["links"]["has_unsubscribe"]),
+    ("shorteners_found", "|b1", lambda r: r["links"]["shorteners_found"]),
+    ("preheader_found", "|b1", lambda r: r["preheader"]["found"]),
+    ("preheader_length", "<i4", lambda r: r["preheader"]["length"]),
+    ("physical_address", "|b1", lambda r: r["compliance"]["physical_address"]),
+    ("unsubscribe", "|b1", lambda r: r["compliance"]["unsubscribe"]),
+    ("sender_id", "|b1", lambda r: r["compliance"]["sender_id"]),
+] + [(f"{severity}_issues", "<i2", _issue_count(severity)) for severity in SEVERITIES]
+
+# array typecodes for the fixed-width dtypes above (booleans are stored as 0/1 bytes)
+_TYPECODES = {"<i2": "h", "<i4": "i", "<i8": "q", "<f4": "f", "<u2": "H", "|b1": "B", "|u1": "B"}
+
+ISSUE_CODE_DTYPE = "<u2"
+OFFSET_DTYPE = "<i8"
+
+
+class IssueDictionary:
+    """Assigns codes to issue messages in order of first appearance."""
+
+    def __init__(self):
+        self._codes: Dict[Tuple[str, str, str], int] = {}
+        self.entries: List[List[str]] = []
+
+    def code(self, issue: Dict[str, Any]) -> int:
+        check, message = issue_key(issue)
+        key = (check, issue["severity"], message)
+        code = self._codes.get(key)
+        if code is None:
+            code = len(self.entries)
+            if code > 0xFFFF:
+                raise ValueError("More than 65536 distinct issue messages")
+            self._codes[key] = code
+            self.entries.append(list(key))
+        return code
+
+
+def _npy_bytes(dtype: str, values: array) -> bytes:
+    """Serialize a 1-D array in .npy format 1.0."""
+    if sys.byteorder == "big" and values.itemsize > 1:
+        values = array(values.typecode, values)
+        values.byteswap()
+    header = f"{{'descr': '{dtype}', 'fortran_order': False, 'shape': ({len(values)},), }}"
+    # Magic (6) + version (2) + length (2) + header, padded to a multiple of 64
+    padding = -(10 + len(header) + 1) % 64
+    header = (header + " " * padding + "\n").encode("latin-1")
+    return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header + values.tobytes()
+
+
+class CsvExportWriter:
+    """Streams rows to CSV; the issue dictionary goes to <name>.messages.csv on close."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(["file"] + [name for name, _, _ in EXPORT_COLUMNS] + ["issue_codes"])
+
+    def write(self, filepath: str, values: List[Any], codes: List[int]) -> None:
+        self._writer.writerow(
+            [filepath]
+            + [int(value) if isinstance(value, bool) else value for value in values]
+            + [" ".join(map(str, codes))]
+        )
+
+    def close(self, dictionary: IssueDictionary) -> None:
+        self._file.close()
+        with open(messages_path(self.path), "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["code", "check", "severity", "message"])
+            for code, entry in enumerate(dictionary.entries):
+                writer.writerow([code] + entry)
+
+
+class ColumnarExportWriter:
+    """Streams rows into an .npz of per-row-group .npy columns."""
+
+    def __init__(self, path: str, row_group_size: int = ROW_GROUP_SIZE):
+        self.path = path
+        self.row_group_size = row_group_size
+        self.row_groups: List[int] = []
+        self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+        self._reset()
+
+    def _reset(self) -> None:
+        self._rows = 0
+        self._columns = [array(_TYPECODES[dtype]) for _, dtype, _ in EXPORT_COLUMNS]
+        self._file_offsets = array("q", [0])
+        self._file_data = bytearray()
+        self._issue_offsets = array("q", [0])
+        self._issue_codes = array("H")
+
+    def write(self, filepath: str, values: List[Any], codes: List[int]) -> None:
+        for column, value in zip(self._columns, values):
+            column.append(value)
+        self._file_data += filepath.encode("utf-8", errors="surrogateescape")
+        self._file_offsets.append(len(self._file_data))
+        self._issue_codes.extend(codes)
+        self._issue_offsets.append(len(self._issue_codes))
+        self._rows += 1
+        if self._rows >= self.row_group_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._rows:
+            return
+        group = f"rg{len(self.row_groups):05d}"
+        members = [
+            ("file.offsets", OFFSET_DTYPE, self._file_offsets),
+            ("file.data", "|u1", array("B", self._file_data)),
+            ("issue_codes.offsets", OFFSET_DTYPE, self._issue_offsets),
+            ("issue_codes.values", ISSUE_CODE_DTYPE, self._issue_codes),
+        ] + [(name, dtype, column) for (name, dtype, _), column in zip(EXPORT_COLUMNS, self._columns)]
+        for name, dtype, values in members:
+            self._zip.writestr(f"{group}/{name}.npy", _npy_bytes(dtype, values))
+        self.row_groups.append(self._rows)
+        self._reset()
+
+    def close(self, dictionary: IssueDictionary) -> None:
+        self._flush()
+        schema = {
+            "version": EXPORT_VERSION,
+            "columns": [["file", "str"]] + [[name, dtype] for name, dtype, _ in EXPORT_COLUMNS]
+                       + [["issue_codes", f"list[{ISSUE_CODE_DTYPE}]"]],
+            "row_groups": self.row_groups,
+            "messages": dictionary.entries,
+        }
+        self._zip.writestr("schema.json", json.dumps(schema))
+        self._zip.close()
+
+
+def messages_path(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}.messages.csv"
+
+
+def create_writer(path: str, row_group_size: int = ROW_GROUP_SIZE):
+    """CSV for .csv paths, the columnar .npz format otherwise."""
+    if path.lower().endswith(".csv"):
+        return CsvExportWriter(path)
+    return ColumnarExportWriter(path, row_group_size)
+
+
+def export_results(results: Iterable[Dict[str, Any]], path: str,
+                   row_group_size: int = ROW_GROUP_SIZE) -> Dict[str, Any]:
+    """
+    Write analyze_html results to `path`, consuming them one at a time.
+
+    Returns:
+        Dict with path, rows, row_groups and the number of distinct messages
+    """
+    writer = create_writer(path, row_group_size)
+    dictionary = IssueDictionary()
+    rows = 0
+    try:
+        for result in results:
+            writer.write(
+                result["file"],
+                [getter(result) for _, _, getter in EXPORT_COLUMNS],
+                [dictionary.code(issue) for issue in result["issues"]],
+            )
+            rows += 1
+    finally:
+        writer.close(dictionary)
+    return {
+        "path": path,
+        "rows": rows,
+        "row_groups": len(writer.row_groups) if isinstance(writer, ColumnarExportWriter) else None,
+        "messages": len(dictionary.entries),
+    }
+
+
+def analyze_paths(paths: List[str], errors: Optional[List[Dict[str, str]]] = None) -> Iterator[Dict[str, Any]]:
+    """Analyze every template under `paths`, yielding results; unreadable files go to `errors`."""
+    for path in iter_html_files(paths):
+        try:
+            with open_html(path) as data:
+                result = analyze_html(data, path)
+        except OSError as e:
+            if errors is not None:
+                errors.append({"file": path, "error": str(e)})
+            continue
+        yield result
+
+
+def load_export(path: str) -> Tuple[Dict[str, Any], List[List[str]]]:
+    """
+    Load a columnar export into NumPy arrays (requires numpy).
+
+    Returns:
+        (columns, messages): columns maps each column name to an array, with
+        "file" as an object array of str and "issue_codes" as an object
+        array of uint16 arrays; messages[code] is [check, severity, message]
+    """
+    import numpy as np
+
+    with zipfile.ZipFile(path) as archive:
+        schema = json.loads(archive.read("schema.json"))
+        if schema.get("version") != EXPORT_VERSION:
+            raise ValueError(f"Unsupported export version {schema.get('version')}")
+
+        def member(group: int, name: str):
+            with archive.open(f"rg{group:05d}/{name}.npy") as f:
+                return np.lib.format.read_array(f)
+
+        parts: Dict[str, List[Any]] = {name: [] for name, _ in schema["columns"]}
+        for group in range(len(schema["row_groups"])):
+            for name, dtype in schema["columns"]:
+                if name == "file":
+                    offsets, data = member(group, "file.offsets"), member(group, "file.data").tobytes()
+                    parts[name].append(np.array(
+                        [data[start:end].decode("utf-8", errors="surrogateescape")
+                         for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())],
+                        dtype=object))
+                elif name == "issue_codes":
+                    offsets, values = member(group, "issue_codes.offsets"), member(group, "issue_codes.values")
+                    codes = np.empty(len(offsets) - 1, dtype=object)
+                    codes[:] = np.split(values, offsets[1:-1])
+                    parts[name].append(codes)
+                else:
+                    parts[name].append(member(group, name))
+
+    columns = {}
+    for name, dtype in schema["columns"]:
+        if parts[name]:
+            columns[name] = np.concatenate(parts[name])
+        else:
+            columns[name] = np.empty(0, dtype=dtype if name not in ("file", "issue_codes") else object)
+    return columns, schema["messages"]
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """Format an export summary."""
+    output = [f"Exported {summary['rows']} documents to {summary['path']} "
+              f"({summary['messages']} distinct issue messages)"]
+    for error in summary["errors"]:
+        output.append(f"ERROR: {error['file']}: {error['error']}")
+    return "\n".join(output)
+
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export HTML email analysis results as CSV or columnar .npz"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="Template files or directories"
+    )
+    parser.add_argument(
+        "--output", "-o",
+        required=True,
+        help="Output file: .csv for CSV, anything else (e.g. .npz) for columnar"
+    )
+    parser.add_argument(
+        "--row-group-size",
+        type=int,
+        default=ROW_GROUP_SIZE,
+        help=f"Rows per columnar row group (default: {ROW_GROUP_SIZE})"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the export summary as JSON"
+    )
+
+    args = parser.parse_args()
+    errors: List[Dict[str, str]] = []
+    summary = export_results(analyze_paths(args.paths, errors), args.output, args.row_group_size)
+    summary["errors"] = errors
+    print(json.dumps(summary, indent=2) if args.json else format_summary(summary))
+    if errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Shared-Fragment Memoization
+
+Emails of one sequence (and most templates of one sender) repeat the same
+header, footer, unsubscribe and postal address blocks. FragmentCache hashes
+every DOM subtree of a parsed document (tag, visible text in order, child
+digests, and the href of links: a Merkle hash over exactly what the
+memoized facts depend on, so a restyled copy of a footer still matches) and
+keeps per-subtree facts by digest from a subtree's second sighting on;
+content seen once is summarized in whole contiguous runs. Summarizing a document then walks down
+from the top and stops at every subtree already seen in the run: only new
+subtrees are analyzed, and a footer shared by twelve emails is analyzed
+once. Hashing costs about as much as summarizing cheap facts, so the cache
+pays off on long runs of related emails and costly facts; the report shows
+both times.
+
+The cache is generic over the facts it keeps: `summarize(strings, links)`
+computes them for a contiguous run of text and links, and `combine(parts)`
+merges them. Facts must combine exactly (counts, sets, "found anywhere"
+flags); a text pattern that only matches across two fragments is not
+found, so callers treat a negative as "scan the whole text" (see
+analyze_compliance in analyze_email_html.py).
+
+Usage:
+    python analyze_email_html.py sequence/ --fragment-report
+    python analyze_email_html.py templates/ --fragment-report --json
+"""
+
+import hashlib
+import time
+from typing import Any, Callable, Dict, Generic, List, Sequence, Tuple, TypeVar
+
+
+# Subtrees with less visible text are summarized directly, never cached
+MIN_FRAGMENT_CHARS = 64
+
+MAX_CACHED_FRAGMENTS = 65536
+
+TOP_FRAGMENTS = 10
+
+PREVIEW_CHARS = 60
+
+T = TypeVar("T")
+
+# Pseudo element index of the document itself, whose children are the top-level elements
+_DOCUMENT = -1
+
+
+def subtree_digests(facts) -> Tuple[List[bytes], List[List[int]], List[int]]:
+    """
+    Merkle digest of every element's subtree.
+
+    Returns:
+        (digests, children, roots): a 16-byte digest and the ordered child
+        indices per element, and the top-level element indices
+    """
+    tags = facts.element_tags
+    spans = facts.element_spans
+    strings = facts.strings
+    count = len(tags)
+
+    children: List[List[int]] = [[] for _ in range(count)]
+    roots: List[int] = []
+    for index, parent in enumerate(facts.element_parents):
+        (children[parent] if parent >= 0 else roots).append(index)
+
+    def add_text(digest, parts: List[str]) -> None:
+        for text in parts:
+            data = text.encode("utf-8", "surrogatepass")
+            digest.update(b"\x02%d:" % len(data))
+            digest.update(data)
+
+    # Elements are numbered in document order, so every child is hashed before its parent
+    digests: List[bytes] = [b""] * count
+    for index in range(count - 1, -1, -1):
+        first, end, _, link_end = spans[index]
+        digest = hashlib.blake2b(tags[index].encode("utf-8", "surrogatepass") + b"\x00", digest_size=16)
+        cursor = first
+        for child in children[index]:
+            add_text(digest, strings[cursor:spans[child][0]])
+            digest.update(b"\x01" + digests[child])
+            cursor = spans[child][1]
+        add_text(digest, strings[cursor:end])
+        if tags[index] == "a" and link_end:
+            # The element's own link is the last one closed inside it
+            add_text(digest, [facts.links[link_end - 1][0]])
+        digests[index] = digest.digest()
+    return digests, children, roots
+
+
+class FragmentCache(Generic[T]):
+    """
+    Per-subtree facts keyed by subtree digest, kept for a run.
+
+    Args:
+        summarize: Facts for a contiguous run of strings and links
+        combine: Facts of a sequence of adjacent parts
+        min_chars: Smallest subtree (in visible characters) worth caching
+    """
+
+    def __init__(self, summarize: Callable[[Sequence[str], Sequence[Tuple[str, str]]], T],
+                 combine: Callable[[List[T]], T], min_chars: int = MIN_FRAGMENT_CHARS,
+                 maxsize: int = MAX_CACHED_FRAGMENTS):
+        self._summarize = summarize
+        self._combine = combine
+        self.min_chars = min_chars
+        self.maxsize = maxsize
+        # digest -> [facts, tag, chars, links, hits, preview]
+        self._fragments: Dict[bytes, list] = {}
+        # Digests seen once; facts are kept from the second sighting on
+        self._seen: Dict[bytes, None] = {}
+        self.stats = {
+            "documents": 0,
+            "elements": 0,
+            "hits": 0,
+            "misses": 0,
+            "text_chars": 0,
+            "text_chars_reused": 0,
+            "links": 0,
+            "links_reused": 0,
+            "seconds": 0.0,
+            "summarize_seconds": 0.0,
+            "summarized_chars": 0,
+        }
+
+    def _remember(self, table: Dict[bytes, Any], digest: bytes, value: Any) -> None:
+        if len(table) >= self.maxsize:
+            table.pop(next(iter(table)))
+        table[digest] = value
+
+    def _run(self, strings: Sequence[str], links: Sequence[Tuple[str, str]]) -> T:
+        started = time.perf_counter()
+        result = self._summarize(strings, links)
+        self.stats["summarize_seconds"] += time.perf_counter() - started
+        self.stats["summarized_chars"] += sum(map(len, strings))
+        return result
+
+    def summarize(self, facts) -> T:
+        """Facts for a whole document, reusing every subtree seen earlier in the run."""
+        started = time.perf_counter()
+        stats = self.stats
+        strings, links, spans, tags = facts.strings, facts.links, facts.element_spans, facts.element_tags
+        parents = facts.element_parents
+        digests, children, roots = subtree_digests(facts)
+        count = len(digests)
+
+        # Prefix sums of string lengths give any subtree's text size in O(1)
+        offsets = [0]
+        for text in strings:
+            offsets.append(offsets[-1] + len(text))
+
+        # Elements (in document order) that are cached, or already seen once, or inside a hit
+        cacheable = [offsets[end] - offsets[first] >= self.min_chars for first, end, _, _ in spans]
+        entries = [self._fragments.get(digests[i]) if cacheable[i] else None for i in range(count)]
+        known = [entries[i] is not None or (cacheable[i] and digests[i] in self._seen) for i in range(count)]
+        inside = [False] * count
+        for index in range(count):
+            parent = parents[index]
+            inside[index] = parent >= 0 and (inside[parent] or entries[parent] is not None)
+
+        # Only elements holding something known are taken apart; all other
+        # content is summarized in maximal contiguous runs
+        useful = [False] * count
+        for index in range(count - 1, -1, -1):
+            if known[index] or useful[index]:
+                useful[index] = True
+                if parents[index] >= 0:
+                    useful[parents[index]] = True
+
+        def span(node: int) -> Tuple[int, int, int, int]:
+            return (0, len(strings), 0, len(links)) if node == _DOCUMENT else tuple(spans[node])
+
+        def store(node: int, result: T) -> None:
+            first, end, link_first, link_end = spans[node]
+            self._seen.pop(digests[node], None)
+            self._remember(self._fragments, digests[node],
+                           [result, tags[node], offsets[end] - offsets[first], link_end - link_first, 0,
+                            self._preview(strings[first:end])])
+
+        results: Dict[int, T] = {}
+        expand: List[int] = []  # elements to combine from their parts, parents before children
+        stack = [_DOCUMENT]
+        while stack:
+            node = stack.pop()
+            if node != _DOCUMENT:
+                first, end, link_first, link_end = spans[node]
+                entry = entries[node]
+                if entry is not None:
+                    entry[4] += 1
+                    results[node] = entry[0]
+                    stats["hits"] += 1
+                    stats["text_chars_reused"] += offsets[end] - offsets[first]
+                    stats["links_reused"] += link_end - link_first
+                    continue
+                if known[node]:
+                    # Second sighting: keep its facts from now on
+                    results[node] = self._run(strings[first:end], links[link_first:link_end])
+                    store(node, results[node])
+                    continue
+            expand.append(node)
+            stack.extend(child for child in (children[node] if node != _DOCUMENT else roots) if useful[child])
+
+        for node in reversed(expand):
+            first, end, link_first, link_end = span(node)
+            parts: List[T] = []
+            cursor, link_cursor = first, link_first
+            for child in (children[node] if node != _DOCUMENT else roots):
+                if not useful[child]:
+                    continue
+                child_first, child_end, child_link_first, child_link_end = spans[child]
+                if cursor < child_first or link_cursor < child_link_first:
+                    parts.append(self._run(strings[cursor:child_first], links[link_cursor:child_link_first]))
+                parts.append(results[child])
+                cursor, link_cursor = child_end, child_link_end
+            if cursor < end or link_cursor < link_end or not parts:
+                parts.append(self._run(strings[cursor:end], links[link_cursor:link_end]))
+            results[node] = parts[0] if len(parts) == 1 else self._combine(parts)
+
+        for index in range(count):
+            if cacheable[index] and not inside[index] and entries[index] is None:
+                stats["misses"] += 1
+                if not known[index]:
+                    self._remember(self._seen, digests[index], None)
+
+        stats["documents"] += 1
+        stats["elements"] += count
+        stats["text_chars"] += offsets[-1]
+        stats["links"] += len(links)
+        stats["seconds"] += time.perf_counter() - started
+        return results[_DOCUMENT]
+
+    @staticmethod
+    def _preview(strings: Sequence[str]) -> str:
+        return " ".join("".join(strings).split())[:PREVIEW_CHARS]
+
+    def report(self, top: int = TOP_FRAGMENTS) -> Dict[str, Any]:
+        """Work saved so far, and the shared fragments that saved the most."""
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["seconds"] = round(stats["seconds"], 4)
+        stats["summarize_seconds"] = round(stats["summarize_seconds"], 4)
+        stats["fragments_cached"] = len(self._fragments)
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["text_reused_pct"] = (round(100 * stats["text_chars_reused"] / stats["text_chars"], 1)
+                                    if stats["text_chars"] else 0.0)
+        stats["links_reused_pct"] = (round(100 * stats["links_reused"] / stats["links"], 1)
+                                     if stats["links"] else 0.0)
+        shared = sorted(
+            (item for item in self._fragments.items() if item[1][4]),
+            key=lambda item: item[1][2] * item[1][4], reverse=True
+        )
+        stats["top_fragments"] = [
+            {"digest": digest.hex()[:12], "tag": tag, "chars": chars, "links": link_count,
+             "reuses": hits, "preview": preview}
+            for digest, (_, tag, chars, link_count, hits, preview) in shared[:top]
+        ]
+        return stats
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Human-readable fragment cache report."""
+    lines = [
+        f"Fragment cache: {report['documents']} documents, {report['elements']} elements, "
+        f"{report['fragments_cached']} fragments cached",
+        f"  Lookups: {report['hits']} hits, {report['misses']} misses (hit rate {report['hit_rate']:.0%})",
+        f"  Text reused: {report['text_chars_reused']}/{report['text_chars']} chars ({report['text_reused_pct']}%)",
+        f"  Links reused: {report['links_reused']}/{report['links']} ({report['links_reused_pct']}%)",
+        f"  Time hashing and summarizing: {report['seconds'] * 1000:.1f} ms "
+        f"(of which summarizing {report['summarize_seconds'] * 1000:.1f} ms "
+        f"over {report['summarized_chars']} chars)",
+    ]
+    if report["top_fragments"]:
+        lines.append("Most reused fragments:")
+        for fragment in report["top_fragments"]:
+            lines.append(
+                f"  {fragment['reuses']:5d}x  <{fragment['tag']}> {fragment['chars']} chars, "
+                f"{fragment['links']} links  {fragment['preview']!r}"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+HTML Input Layer
+
+Reads templates as bytes instead of text. Files are memory-mapped, so the
+size checks use the byte length and the only copy of a large template is
+the page cache. The character encoding is sniffed the way browsers do it
+(byte order mark, then a <meta charset> or http-equiv declaration in the
+first 1024 bytes, then UTF-8 if the bytes are valid UTF-8 and Windows-1252
+if they are not). Parser backends consume the document in fixed-size
+decoded chunks rather than as one decoded string.
+
+Usage:
+    with open_html("email.html") as data:
+        results = analyze_html(data, "email.html")
+"""
+
+import codecs
+import mmap
+import re
+from contextlib import contextmanager
+from typing import Iterator, Tuple, Union
+
+
+# Bytes handed to a parser per feed
+CHUNK_SIZE = 64 * 1024
+
+# How far into the document a <meta> charset declaration is honoured (WHATWG prescan)
+PRESCAN_BYTES = 1024
+
+DEFAULT_ENCODING = "utf-8"
+FALLBACK_ENCODING = "cp1252"
+
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+
+_META_CHARSET_RE = re.compile(rb'<meta\b[^>]*?charset\s*=\s*["\']?\s*([A-Za-z0-9_.:\-]+)', re.IGNORECASE)
+
+# Labels browsers decode differently from Python's codec of the same name
+_LABEL_OVERRIDES = {
+    "ascii": "cp1252",
+    "latin_1": "cp1252",
+    "iso8859_1": "cp1252",
+    "iso8859_9": "cp1254",
+    "iso8859_11": "cp874",
+    "tis_620": "cp874",
+    "gb2312": "gb18030",
+    "gbk": "gb18030",
+    # A <meta> cannot switch to UTF-16; the document is ASCII-compatible if it got that far
+    "utf_16": "utf-8",
+    "utf_16_le": "utf-8",
+    "utf_16_be": "utf-8",
+}
+
+# Anything mmap/bytes-like; str input is accepted where noted
+ByteSource = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+def _codec_for_label(label: bytes) -> Union[str, None]:
+    try:
+        name = codecs.lookup(label.decode("ascii").strip().lower()).name
+    except (LookupError, UnicodeDecodeError):
+        return None
+    return _LABEL_OVERRIDES.get(name.replace("-", "_"), name)
+
+
+def _is_utf8(data: ByteSource) -> bool:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for offset in range(0, len(data), CHUNK_SIZE):
+            decoder.decode(data[offset:offset + CHUNK_SIZE])
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def sniff_charset(data: ByteSource) -> Tuple[str, int]:
+    """
+    Determine a document's encoding from its bytes.
+
+    Returns:
+        (Python codec name, length of the byte order mark to skip)
+    """
+    head = data[:PRESCAN_BYTES]
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding, len(bom)
+
+    match = _META_CHARSET_RE.search(head)
+    if match:
+        encoding = _codec_for_label(match.group(1))
+        if encoding:
+            return encoding, 0
+
+    return (DEFAULT_ENCODING if _is_utf8(data) else FALLBACK_ENCODING), 0
+
+
+class HtmlBytes:
+    """
+    An undecoded document and its sniffed encoding.
+
+    `data` is kept as given (typically an mmap); decoding happens chunk by
+    chunk while a parser consumes it.
+    """
+
+    __slots__ = ("data", "encoding", "offset")
+
+    def __init__(self, data: ByteSource):
+        self.data = data
+        self.encoding, self.offset = sniff_charset(data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+def text_chunks(source: Union[str, HtmlBytes], chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Decoded text of a document in chunks (undecodable bytes become U+FFFD)."""
+    if isinstance(source, str):
+        yield source
+        return
+    data = source.data
+    decoder = codecs.getincrementaldecoder(source.encoding)(errors="replace")
+    for offset in range(source.offset, len(data), chunk_size):
+        text = decoder.decode(data[offset:offset + chunk_size])
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def utf8_chunks(source: Union[str, HtmlBytes], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """UTF-8 bytes of a document in chunks; UTF-8 input is passed through undecoded."""
+    if isinstance(source, str):
+        for offset in range(0, len(source), chunk_size):
+            yield source[offset:offset + chunk_size].encode("utf-8")
+    elif source.encoding == "utf-8":
+        data = source.data
+        for offset in range(source.offset, len(data), chunk_size):
+            yield data[offset:offset + chunk_size]
+    else:
+        for text in text_chunks(source, chunk_size):
+            yield text.encode("utf-8")
+
+
+def read_text(source: Union[str, HtmlBytes]) -> str:
+    """The whole document decoded (for consumers that need one string)."""
+    return source if isinstance(source, str) else "".join(text_chunks(source))
+
+
+def byte_length(html: Union[str, ByteSource, HtmlBytes]) -> int:
+    """Size of a document as sent: byte length, or UTF-8 length for text."""
+    return len(html.encode("utf-8")) if isinstance(html, str) else len(html)
+
+
+@contextmanager
+def open_html(path: str, mapped: bool = True) -> Iterator[ByteSource]:
+    """
+    Map a file read-only for the duration of the block.
+
+    Empty files and non-mappable inputs (pipes, character devices) are
+    read into a bytes object instead, as are all files when `mapped` is
+    False. Truncating a mapped file while it is being read raises SIGBUS,
+    so callers racing with writers should not map.
+    """
+    with open(path, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if mapped else None
+        except (ValueError, OSError):
+            buffer = None
+        if buffer is None:
+            yield f.read()
+            return
+        with buffer:
+            yield buffer
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""
+HTML Parser Backends
+
+Extracts the document facts that analyze_email_html.py checks need (visible
+text, images, tables, meta names, links, preheader candidates and CSS
+sources) through interchangeable parser backends:
+
+    lxml             lxml.html driven directly (fastest when installed)
+    stdlib           html.parser event stream, no tree built (always available)
+    bs4-lxml         BeautifulSoup with lxml (the analyzer's original parser)
+    bs4-html.parser  BeautifulSoup with html.parser
+
+Every backend feeds the same FactsBuilder with start/end/text events, so
+checks never depend on a particular tree API. Documents may be given as
+text or as undecoded bytes (see html_input.py); lxml and stdlib consume
+bytes in chunks without building a decoded copy of the whole document. Auto-selection prefers lxml,
+then stdlib; EMAIL_HTML_PARSER or --parser pins a backend. --bench-parsers
+times each backend on a corpus and counts documents whose analysis differs
+from the BeautifulSoup reference, so deployments can pin the fastest correct
+one.
+
+Usage:
+    python analyze_email_html.py --bench-parsers templates/
+    EMAIL_HTML_PARSER=stdlib python analyze_email_html.py email.html
+"""
+
+import importlib.util
+import time
+from html.parser import HTMLParser
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from html_input import ByteSource, HtmlBytes, byte_length, read_text, text_chunks, utf8_chunks
+
+
+# Auto-selection order
+PARSER_PREFERENCE = ["lxml", "stdlib"]
+
+# Reference for --bench-parsers correctness, first available wins
+REFERENCE_PREFERENCE = ["bs4-lxml", "bs4-html.parser", "lxml", "stdlib"]
+
+# Elements whose text is not part of the rendered text (as in bs4 get_text)
+HIDDEN_TEXT_ELEMENTS = {"script", "style", "template"}
+
+# Elements that never have content (bs4's empty_element_tags)
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link",
+    "menuitem", "meta", "param", "source", "track", "wbr", "basefont", "bgsound",
+    "command", "frame", "image", "isindex", "nextid", "spacer",
+}
+
+PREHEADER_ELEMENTS = ("div", "span", "td")
+BODY_BLOCK_ELEMENTS = ("div", "span")
+
+
+class DocumentFacts:
+    """
+    Everything the analyzer checks read from a parsed document.
+
+    Attributes:
+        strings: Visible text nodes in document order
+        image_alts: alt attribute of each <img> (None when absent)
+        image_srcs: src attribute of each <img> ("" when absent)
+        image_widths: width attribute of each <img> (None when absent)
+        tables: Number of <table> elements
+        meta_names: name attribute of each <meta>
+        links: (href, text) for each <a>
+        preheader_tagged: Stripped text of the first div/span/td whose class
+            or id mentions "preheader" (None if there is none)
+        first_body_block: (style, stripped text) of the first div/span in
+            the first <body> (None if there is none)
+        css_sources: In document order, ("sheet", text) for <style> blocks,
+            ("inline", element_index, style) for style attributes and
+            ("hint", element_index, property, value) for presentational
+            attributes (bgcolor, <font color>)
+        element_parents: Parent element index of each element (-1 at top level)
+        element_tags: Tag name of each element
+        element_classes: class attribute by element index (only where set)
+        element_ids: id attribute by element index (only where set)
+        element_text: Visible text directly inside an element, by element
+            index (only elements with non-whitespace text)
+        element_spans: [first string, end string, first link, end link] of
+            each element's subtree, as slice bounds into strings and links
+    """
+
+    __slots__ = ("strings", "image_alts", "image_srcs", "image_widths", "tables", "meta_names",
+                 "links", "preheader_tagged", "first_body_block", "css_sources",
+                 "element_parents", "element_tags", "element_classes", "element_ids", "element_text",
+                 "element_spans")
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.image_alts: List[Optional[str]] = []
+        self.image_srcs: List[str] = []
+        self.image_widths: List[Optional[str]] = []
+        self.tables = 0
+        self.meta_names: List[str] = []
+        self.links: List[Tuple[str, str]] = []
+        self.preheader_tagged: Optional[str] = None
+        self.first_body_block: Optional[Tuple[str, str]] = None
+        self.css_sources: List[tuple] = []
+        self.element_parents: List[int] = []
+        self.element_tags: List[str] = []
+        self.element_classes: Dict[int, str] = {}
+        self.element_ids: Dict[int, str] = {}
+        self.element_text: Dict[int, str] = {}
+        self.element_spans: List[List[int]] = []
+
+    def get_text(self, separator: str = "", strip: bool = False) -> str:
+        """Same contract as BeautifulSoup's get_text on the whole document."""
+        if strip:
+            return separator.join(s.strip() for s in self.strings if s.strip())
+        return separator.join(self.strings)
+
+
+def _strip_join(parts: List[str]) -> str:
+    return "".join(part.strip() for part in parts if part.strip())
+
+
+class FactsBuilder:
+    """Consumes balanced start/end/text events and fills a DocumentFacts."""
+
+    def __init__(self):
+        self.facts = DocumentFacts()
+        self._depth = 0
+        self._hidden = 0
+        self._elements = 0
+        self._style: Optional[List[str]] = None
+        self._body_depth: Optional[int] = None
+        self._body_seen = False
+        self._preheader_open = False
+        self._block_open = False
+        # (depth, kind, payload, text parts)
+        self._collectors: List[list] = []
+        # Indices of the open elements, innermost last
+        self._open: List[int] = []
+
+    def start(self, name: str, attrs: Dict[str, str]) -> None:
+        facts = self.facts
+        index = self._elements
+        self._elements += 1
+        self._depth += 1
+
+        facts.element_parents.append(self._open[-1] if self._open else -1)
+        facts.element_tags.append(name)
+        facts.element_spans.append([len(facts.strings), 0, len(facts.links), 0])
+        if attrs.get("class"):
+            facts.element_classes[index] = attrs["class"]
+        if attrs.get("id"):
+            facts.element_ids[index] = attrs["id"]
+        self._open.append(index)
+
+        if name in HIDDEN_TEXT_ELEMENTS:
+            self._hidden += 1
+        if name == "style":
+            self._style = []
+        else:
+            if attrs.get("bgcolor"):
+                facts.css_sources.append(("hint", index, "background-color", attrs["bgcolor"]))
+            if name == "font" and attrs.get("color"):
+                facts.css_sources.append(("hint", index, "color", attrs["color"]))
+            if attrs.get("style"):
+                facts.css_sources.append(("inline", index, attrs["style"]))
+
+        if name == "img":
+            facts.image_alts.append(attrs.get("alt"))
+            facts.image_srcs.append(attrs.get("src", "").strip())
+            facts.image_widths.append(attrs.get("width"))
+        elif name == "table":
+            facts.tables += 1
+        elif name == "meta":
+            if "name" in attrs:
+                facts.meta_names.append(attrs["name"])
+        elif name == "a":
+            self._collectors.append([self._depth, "link", attrs.get("href", ""), []])
+        elif name == "body" and not self._body_seen:
+            self._body_seen = True
+            self._body_depth = self._depth
+
+        if (name in PREHEADER_ELEMENTS and facts.preheader_tagged is None and not self._preheader_open
+                and ("preheader" in attrs.get("class", "").lower()
+                     or "preheader" in attrs.get("id", "").lower())):
+            self._preheader_open = True
+            self._collectors.append([self._depth, "preheader", None, []])
+
+        if (name in BODY_BLOCK_ELEMENTS and self._body_depth is not None
+                and facts.first_body_block is None and not self._block_open):
+            self._block_open = True
+            self._collectors.append([self._depth, "block", attrs.get("style", ""), []])
+
+    def text(self, data: str) -> None:
+        if self._style is not None:
+            self._style.append(data)
+            return
+        if self._hidden:
+            return
+        self.facts.strings.append(data)
+        for collector in self._collectors:
+            collector[3].append(data)
+        if self._open and data and not data.isspace():
+            element_text = self.facts.element_text
+            index = self._open[-1]
+            element_text[index] = element_text.get(index, "") + data
+
+    def end(self, name: str) -> None:
+        facts = self.facts
+        while self._collectors and self._collectors[-1][0] == self._depth:
+            _, kind, payload, parts = self._collectors.pop()
+            if kind == "link":
+                facts.links.append((payload, "".join(parts)))
+            elif kind == "preheader":
+                facts.preheader_tagged = _strip_join(parts)
+                self._preheader_open = False
+            else:
+                facts.first_body_block = (payload, _strip_join(parts))
+                self._block_open = False
+
+        if self._depth == self._body_depth:
+            self._body_depth = None
+        if name in HIDDEN_TEXT_ELEMENTS:
+            self._hidden -= 1
+        if name == "style" and self._style is not None:
+            facts.css_sources.append(("sheet", "".join(self._style)))
+            self._style = None
+        span = facts.element_spans[self._open.pop()]
+        span[1] = len(facts.strings)
+        span[3] = len(facts.links)
+        self._depth -= 1
+
+
+class _StdlibEventParser(HTMLParser):
+    """html.parser tokenizer mapped to balanced events with bs4's nesting rules."""
+
+    def __init__(self, builder: FactsBuilder):
+        super().__init__(convert_charrefs=True)
+        self.builder = builder
+        self.open: List[str] = []
+        # html.parser may split one text node (at a stray "<" or a feed
+        # boundary); bs4 joins the pieces, so they are buffered until the
+        # next markup event
+        self._text: List[str] = []
+
+    def _flush_text(self):
+        if self._text:
+            self.builder.text("".join(self._text))
+            self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        self.builder.start(tag, {key: value or "" for key, value in attrs})
+        if tag in VOID_ELEMENTS:
+            self.builder.end(tag)
+        else:
+            self.open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush_text()
+        self.builder.start(tag, {key: value or "" for key, value in attrs})
+        self.builder.end(tag)
+
+    def handle_endtag(self, tag):
+        # Close up to the most recent matching open element; stray end tags are ignored
+        self._flush_text()
+        if tag in self.open:
+            while self.open:
+                name = self.open.pop()
+                self.builder.end(name)
+                if name == tag:
+                    break
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+
+    handle_decl = handle_pi = handle_comment
+
+    def unknown_decl(self, data):
+        self._flush_text()
+        if data.upper().startswith("CDATA["):
+            # bs4 keeps CDATA sections as their own text node
+            self.builder.text(data[len("CDATA["):])
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        while self.open:
+            self.builder.end(self.open.pop())
+
+
+def _parse_stdlib(html: Union[str, HtmlBytes]) -> DocumentFacts:
+    builder = FactsBuilder()
+    parser = _StdlibEventParser(builder)
+    for chunk in text_chunks(html):
+        parser.feed(chunk)
+    parser.close()
+    return builder.facts
+
+
+class _ChunkReader:
+    """File-like view of a chunk iterator, for lxml's pull parser."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def read(self, size: int = -1) -> bytes:
+        return next(self._chunks, b"")
+
+
+def _parse_lxml(html: Union[str, HtmlBytes]) -> DocumentFacts:
+    import lxml.html
+
+    builder = FactsBuilder()
+    root = lxml.html.parse(
+        _ChunkReader(utf8_chunks(html)), parser=lxml.html.HTMLParser(encoding="utf-8")
+    ).getroot()
+    if root is None:
+        return builder.facts  # empty document
+
+    def open_element(element) -> None:
+        builder.start(element.tag, dict(element.attrib))
+        if element.text:
+            builder.text(element.text)
+
+    open_element(root)
+    stack = [(root, iter(root))]
+    while stack:
+        element, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            builder.end(element.tag)
+            if element.tail and stack:
+                builder.text(element.tail)
+        elif isinstance(child.tag, str):
+            open_element(child)
+            stack.append((child, iter(child)))
+        elif child.tail:
+            # Comments and processing instructions only contribute their tail
+            builder.text(child.tail)
+    return builder.facts
+
+
+def _parse_bs4(html: Union[str, HtmlBytes], features: str) -> DocumentFacts:
+    from bs4 import BeautifulSoup
+    from bs4.element import CData, NavigableString, PreformattedString, Tag
+
+    builder = FactsBuilder()
+    soup = BeautifulSoup(read_text(html), features)
+    stack = [(None, iter(soup.children))]
+    while stack:
+        name, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            if name is not None:
+                builder.end(name)
+        elif isinstance(child, Tag):
+            attrs = {key: " ".join(value) if isinstance(value, list) else value
+                     for key, value in child.attrs.items()}
+            builder.start(child.name, attrs)
+            stack.append((child.name, iter(child.children)))
+        elif isinstance(child, NavigableString) and (
+                isinstance(child, CData) or not isinstance(child, PreformattedString)):
+            builder.text(str(child))
+    return builder.facts
+
+
+PARSER_BACKENDS: Dict[str, Tuple[Callable[[Union[str, HtmlBytes]], DocumentFacts], Tuple[str, ...]]] = {
+    "lxml": (_parse_lxml, ("lxml",)),
+    "stdlib": (_parse_stdlib, ()),
+    "bs4-lxml": (lambda html: _parse_bs4(html, "lxml"), ("bs4", "lxml")),
+    "bs4-html.parser": (lambda html: _parse_bs4(html, "html.parser"), ("bs4",)),
+}
+
+
+def available_backends() -> List[str]:
+    """Backends whose modules are installed (checked without importing them)."""
+    return [
+        name for name, (_, modules) in PARSER_BACKENDS.items()
+        if all(importlib.util.find_spec(module) is not None for module in modules)
+    ]
+
+
+def select_backend(name: Optional[str] = None) -> str:
+    """
+    Resolve a backend name; None or "auto" picks the first available in
+    PARSER_PREFERENCE.
+
+    Raises:
+        ValueError: unknown or unavailable backend
+    """
+    available = available_backends()
+    if not name or name == "auto":
+        return next(backend for backend in PARSER_PREFERENCE if backend in available)
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown HTML parser backend '{name}' (choose from {', '.join(PARSER_BACKENDS)})")
+    if name not in available:
+        raise ValueError(f"HTML parser backend '{name}' is not installed")
+    return name
+
+
+def parse_facts(html: Union[str, ByteSource, HtmlBytes], backend: str) -> DocumentFacts:
+    """Parse a document (text, or bytes in any encoding) with the named backend."""
+    if not isinstance(html, (str, HtmlBytes)):
+        html = HtmlBytes(html)
+    return PARSER_BACKENDS[backend][0](html)
+
+
+def benchmark_parsers(documents: List[Tuple[str, Union[str, bytes]]],
+                      evaluate: Callable[[Union[str, bytes], DocumentFacts], Any],
+                      backends: Optional[List[str]] = None,
+                      repeat: int = 3) -> Dict[str, Any]:
+    """
+    Time each backend on a corpus and check it against the reference backend.
+
+    Args:
+        documents: (name, html) pairs; html may be text or bytes
+        evaluate: Turns (html, facts) into the analysis result being compared
+        backends: Backends to measure (default: all installed)
+        repeat: Timed passes per backend; the fastest is reported
+
+    Returns:
+        Dict with corpus size, reference backend, per-backend timings and
+        mismatch counts, and the fastest backend without mismatches
+    """
+    available = available_backends()
+    backends = [backend for backend in (backends or list(PARSER_BACKENDS)) if backend in available]
+    reference = next(backend for backend in REFERENCE_PREFERENCE if backend in available)
+    total_bytes = sum(byte_length(html) for _, html in documents)
+    # Sniff encodings once, outside the timed passes
+    sources = [html if isinstance(html, str) else HtmlBytes(html) for _, html in documents]
+
+    expected = [evaluate(html, parse_facts(source, reference))
+                for (_, html), source in zip(documents, sources)]
+
+    results = []
+    for backend in backends:
+        parse = PARSER_BACKENDS[backend][0]
+        best = float("inf")
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            for source in sources:
+                parse(source)
+            best = min(best, time.perf_counter() - start)
+
+        mismatched = [
+            name for (name, html), source, reference_result in zip(documents, sources, expected)
+            if evaluate(html, parse(source)) != reference_result
+        ]
+        results.append({
+            "backend": backend,
+            "seconds": round(best, 4),
+            "docs_per_second": round(len(documents) / best, 1) if best else None,
+            "mb_per_second": round(total_bytes / best / 1_000_000, 2) if best else None,
+            "mismatches": len(mismatched),
+            "mismatched_documents": mismatched[:10],
+        })
+
+    correct = [result for result in results if result["mismatches"] == 0]
+    return {
+        "documents": len(documents),
+        "bytes": total_bytes,
+        "reference": reference,
+        "results": sorted(results, key=lambda result: result["seconds"]),
+        "recommended": min(correct, key=lambda result: result["seconds"])["backend"] if correct else reference,
+    }
+
+
+def format_benchmark(report: Dict[str, Any]) -> str:
+    """Format benchmark results as a table."""
+    GREEN = "\033[92m"
+    RED = "\033[91m"
+    BOLD = "\033[1m"
+    RESET = "\033[0m"
+
+    output = [
+        f"\n{BOLD}Parser Benchmark{RESET}",
+        f"{report['documents']} documents, {report['bytes'] / 1024:.1f} KB, reference: {report['reference']}",
+        "",
+        f"  {'backend':<16} {'seconds':>9} {'docs/s':>10} {'MB/s':>8}  correctness",
+    ]
+    for result in report["results"]:
+        if result["mismatches"]:
+            status = f"{RED}{result['mismatches']} mismatched{RESET}"
+        else:
+            status = f"{GREEN}matches reference{RESET}"
+        output.append(
+            f"  {result['backend']:<16} {result['seconds']:>9.4f} {result['docs_per_second']:>10} "
+            f"{result['mb_per_second']:>8}  {status}"
+        )
+    output.append(f"\nRecommended: {report['recommended']} "
+                  f"(pin with --parser {report['recommended']} or EMAIL_HTML_PARSER={report['recommended']})")
+    return "\n".join(output)
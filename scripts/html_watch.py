@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+HTML Template Watcher
+
+Watches template directories and re-analyzes only the files that change,
+printing compact issue diffs (see html_baseline.py) as soon as a save lands.
+Changes are received from inotify on Linux, with a polling fallback
+elsewhere. Bursts of events from one save (write, chmod, rename) are
+debounced into a single re-analysis. The process stays warm, and results
+are cached by content hash, so re-saving an unchanged file costs one read.
+
+Usage:
+    python html_watch.py templates/
+    python analyze_email_html.py templates/ --watch
+    python html_watch.py templates/ --metrics-port 9109
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import select
+import struct
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from analyze_email_html import analyze_html
+from html_baseline import HTML_EXTENSIONS, diff_snapshots, format_diff, iter_html_files, snapshot
+from html_input import open_html
+from metrics import CACHE_REQUESTS, start_http_server
+
+
+# Quiet period that ends a burst of events, in seconds
+DEBOUNCE = 0.03
+POLL_INTERVAL = 0.25
+
+# Analyses kept by content hash (reverting an edit is a cache hit)
+MAX_CACHED_RESULTS = 1024
+
+# inotify(7) event bits
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_ISDIR = 0x40000000
+IN_Q_OVERFLOW = 0x4000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _is_template(path: str) -> bool:
+    return path.lower().endswith(HTML_EXTENSIONS)
+
+
+class InotifyWatcher:
+    """Recursive directory watcher on top of inotify(7) via ctypes."""
+
+    def __init__(self, roots: List[str]):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.roots = roots
+        self._dirs: Dict[int, str] = {}
+        for root in roots:
+            self._watch_tree(root)
+
+    def _watch_tree(self, root: str) -> None:
+        for dirpath, _, _ in os.walk(root):
+            wd = self._add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd >= 0:
+                self._dirs[wd] = dirpath
+
+    def changes(self, timeout: Optional[float]) -> Set[str]:
+        """Paths created, modified or removed within `timeout` seconds (None blocks)."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed: Set[str] = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    # Events were dropped; rescan everything
+                    changed.update(iter_html_files(self.roots))
+                    continue
+                directory = self._dirs.get(wd)
+                if directory is None:
+                    continue
+                path = os.path.join(directory, name) if name else directory
+                if mask & IN_DELETE_SELF:
+                    self._dirs.pop(wd, None)
+                elif mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self._watch_tree(path)
+                        changed.update(iter_html_files([path]))
+                else:
+                    changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback watcher that compares (size, mtime) snapshots."""
+
+    def __init__(self, roots: List[str], interval: float = POLL_INTERVAL):
+        self.roots = roots
+        self.interval = interval
+        self._stats = self._scan()
+
+    def _scan(self) -> Dict[str, tuple]:
+        stats = {}
+        for path in iter_html_files(self.roots):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stats[path] = (stat.st_size, stat.st_mtime_ns)
+        return stats
+
+    def changes(self, timeout: Optional[float]) -> Set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            time.sleep(self.interval if deadline is None else
+                       max(0.0, min(self.interval, deadline - time.monotonic())))
+            current = self._scan()
+            changed = {path for path in current.keys() | self._stats.keys()
+                       if current.get(path) != self._stats.get(path)}
+            self._stats = current
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self) -> None:
+        pass
+
+
+def create_watcher(roots: List[str], polling: bool = False):
+    """inotify where available, polling otherwise."""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(roots)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(roots)
+
+
+_CACHE_HIT = CACHE_REQUESTS.labels("html_watch", "hit")
+_CACHE_MISS = CACHE_REQUESTS.labels("html_watch", "miss")
+
+
+class TemplateWatcher:
+    """
+    Warm analyzer state for a set of templates.
+
+    Keeps the last snapshot and content hash per file; `refresh` re-analyzes
+    a file only when its content changed and returns the issue diff.
+    """
+
+    def __init__(self):
+        self.snapshots: Dict[str, Dict[str, Any]] = {}
+        self.hashes: Dict[str, str] = {}
+        self._by_hash: Dict[str, Dict[str, Any]] = {}
+
+    def refresh(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        Re-analyze one file.
+
+        Returns:
+            The diff against the previous snapshot (with "file" and
+            "elapsed_ms"), {"file", "removed": True} for deleted files, or
+            None if the content did not change
+        """
+        start = time.perf_counter()
+        try:
+            # Read, not mapped: the editor may rewrite the file mid-analysis
+            with open_html(path, mapped=False) as data:
+                content_hash = hashlib.sha256(data).hexdigest()
+                if self.hashes.get(path) == content_hash:
+                    return None
+                snap = self._by_hash.get(content_hash)
+                if snap is None:
+                    _CACHE_MISS.inc()
+                    snap = snapshot(analyze_html(data, path))
+                    if len(self._by_hash) >= MAX_CACHED_RESULTS:
+                        self._by_hash.pop(next(iter(self._by_hash)))
+                    self._by_hash[content_hash] = snap
+                else:
+                    _CACHE_HIT.inc()
+        except FileNotFoundError:
+            if self.snapshots.pop(path, None) is None:
+                return None
+            self.hashes.pop(path, None)
+            return {"file": path, "removed": True}
+        except OSError:
+            return None
+
+        previous = self.snapshots.get(path)
+        self.snapshots[path] = snap
+        self.hashes[path] = content_hash
+        diff = diff_snapshots(previous, snap)
+        diff["file"] = path
+        diff["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return diff
+
+
+def format_event(diff: Dict[str, Any], latency_ms: float) -> str:
+    """Format one re-analysis as a timestamped compact diff."""
+    stamp = datetime.now().strftime("%H:%M:%S")
+    if diff.get("removed"):
+        return f"{stamp} {diff['file']}: removed"
+    if not (diff["new"] or diff["resolved"] or diff["changed"] or diff["score_delta"]) \
+            and diff["previous_score"] is not None:
+        return f"{stamp} {diff['file']}: no issue changes (score {diff['score']}) [{latency_ms:.0f} ms]"
+    return f"{stamp} {format_diff(diff)} [{latency_ms:.0f} ms]"
+
+
+def watch(paths: List[str], polling: bool = False, debounce: float = DEBOUNCE,
+          metrics_port: Optional[int] = None) -> None:
+    """Analyze all templates under `paths`, then print diffs as files change."""
+    if metrics_port is not None:
+        start_http_server(metrics_port)
+    roots = [path if os.path.isdir(path) else os.path.dirname(os.path.abspath(path)) for path in paths]
+    directories = [os.path.abspath(path) for path in paths if os.path.isdir(path)]
+    # A file argument watches its directory but only reports that file
+    only = {os.path.abspath(path) for path in paths if not os.path.isdir(path)}
+
+    def wanted(path: str) -> bool:
+        if not _is_template(path):
+            return False
+        path = os.path.abspath(path)
+        return path in only or any(os.path.commonpath([root, path]) == root for root in directories)
+
+    state = TemplateWatcher()
+    start = time.perf_counter()
+    files = [path for path in dict.fromkeys(iter_html_files(roots)) if wanted(path)]
+    for path in files:
+        state.refresh(path)
+    high = sum(1 for snap in state.snapshots.values() for issue in snap["issues"] if issue[1] == "high")
+    watcher = create_watcher(roots, polling)
+    print(f"Watching {len(files)} templates via {type(watcher).__name__} "
+          f"({high} high-severity issues, initial analysis {(time.perf_counter() - start) * 1000:.0f} ms)",
+          flush=True)
+
+    try:
+        while True:
+            changed = watcher.changes(None)
+            first_event = time.perf_counter()
+            while True:
+                more = watcher.changes(debounce)
+                if not more:
+                    break
+                changed |= more
+            for path in sorted(changed):
+                if not wanted(path):
+                    continue
+                diff = state.refresh(path)
+                if diff is not None:
+                    print(format_event(diff, (time.perf_counter() - first_event) * 1000), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Watch HTML email templates and print issue diffs on save"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="Template files or directories"
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="Use stat polling instead of inotify"
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEBOUNCE * 1000,
+        help=f"Quiet period ending a burst of saves, in ms (default: {DEBOUNCE * 1000:.0f})"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve OpenMetrics at http://127.0.0.1:PORT/metrics"
+    )
+
+    args = parser.parse_args()
+    watch(args.paths, args.poll, args.debounce / 1000, args.metrics_port)
+
+
+if __name__ == "__main__":
+    main()
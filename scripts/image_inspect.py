@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Local Image Inspector
+
+Resolves <img src> values against the template's directory and an asset root
+(never outside them) and reads real dimensions from the file header only: the first 30 bytes for
+PNG, GIF and WebP, and the segment headers up to the SOF marker for JPEG
+(EXIF and other segments are skipped with seeks, not read). Byte weight
+comes from the same stat() that keys the cache, so an unchanged asset costs
+one stat per lookup.
+
+Usage:
+    python image_inspect.py images/hero.png images/logo.gif
+    python analyze_email_html.py template.html --asset-root assets/
+    EMAIL_ASSET_ROOT=assets/ python email_service.py
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from metrics import CACHE_REQUESTS
+
+
+HEADER_BYTES = 30
+
+# JPEG segments walked before giving up on finding the frame header
+MAX_JPEG_SEGMENTS = 256
+
+MAX_CACHED_IMAGES = 4096
+
+# Start-of-frame markers carrying the image size (not DHT/JPG/DAC: C4, C8, CC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class ImageInfo(NamedTuple):
+    """Header facts for one local image; format is None if unrecognized."""
+    path: str
+    format: Optional[str]
+    width: Optional[int]
+    height: Optional[int]
+    size_bytes: int
+
+
+def _jpeg_size(f) -> Optional[Tuple[int, int]]:
+    f.seek(2)
+    for _ in range(MAX_JPEG_SEGMENTS):
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        while code == 0xFF:  # fill bytes
+            byte = f.read(1)
+            if not byte:
+                return None
+            code = byte[0]
+        if code == 0xD8 or code == 0x01 or 0xD0 <= code <= 0xD7:
+            continue  # no length field
+        if code in (0xD9, 0xDA):
+            return None  # end of image / start of scan before any frame header
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if code in _JPEG_SOF:
+            frame = f.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack(">HH", frame[1:5])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+    return None
+
+
+def read_image_header(f) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    """
+    Identify an image from its header.
+
+    Args:
+        f: Binary file object positioned at the start
+
+    Returns:
+        (format, width, height); (None, None, None) if unrecognized
+    """
+    head = f.read(HEADER_BYTES)
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR" and len(head) >= 24:
+        width, height = struct.unpack(">II", head[16:24])
+        return "png", width, height
+    if head[:6] in (b"GIF87a", b"GIF89a") and len(head) >= 10:
+        width, height = struct.unpack("<HH", head[6:10])
+        return "gif", width, height
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP" and len(head) >= 30:
+        chunk = head[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", head[26:30])
+            return "webp", width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L" and head[20] == 0x2F:
+            bits = int.from_bytes(head[21:25], "little")
+            return "webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return ("webp", int.from_bytes(head[24:27], "little") + 1,
+                    int.from_bytes(head[27:30], "little") + 1)
+        return "webp", None, None
+    if head[:2] == b"\xff\xd8":
+        size = _jpeg_size(f)
+        return ("jpeg", size[0], size[1]) if size else ("jpeg", None, None)
+    return None, None, None
+
+
+def is_local_src(src: str) -> bool:
+    """True for relative or root-relative paths; False for URLs, data: and cid:."""
+    if not src or src.startswith("//"):
+        return False
+    return not urlsplit(src).scheme
+
+
+class ImageInspector:
+    """
+    Resolves and inspects local image sources, caching by path and mtime.
+
+    Args:
+        asset_root: Directory for root-relative sources ("/images/x.png") and
+            the fallback for relative ones not found next to the template
+    """
+
+    def __init__(self, asset_root: Optional[str] = None, maxsize: int = MAX_CACHED_IMAGES):
+        self.asset_root = os.path.abspath(asset_root) if asset_root else None
+        self.maxsize = maxsize
+        # path -> (mtime_ns, size, ImageInfo)
+        self._cache: Dict[str, Tuple[int, int, ImageInfo]] = {}
+
+    def candidates(self, src: str, base_dir: Optional[str] = None) -> List[str]:
+        """
+        Filesystem paths a local src may refer to, in lookup order.
+
+        Paths are resolved (including symlinks) and only kept inside the root
+        they were resolved against, so "../" cannot reach files outside the
+        asset root or the template's directory.
+        """
+        path = unquote(urlsplit(src).path)
+        if not path:
+            return []
+        if path.startswith("/"):
+            roots = [self.asset_root] if self.asset_root else []
+            path = path.lstrip("/")
+        else:
+            roots = [root for root in (base_dir, self.asset_root) if root]
+        candidates = []
+        for root in roots:
+            root = os.path.realpath(root)
+            candidate = os.path.realpath(os.path.join(root, path))
+            if os.path.commonpath([root, candidate]) == root:
+                candidates.append(candidate)
+        return candidates
+
+    def inspect_path(self, path: str) -> Optional[ImageInfo]:
+        """Header facts for a file, or None if it does not exist."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        cached = self._cache.get(path)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            _CACHE_HIT.inc()
+            return cached[2]
+        _CACHE_MISS.inc()
+
+        try:
+            with open(path, "rb") as f:
+                fmt, width, height = read_image_header(f)
+        except OSError:
+            return None
+        info = ImageInfo(path, fmt, width, height, st.st_size)
+        if len(self._cache) >= self.maxsize and path not in self._cache:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[path] = (st.st_mtime_ns, st.st_size, info)
+        return info
+
+    def inspect(self, src: str, base_dir: Optional[str] = None,
+                consulted: Optional[List[str]] = None) -> Optional[ImageInfo]:
+        """
+        Resolve a local src and inspect it; None if remote, not found or not an image.
+
+        Args:
+            consulted: If given, every path looked at is appended to it (the
+                files whose changes can change the result)
+        """
+        if not is_local_src(src):
+            return None
+        for path in self.candidates(src, base_dir):
+            if consulted is not None:
+                consulted.append(path)
+            info = self.inspect_path(path)
+            if info is not None and info.format is not None:
+                return info
+        return None
+
+
+_CACHE_HIT = CACHE_REQUESTS.labels("image_inspect", "hit")
+_CACHE_MISS = CACHE_REQUESTS.labels("image_inspect", "miss")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Print dimensions and byte weight of local images from their headers"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="Image files"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Output results as JSON"
+    )
+
+    args = parser.parse_args()
+    inspector = ImageInspector()
+    results = []
+    for path in args.paths:
+        info = inspector.inspect_path(path)
+        results.append(info._asdict() if info else {"path": path, "error": "not found"})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            if "error" in result:
+                print(f"{result['path']}: {result['error']}")
+            else:
+                dims = f"{result['width']}x{result['height']}" if result["width"] else "unknown size"
+                print(f"{result['path']}: {result['format'] or 'unrecognized'} {dims}, "
+                      f"{result['size_bytes'] / 1024:.1f} KB")
+    if any("error" in result for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
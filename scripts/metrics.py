@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+OpenMetrics Instrumentation
+
+Counters and histograms for the long-running modes (email_service.py,
+deliverability_monitor.py, html_watch.py), exposed as OpenMetrics text for
+Prometheus. Recording is an in-process lock and an add, so instrumentation
+stays on everywhere; nothing is rendered until a scrape.
+
+Pre-forked workers each record into their own registry. After `share()`
+every worker writes a snapshot into a common directory once a second, and a
+scrape served by any worker merges all snapshots, so /metrics reports the
+whole service rather than whichever process answered.
+
+Usage:
+    from metrics import DOCUMENTS, REGISTRY
+    DOCUMENTS.inc()
+    text = REGISTRY.exposition()
+
+    python deliverability_monitor.py example.com --metrics-port 9108
+    curl localhost:8025/metrics
+"""
+
+import glob
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Seconds between snapshot writes in shared (multi-process) mode
+SHARE_INTERVAL = 1.0
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+DNS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Gmail clips at 102KB; 80KB is the warning threshold
+SIZE_BUCKETS = (4096, 16384, 32768, 65536, 81920, 104448, 262144, 1048576)
+
+Labels = Tuple[str, ...]
+
+
+class _CounterValue:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def _reset(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def _reset(self) -> None:
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+
+class Metric:
+    """
+    A metric family; `labels(...)` returns the child that records values.
+
+    Children are created once per label set and can be bound at import time,
+    since `Registry.reset` zeroes them in place.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._children: Dict[Labels, Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def reset(self) -> None:
+        for child in self._children.values():
+            child._reset()
+
+    def snapshot(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterValue:
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"samples": [[list(labels), child.value] for labels, child in list(self._children.items())]}
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "buckets": list(self.buckets),
+            "samples": [[list(labels), [list(child.counts), child.sum]]
+                        for labels, child in list(self._children.items())],
+        }
+
+
+class DerivedGauge:
+    """A gauge computed at scrape time from the merged snapshot of other metrics."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...],
+                 compute: Callable[[Dict[str, Any]], Dict[Labels, float]]):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.compute = compute
+
+
+def merge_snapshots(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum per-process snapshots sample by sample."""
+    merged: Dict[str, Any] = {}
+    for snapshot in snapshots:
+        for name, family in snapshot.items():
+            target = merged.setdefault(name, {**family, "samples": {}})
+            for labels, value in family["samples"]:
+                key = tuple(labels)
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = value
+                elif isinstance(value, list):
+                    counts, total = current
+                    target["samples"][key] = [[a + b for a, b in zip(counts, value[0])], total + value[1]]
+                else:
+                    target["samples"][key] = current + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _label_text(names: Tuple[str, ...], values: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return "NaN" if math.isnan(value) else ("+Inf" if value > 0 else "-Inf")
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """The set of metrics a process exposes."""
+
+    def __init__(self):
+        self.metrics: List[Any] = []
+        self._share_dir: Optional[str] = None
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def derived_gauge(self, name: str, help: str, labelnames: Tuple[str, ...],
+                      compute: Callable[[Dict[str, Any]], Dict[Labels, float]]) -> DerivedGauge:
+        metric = DerivedGauge(name, help, labelnames, compute)
+        self.metrics.append(metric)
+        return metric
+
+    def reset(self) -> None:
+        """Zero every value (e.g. in a forked worker, to drop the parent's warm-up)."""
+        for metric in self.metrics:
+            if isinstance(metric, Metric):
+                metric.reset()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            metric.name: {"type": metric.kind, **metric.snapshot()}
+            for metric in self.metrics if isinstance(metric, Metric)
+        }
+
+    def share(self, directory: str, interval: float = SHARE_INTERVAL) -> None:
+        """Publish this process's snapshot to `directory` every `interval` seconds."""
+        self._share_dir = directory
+
+        def publish() -> None:
+            while True:
+                time.sleep(interval)
+                self._publish()
+
+        threading.Thread(target=publish, daemon=True).start()
+
+    def _publish(self) -> None:
+        path = os.path.join(self._share_dir, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def collect(self) -> Dict[str, Any]:
+        """Merged snapshot: this process, or every sharing process."""
+        if self._share_dir is None:
+            return merge_snapshots([self.snapshot()])
+        self._publish()
+        snapshots = []
+        for path in glob.glob(os.path.join(self._share_dir, "*.json")):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return merge_snapshots(snapshots)
+
+    def exposition(self) -> str:
+        """Render all metrics in the OpenMetrics text format."""
+        merged = self.collect()
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.append(f"# HELP {metric.name} {_escape(metric.help)}")
+            if isinstance(metric, DerivedGauge):
+                for labels, value in sorted(metric.compute(merged).items()):
+                    lines.append(f"{metric.name}{_label_text(metric.labelnames, labels)} {_number(value)}")
+                continue
+
+            samples = merged.get(metric.name, {}).get("samples", {})
+            for labels, value in sorted(samples.items()):
+                if isinstance(metric, Counter):
+                    lines.append(f"{metric.name}_total{_label_text(metric.labelnames, labels)} {_number(value)}")
+                    continue
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(list(metric.buckets) + [math.inf], counts):
+                    cumulative += count
+                    le = f'le="{_number(bound)}"' if bound != math.inf else 'le="+Inf"'
+                    lines.append(f"{metric.name}_bucket{_label_text(metric.labelnames, labels, le)} {cumulative}")
+                lines.append(f"{metric.name}_count{_label_text(metric.labelnames, labels)} {cumulative}")
+                lines.append(f"{metric.name}_sum{_label_text(metric.labelnames, labels)} {_number(total)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+def _cache_hit_ratios(merged: Dict[str, Any]) -> Dict[Labels, float]:
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), value in merged.get("email_cache_requests", {}).get("samples", {}).items():
+        hits_and_total = totals.setdefault(cache, [0.0, 0.0])
+        hits_and_total[1] += value
+        if result == "hit":
+            hits_and_total[0] += value
+    return {(cache,): hits / total for cache, (hits, total) in totals.items() if total}
+
+
+REGISTRY = Registry()
+
+DOCUMENTS = REGISTRY.counter("email_documents", "HTML documents analyzed")
+SUBJECTS = REGISTRY.counter("email_subjects", "Subject lines scored")
+DOMAINS = REGISTRY.counter("email_domains", "Domains checked for deliverability")
+ISSUES = REGISTRY.counter("email_issues", "Issues reported, by check and severity", ("check", "severity"))
+CHECK_DURATION = REGISTRY.histogram(
+    "email_check_duration_seconds", "Time spent in each HTML analysis step", ("check",), LATENCY_BUCKETS
+)
+DOCUMENT_SIZE = REGISTRY.histogram(
+    "email_document_size_bytes", "Size of analyzed HTML documents", (), SIZE_BUCKETS
+)
+CACHE_REQUESTS = REGISTRY.counter("email_cache_requests", "Cache lookups by cache and result", ("cache", "result"))
+CACHE_HIT_RATIO = REGISTRY.derived_gauge(
+    "email_cache_hit_ratio", "Share of cache lookups that hit", ("cache",), _cache_hit_ratios
+)
+DNS_QUERY_DURATION = REGISTRY.histogram(
+    "email_dns_query_duration_seconds", "DNS query latency for answered queries", ("type",), DNS_LATENCY_BUCKETS
+)
+DNS_TIMEOUTS = REGISTRY.counter("email_dns_timeouts", "DNS query attempts that timed out", ("type",))
+
+
+def start_http_server(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> "ThreadingHTTPServer":
+    """Serve GET /metrics from a daemon thread; returns the server (port 0 picks one)."""
+    # Imported here: http.server is most of this module's import time, and
+    # the short-lived CLIs that record metrics never serve them
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.exposition().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Rule Dictionaries
+
+The phrase and pattern lists the analyzers match against (spam triggers,
+power words, link shorteners, MX provider patterns) live in versioned JSON
+dictionaries: rule_dictionaries.json ships with the scripts, and
+EMAIL_RULE_DICTIONARIES adds further files (os.pathsep-separated, e.g. an
+in-house list per locale) whose entries extend it in order.
+
+Each list is compiled into a PhraseIndex, a hashed prefix index whose
+matching cost grows with the text rather than with the dictionary. The
+compiled rule set is marshalled to a cache file per list of dictionary
+paths (EMAIL_RULE_CACHE, default __pycache__ next to this module) together
+with the files' size and mtime, so later processes load the prebuilt indexes
+after a stat per file instead of parsing and indexing thousands of phrases;
+editing any dictionary changes its stat, and a changed content hash
+rebuilds. RULES is loaded once at import, so forked workers share it
+read-only, and spawned workers load the same cache file.
+
+Usage (library):
+    from rule_dictionaries import RULES
+    RULES.spam_trigger_index.find(subject.lower())
+
+Usage (CLI):
+    python rule_dictionaries.py
+    python rule_dictionaries.py rules-de.json --match "Jetzt kaufen und gratis testen"
+"""
+
+# Only what a cache hit needs is imported here; RULES loads at import time
+# of every analyzer and of the pre-send hook, so the rest (typing included:
+# annotations use builtin generics) is imported by the code paths that use it
+import marshal
+import os
+import sys
+
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rule_dictionaries.json")
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__")
+
+# Phrase lists (matched against lowercased text) and pattern lists (matched as given)
+PHRASE_SECTIONS = ("spam_triggers", "power_words")
+PATTERN_SECTIONS = ("link_shorteners",)
+MAPPING_SECTIONS = ("mx_providers",)
+
+# Leading characters a phrase is indexed by
+KEY_CHARS = 4
+
+# Bumped whenever the compiled layout changes, so stale caches are ignored
+MATCHER_FORMAT = 1
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def is_whole_word(text: str, start: int, end: int) -> bool:
+    """True if text[start:end] has a word boundary (as regex \\b) at both ends."""
+    before = start > 0 and _is_word_char(text[start - 1])
+    after = end < len(text) and _is_word_char(text[end])
+    return (before != _is_word_char(text[start])) and (after != _is_word_char(text[end - 1]))
+
+
+def contains_word(text: str, word: str) -> bool:
+    """Same as re.search(rf'\\b{word}\\b', text) for a word without regex syntax."""
+    start = text.find(word)
+    while start >= 0:
+        if is_whole_word(text, start, start + len(word)):
+            return True
+        start = text.find(word, start + 1)
+    return False
+
+
+class PhraseIndex:
+    """
+    Finds which of a list of phrases occur in a text.
+
+    Phrases are bucketed by their first KEY_CHARS characters (shorter ones by
+    themselves). A text is scanned once per key length in use, looking up
+    the slice at each position; only phrases in a hit bucket are compared.
+
+    Args:
+        phrases: Phrases in priority order; duplicates and empty strings are dropped
+        whole_words: Require a word boundary at both ends of a match
+    """
+
+    def __init__(self, phrases: list[str], whole_words: bool = False):
+        self.phrases = list(dict.fromkeys(phrase for phrase in phrases if phrase))
+        self.whole_words = whole_words
+        buckets: dict[str, list[int]] = {}
+        for rank, phrase in enumerate(self.phrases):
+            buckets.setdefault(phrase[:KEY_CHARS], []).append(rank)
+        self._buckets = {key: tuple(ranks) for key, ranks in buckets.items()}
+        self._key_lengths = tuple(sorted({len(key) for key in self._buckets}))
+
+    def __len__(self) -> int:
+        return len(self.phrases)
+
+    def __contains__(self, phrase: str) -> bool:
+        return self.rank(phrase) is not None
+
+    def rank(self, phrase: str) -> int | None:
+        """Position of a phrase in the list, or None."""
+        for rank in self._buckets.get(phrase[:KEY_CHARS], ()):
+            if self.phrases[rank] == phrase:
+                return rank
+        return None
+
+    def _matches(self, text: str, first_only: bool) -> list[int]:
+        found: list[int] = []
+        get = self._buckets.get
+        phrases = self.phrases
+        for length in self._key_lengths:
+            for start in range(len(text) - length + 1):
+                ranks = get(text[start:start + length])
+                if not ranks:
+                    continue
+                for rank in ranks:
+                    phrase = phrases[rank]
+                    if text.startswith(phrase, start) and rank not in found and (
+                            not self.whole_words or is_whole_word(text, start, start + len(phrase))):
+                        found.append(rank)
+                        if first_only:
+                            return found
+        found.sort()
+        return found
+
+    def find(self, text: str) -> list[str]:
+        """Phrases present in `text`, in list order."""
+        return [self.phrases[rank] for rank in self._matches(text, False)]
+
+    def contains(self, text: str) -> bool:
+        """True if any phrase is present in `text`."""
+        return bool(self._matches(text, True))
+
+    def state(self) -> tuple:
+        return (self.phrases, self.whole_words, self._buckets, self._key_lengths)
+
+    @classmethod
+    def from_state(cls, state: tuple) -> "PhraseIndex":
+        index = cls.__new__(cls)
+        index.phrases, index.whole_words, index._buckets, index._key_lengths = state
+        return index
+
+
+class RuleSet:
+    """
+    A merged rule dictionary and its compiled indexes.
+
+    Attributes:
+        version: Dictionary versions, "+"-joined in load order
+        fingerprint: Content hash of the source dictionaries
+        spam_trigger_index, power_word_index, link_shortener_index, mx_provider_index
+    """
+
+    def __init__(self, version: str, fingerprint: str, mx_providers: dict[str, str],
+                 indexes: dict[str, PhraseIndex]):
+        self.version = version
+        self.fingerprint = fingerprint
+        self.mx_providers = mx_providers
+        self.spam_trigger_index = indexes["spam_triggers"]
+        self.power_word_index = indexes["power_words"]
+        self.link_shortener_index = indexes["link_shorteners"]
+        self.mx_provider_index = indexes["mx_providers"]
+
+    @property
+    def spam_triggers(self) -> list[str]:
+        return self.spam_trigger_index.phrases
+
+    @property
+    def power_words(self) -> list[str]:
+        return self.power_word_index.phrases
+
+    @property
+    def link_shorteners(self) -> list[str]:
+        return self.link_shortener_index.phrases
+
+    def mx_provider(self, host: str) -> str | None:
+        """Provider of the first MX pattern (in dictionary order) found in `host`."""
+        patterns = self.mx_provider_index.find(host)
+        return self.mx_providers[patterns[0]] if patterns else None
+
+    @classmethod
+    def build(cls, dictionary: dict, fingerprint: str) -> "RuleSet":
+        indexes = {
+            "spam_triggers": PhraseIndex(dictionary["spam_triggers"]),
+            "power_words": PhraseIndex(dictionary["power_words"], whole_words=True),
+            "link_shorteners": PhraseIndex(dictionary["link_shorteners"]),
+            "mx_providers": PhraseIndex(dictionary["mx_providers"]),
+        }
+        return cls(dictionary["version"], fingerprint, dict(dictionary["mx_providers"]), indexes)
+
+    def state(self) -> tuple:
+        return (MATCHER_FORMAT, self.version, self.fingerprint, self.mx_providers, {
+            "spam_triggers": self.spam_trigger_index.state(),
+            "power_words": self.power_word_index.state(),
+            "link_shorteners": self.link_shortener_index.state(),
+            "mx_providers": self.mx_provider_index.state(),
+        })
+
+    @classmethod
+    def from_state(cls, state: tuple) -> "RuleSet":
+        layout, version, fingerprint, mx_providers, indexes = state
+        if layout != MATCHER_FORMAT:
+            raise ValueError(f"Compiled rules use format {layout}, expected {MATCHER_FORMAT}")
+        return cls(version, fingerprint, mx_providers,
+                   {name: PhraseIndex.from_state(index) for name, index in indexes.items()})
+
+
+def rule_dictionary_paths() -> list[str]:
+    """The bundled dictionary followed by the files named in EMAIL_RULE_DICTIONARIES."""
+    extra = os.environ.get("EMAIL_RULE_DICTIONARIES", "")
+    return [DEFAULT_RULES_PATH] + [path for path in extra.split(os.pathsep) if path]
+
+
+def parse_rule_dictionary(source: bytes, path: str, base: bool) -> dict:
+    """
+    Parse and check one dictionary file.
+
+    Raises:
+        ValueError: invalid JSON, missing version (or, for the base
+            dictionary, a missing section), or entries of the wrong type
+    """
+    import json
+
+    try:
+        dictionary = json.loads(source)
+    except ValueError as e:
+        raise ValueError(f"Rule dictionary {path} is not valid JSON: {e}") from None
+    if not isinstance(dictionary, dict) or not isinstance(dictionary.get("version"), str):
+        raise ValueError(f"Rule dictionary {path} missing 'version'")
+    for section in PHRASE_SECTIONS + PATTERN_SECTIONS + MAPPING_SECTIONS:
+        if section not in dictionary:
+            if base:
+                raise ValueError(f"Rule dictionary {path} missing '{section}'")
+            continue
+        entries = dictionary[section]
+        if section in MAPPING_SECTIONS:
+            valid = isinstance(entries, dict) and all(isinstance(value, str) for value in entries.values())
+        else:
+            valid = isinstance(entries, list) and all(isinstance(entry, str) for entry in entries)
+        if not valid:
+            kind = "an object of strings" if section in MAPPING_SECTIONS else "a list of strings"
+            raise ValueError(f"Rule dictionary {path}: '{section}' must be {kind}")
+    return dictionary
+
+
+def merge_rule_dictionaries(dictionaries: list[dict]) -> dict:
+    """Extend the first dictionary with the entries of the rest, in order."""
+    merged: dict = {"version": "+".join(dictionary["version"] for dictionary in dictionaries)}
+    for section in PHRASE_SECTIONS + PATTERN_SECTIONS:
+        entries = (entry for dictionary in dictionaries for entry in dictionary.get(section, []))
+        if section in PHRASE_SECTIONS:
+            entries = (entry.lower() for entry in entries)
+        merged[section] = list(dict.fromkeys(entries))
+    for section in MAPPING_SECTIONS:
+        merged[section] = {}
+        for dictionary in dictionaries:
+            merged[section].update(dictionary.get(section, {}))
+    return merged
+
+
+def _cache_path(cache_dir: str, paths: list[str]) -> str:
+    import zlib
+
+    key = "\0".join([f"{MATCHER_FORMAT}:{marshal.version}:{sys.version_info[:2]}"]
+                     + [os.path.abspath(path) for path in paths])
+    return os.path.join(cache_dir, f"rules-{zlib.crc32(key.encode('utf-8')):08x}.marshal")
+
+
+def _source_stats(paths: list[str]) -> list[tuple]:
+    stats = []
+    for path in paths:
+        stat = os.stat(path)
+        stats.append((stat.st_size, stat.st_mtime_ns))
+    return stats
+
+
+def load_rules(paths: list[str] | None = None, cache_dir: str | None = None,
+               use_cache: bool = True) -> RuleSet:
+    """
+    Load the compiled rule set for a list of dictionary files.
+
+    The cache file for the list of paths is loaded if the files' size and
+    mtime match the ones it was built from. Otherwise the files are read and
+    hashed: a cache built from the same contents is kept, anything else is
+    parsed, merged and compiled, and the result is cached (best effort: an
+    unwritable cache is skipped). A cache hit therefore costs a stat per file.
+
+    Raises:
+        OSError: a dictionary file cannot be read
+        ValueError: a dictionary is invalid (see parse_rule_dictionary)
+    """
+    paths = paths or rule_dictionary_paths()
+    cache_dir = cache_dir or os.environ.get("EMAIL_RULE_CACHE") or DEFAULT_CACHE_DIR
+    stats = _source_stats(paths)
+    cache_path = _cache_path(cache_dir, paths)
+
+    cached = None
+    if use_cache:
+        try:
+            with open(cache_path, "rb") as f:
+                cached_stats, state = marshal.loads(f.read())
+            cached = RuleSet.from_state(state)
+        except (OSError, EOFError, ValueError, TypeError, KeyError):
+            pass
+        else:
+            if cached_stats == stats:
+                return cached
+
+    import hashlib
+
+    sources = []
+    for path in paths:
+        with open(path, "rb") as f:
+            sources.append(f.read())
+    digest = hashlib.sha256(f"{MATCHER_FORMAT}:{marshal.version}:{sys.version_info[:2]}".encode("ascii"))
+    for source in sources:
+        digest.update(b"%d:" % len(source))
+        digest.update(source)
+    fingerprint = digest.hexdigest()[:20]
+
+    if cached is not None and cached.fingerprint == fingerprint:
+        rules = cached  # touched but not edited: only the stats are refreshed
+    else:
+        dictionaries = [parse_rule_dictionary(source, path, index == 0)
+                        for index, (source, path) in enumerate(zip(sources, paths))]
+        rules = RuleSet.build(merge_rule_dictionaries(dictionaries), fingerprint)
+    if use_cache:
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(marshal.dumps((stats, rules.state())))
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+    return rules
+
+
+try:
+    RULES = load_rules()
+except (OSError, ValueError) as e:
+    print(f"WARNING: {e} - using the bundled rule dictionary only", file=sys.stderr)
+    RULES = load_rules([DEFAULT_RULES_PATH])
+
+
+def format_human_readable(report: dict) -> str:
+    lines = [
+        f"Rule dictionaries {report['version']} (fingerprint {report['fingerprint']})",
+        *(f"  {path}" for path in report["paths"]),
+        f"  Cold build: {report['build_ms']:.1f} ms; cached load: {report['cached_ms']:.1f} ms",
+        f"  Cache: {report['cache_file']}",
+    ]
+    for section, count in report["entries"].items():
+        lines.append(f"  {section:<16} {count:6d} entries")
+    if "matches" in report:
+        lines.append(f"Matches in {report['text']!r}:")
+        for section, found in report["matches"].items():
+            lines.append(f"  {section:<16} {', '.join(found) if found else '-'}")
+    return "\n".join(lines)
+
+
+def main():
+    import argparse
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(
+        description="Compile and inspect the rule dictionaries"
+    )
+    parser.add_argument(
+        "dictionaries",
+        nargs="*",
+        help="Extra dictionary files layered on the bundled one (default: $EMAIL_RULE_DICTIONARIES)"
+    )
+    parser.add_argument(
+        "--match",
+        metavar="TEXT",
+        help="Show which entries of each list match TEXT"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Output as JSON"
+    )
+
+    args = parser.parse_args()
+
+    paths = [DEFAULT_RULES_PATH] + args.dictionaries if args.dictionaries else rule_dictionary_paths()
+    try:
+        started = time.perf_counter()
+        load_rules(paths, use_cache=False)
+        build_ms = (time.perf_counter() - started) * 1000
+        load_rules(paths)
+        started = time.perf_counter()
+        rules = load_rules(paths)
+        cached_ms = (time.perf_counter() - started) * 1000
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    cache_dir = os.environ.get("EMAIL_RULE_CACHE") or DEFAULT_CACHE_DIR
+    report: dict = {
+        "version": rules.version,
+        "fingerprint": rules.fingerprint,
+        "paths": paths,
+        "cache_file": _cache_path(cache_dir, paths),
+        "build_ms": round(build_ms, 2),
+        "cached_ms": round(cached_ms, 2),
+        "entries": {
+            "spam_triggers": len(rules.spam_trigger_index),
+            "power_words": len(rules.power_word_index),
+            "link_shorteners": len(rules.link_shortener_index),
+            "mx_providers": len(rules.mx_provider_index),
+        },
+    }
+    if args.match is not None:
+        lower = args.match.lower()
+        report["text"] = args.match
+        report["matches"] = {
+            "spam_triggers": rules.spam_trigger_index.find(lower),
+            "power_words": rules.power_word_index.find(lower),
+            "link_shorteners": rules.link_shortener_index.find(args.match),
+            "mx_providers": [rules.mx_providers[pattern] for pattern in rules.mx_provider_index.find(args.match)],
+        }
+
+    print(json.dumps(report, indent=2) if args.json else format_human_readable(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,34 +9,29 @@ Usage:
     python score_subject_line.py "Your subject line here"
     python score_subject_line.py "Your subject line here" --json
     python score_subject_line.py --batch subjects.txt
+    python score_subject_line.py --batch subjects.txt --cache-file scores.db
+    python score_subject_line.py --csv export.csv --column subject --output scored.csv
+    python score_subject_line.py --batch subjects.txt --stats stats.json
+    python score_subject_line.py "Your subject line here" --search --top 5
 """
 
-import argparse
 import json
 import re
 import sys
-from typing import Dict, List, Tuple, Any
-
-
-# Spam trigger words/phrases (case-insensitive)
-SPAM_TRIGGERS = [
-    "free", "act now", "limited time", "guaranteed", "no obligation",
-    "winner", "congratulations", "urgent", "click here", "buy now",
-    "order now", "don't delete", "not spam", "as seen on", "double your",
-    "earn money", "no cost", "risk free", "satisfaction guaranteed",
-    "call now", "order today", "what are you waiting for", "supplies are limited",
-    "while supplies last", "exclusive deal", "promise you", "this isn't spam",
-    "dear friend", "for instant access", "get it now", "get started now"
-]
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Any
+
+from metrics import CACHE_REQUESTS, SUBJECTS
+from rule_dictionaries import RULES
+from subject_rules import check_formatting, check_spam_triggers
 
-# Power words (positive engagement)
-POWER_WORDS = [
-    "new", "exclusive", "proven", "secret", "discover", "unlock",
-    "essential", "breakthrough", "insider", "limited", "instant", "save",
-    "transform", "boost", "master", "ultimate", "complete", "guide",
-    "strategy", "tips", "hacks", "results", "effective", "powerful",
-    "simple", "easy", "fast", "quick", "step-by-step"
-]
+
+# Spam trigger words/phrases (case-insensitive) and power words (positive
+# engagement) come from the rule dictionaries (see rule_dictionaries.py)
+SPAM_TRIGGERS = RULES.spam_triggers
+POWER_WORDS = RULES.power_words
+SPAM_TRIGGER_INDEX = RULES.spam_trigger_index
+POWER_WORD_INDEX = RULES.power_word_index
 
 # Merge tag patterns
 MERGE_TAG_PATTERNS = [
@@ -44,6 +39,10 @@ MERGE_TAG_PATTERNS = [
     r'\{email\}', r'\{\{email\}\}', r'\[first_name\]', r'\[name\]'
 ]
 
+# Any recognized merge tag, used to canonicalize subjects for memoization
+MERGE_TAG_RE = re.compile('|'.join(MERGE_TAG_PATTERNS))
+MERGE_TAG_PLACEHOLDER = "{first_name}"
+
 
 def count_words_and_chars(subject: str) -> Tuple[int, int]:
     """Count words and characters in subject line."""
@@ -87,68 +86,6 @@ def calculate_length_score(word_count: int, char_count: int) -> Tuple[int, str]:
     return score, note
 
 
-def check_spam_triggers(subject: str) -> Tuple[int, List[str]]:
-    """
-    Check for spam trigger words.
-    Returns: (penalty, list of triggers found)
-
-    -5 points per trigger, max -25
-    """
-    subject_lower = subject.lower()
-    triggers_found = []
-
-    for trigger in SPAM_TRIGGERS:
-        # Special case for "free" - only flag if it's emphasized
-        if trigger == "free":
-            if re.search(r'\bFREE\b', subject) or 'free!' in subject_lower:
-                triggers_found.append(trigger)
-        elif trigger in subject_lower:
-            triggers_found.append(trigger)
-
-    penalty = max(len(triggers_found) * -5, -25)
-    return penalty, triggers_found
-
-
-def check_formatting(subject: str) -> Tuple[int, List[str]]:
-    """
-    Check formatting issues.
-    Returns: (penalty, list of issues)
-
-    - ALL CAPS (entire subject): -15
-    - Excessive exclamation marks (2+): -10 per extra
-    - Excessive question marks (2+): -5
-    - Multiple emoji (3+): -5
-    """
-    penalty = 0
-    issues = []
-
-    # Check for ALL CAPS (ignore merge tags and common acronyms)
-    text_without_tags = re.sub(r'\{[^}]+\}|\[[^\]]+\]', '', subject)
-    if text_without_tags.isupper() and len(text_without_tags) > 5:
-        penalty -= 15
-        issues.append("ALL CAPS detected")
-
-    # Check exclamation marks
-    exclamation_count = subject.count('!')
-    if exclamation_count >= 2:
-        penalty -= (exclamation_count - 1) * 10
-        issues.append(f"{exclamation_count} exclamation marks - excessive")
-
-    # Check question marks
-    question_count = subject.count('?')
-    if question_count >= 2:
-        penalty -= 5
-        issues.append(f"{question_count} question marks - excessive")
-
-    # Check emoji (rough heuristic - non-ASCII characters)
-    emoji_count = sum(1 for char in subject if ord(char) > 127)
-    if emoji_count >= 3:
-        penalty -= 5
-        issues.append(f"Multiple emoji detected ({emoji_count})")
-
-    return penalty, issues
-
-
 def check_power_words(subject: str) -> Tuple[int, List[str]]:
     """
     Check for power words.
@@ -156,12 +93,7 @@ def check_power_words(subject: str) -> Tuple[int, List[str]]:
 
     +3 points per word, max +15
     """
-    subject_lower = subject.lower()
-    words_found = []
-
-    for word in POWER_WORDS:
-        if re.search(rf'\b{word}\b', subject_lower):
-            words_found.append(word)
+    words_found = POWER_WORD_INDEX.find(subject.lower())
 
     bonus = min(len(words_found) * 3, 15)
     return bonus, words_found
@@ -315,6 +247,7 @@ def score_subject_line(subject: str) -> Dict[str, Any]:
 
     Final: Clamped to 0-100
     """
+    SUBJECTS.inc()
     word_count, char_count = count_words_and_chars(subject)
 
     # Calculate components
@@ -383,6 +316,155 @@ def score_subject_line(subject: str) -> Dict[str, Any]:
     }
 
 
+def normalize_subject(subject: str) -> str:
+    """
+    Canonical form used as the memo key.
+
+    Whitespace runs collapse to one space and every recognized merge tag
+    becomes MERGE_TAG_PLACEHOLDER, so "Hi {name}" and "Hi  {{first_name}}"
+    share one entry.
+    """
+    return MERGE_TAG_RE.sub(MERGE_TAG_PLACEHOLDER, " ".join(subject.split()))
+
+
+def rules_fingerprint() -> str:
+    """Hash of the rule dictionaries and scorer source; changes invalidate stored scores."""
+    import hashlib
+
+    digest = hashlib.sha256(
+        json.dumps([RULES.fingerprint, MERGE_TAG_PATTERNS]).encode("utf-8")
+    )
+    try:
+        with open(__file__, "rb") as f:
+            digest.update(f.read())
+    except OSError:
+        pass
+    return digest.hexdigest()[:16]
+
+
+_CACHE_HIT = CACHE_REQUESTS.labels("subject_score", "hit")
+_CACHE_MISS = CACHE_REQUESTS.labels("subject_score", "miss")
+
+
+class SubjectScoreCache:
+    """
+    Bounded LRU memo for score_subject_line, keyed on normalize_subject().
+
+    Scores are computed for the normalized subject, so char counts reflect
+    collapsed whitespace and the canonical merge tag. Returned dicts carry the
+    caller's original subject but share nested structures with the cache and
+    should be treated as read-only.
+
+    With `store_path`, entries are also persisted to a SQLite file that
+    several batch workers can read and append to concurrently. Rows are keyed
+    by rules_fingerprint(), so editing the rule lists never serves stale scores.
+
+    Args:
+        maxsize: Maximum number of in-memory entries
+        store_path: Optional on-disk store shared across processes
+    """
+
+    # New entries buffered before writing to the on-disk store
+    FLUSH_EVERY = 1000
+
+    def __init__(self, maxsize: int = 100_000, store_path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.store_hits = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending: List[Tuple[str, str, str]] = []
+        self._rules = rules_fingerprint()
+        self._db = None
+        if store_path:
+            import sqlite3
+
+            self._db = sqlite3.connect(store_path, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS subject_scores "
+                "(rules TEXT, subject TEXT, result TEXT, PRIMARY KEY (rules, subject))"
+            )
+            self._db.commit()
+
+    def __enter__(self) -> "SubjectScoreCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT result FROM subject_scores WHERE rules = ? AND subject = ?",
+            (self._rules, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _remember(self, key: str, result: Dict[str, Any]) -> None:
+        self._entries[key] = result
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def score(self, subject: str) -> Dict[str, Any]:
+        """Score a subject, reusing any result for the same normalized form."""
+        key = normalize_subject(subject)
+        result = self._entries.get(key)
+        if result is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            _CACHE_HIT.inc()
+            SUBJECTS.inc()
+        else:
+            result = self._load(key)
+            if result is not None:
+                self.store_hits += 1
+                self.hits += 1
+                _CACHE_HIT.inc()
+                SUBJECTS.inc()
+            else:
+                self.misses += 1
+                _CACHE_MISS.inc()
+                result = score_subject_line(key)
+                if self._db is not None:
+                    self._pending.append((self._rules, key, json.dumps(result)))
+                    if len(self._pending) >= self.FLUSH_EVERY:
+                        self.flush()
+            self._remember(key, result)
+        return {**result, "subject": subject}
+
+    def flush(self) -> None:
+        """Write buffered entries to the on-disk store."""
+        if self._db is None or not self._pending:
+            return
+        self._db.executemany(
+            "INSERT OR IGNORE INTO subject_scores (rules, subject, result) VALUES (?, ?, ?)",
+            self._pending
+        )
+        self._db.commit()
+        self._pending.clear()
+
+    def close(self) -> None:
+        """Flush and close the on-disk store."""
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters; store_hits are the subset of hits served from disk."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "store_hits": self.store_hits,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+
 def format_human_readable(result: Dict[str, Any]) -> str:
     """Format result as human-readable scorecard."""
     GREEN = "\033[92m"
@@ -476,6 +558,10 @@ def format_human_readable(result: Dict[str, Any]) -> str:
 
 
 def main():
+    # Imported here so library users (e.g. the pre-send hook) skip argparse
+    import argparse
+    import contextlib
+
     parser = argparse.ArgumentParser(
         description="Score email subject lines for deliverability and engagement"
     )
@@ -488,6 +574,52 @@ def main():
         "--batch",
         help="File with one subject line per line"
     )
+    parser.add_argument(
+        "--csv",
+        help="CSV export to score in columnar mode (score columns are appended)"
+    )
+    parser.add_argument(
+        "--column",
+        default="subject",
+        help="Subject column name or index for --csv (default: subject)"
+    )
+    parser.add_argument(
+        "--output",
+        help="Output CSV path for --csv (default: stdout)"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=100_000,
+        help="Rows per vectorized chunk for --csv (default: 100000)"
+    )
+    parser.add_argument(
+        "--search",
+        action="store_true",
+        help="Generate and score variants of the subject, returning the best ones"
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=5,
+        help="Number of candidates returned by --search (default: 5)"
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=0,
+        help="Memoize --batch scores by normalized subject (LRU entries, 0 = off)"
+    )
+    parser.add_argument(
+        "--cache-file",
+        help="SQLite store for memoized scores, shareable across batch workers (implies caching)"
+    )
+    parser.add_argument(
+        "--stats",
+        metavar="PATH",
+        help="Save mergeable corpus statistics for --batch/--csv to PATH "
+             "(--batch then prints the summary instead of every result)"
+    )
     parser.add_argument(
         "--json",
         action="store_true",
@@ -501,18 +633,64 @@ def main():
 
     args = parser.parse_args()
 
+    # Columnar CSV mode
+    if args.csv:
+        from subject_columns import run_csv
+
+        stats = None
+        if args.stats:
+            from corpus_stats import CorpusStats
+            stats = CorpusStats("subject")
+        try:
+            count = run_csv(args.csv, args.output, args.column, args.chunk_size, stats=stats)
+        except FileNotFoundError:
+            print(f"ERROR: File not found: {args.csv}", file=sys.stderr)
+            sys.exit(1)
+        except ValueError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(1)
+
+        if args.verbose:
+            print(f"Scored {count} rows", file=sys.stderr)
+        if stats is not None:
+            from corpus_stats import save_stats
+            save_stats(args.stats, stats)
+
     # Batch mode
-    if args.batch:
+    elif args.batch:
         try:
-            with open(args.batch, 'r', encoding='utf-8') as f:
-                subjects = [line.strip() for line in f if line.strip()]
+            batch_file = open(args.batch, 'r', encoding='utf-8')
         except FileNotFoundError:
             print(f"ERROR: File not found: {args.batch}", file=sys.stderr)
             sys.exit(1)
 
-        results = [score_subject_line(subject) for subject in subjects]
-
-        if args.json:
+        with batch_file, contextlib.ExitStack() as stack:
+            score = score_subject_line
+            cache = None
+            if args.cache_size or args.cache_file:
+                cache = stack.enter_context(SubjectScoreCache(args.cache_size or 100_000, args.cache_file))
+                score = cache.score
+            results = (score(line.strip()) for line in batch_file if line.strip())
+
+            if args.stats:
+                # Stream: fold each result into the sketches and drop it
+                from corpus_stats import CorpusStats, add_subject_result, save_stats
+                stats = CorpusStats("subject")
+                for result in results:
+                    add_subject_result(stats, result)
+                results = None
+            else:
+                results = list(results)
+
+        if cache is not None and args.verbose:
+            print(f"Cache: {json.dumps(cache.stats())}", file=sys.stderr)
+
+        if results is None:
+            from corpus_stats import format_human_readable as format_stats
+            save_stats(args.stats, stats)
+            summary = stats.summary()
+            print(json.dumps(summary, indent=2) if args.json else format_stats(summary))
+        elif args.json:
             print(json.dumps(results, indent=2))
         else:
             for i, result in enumerate(results, 1):
@@ -521,6 +699,17 @@ def main():
                 print('='*60)
                 print(format_human_readable(result))
 
+    # Candidate search mode
+    elif args.subject and args.search:
+        from subject_search import format_human_readable as format_search, search_subject_lines
+
+        result = search_subject_lines(args.subject, args.top)
+
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            print(format_search(result))
+
     # Single subject mode
     elif args.subject:
         result = score_subject_line(args.subject)
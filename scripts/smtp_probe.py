@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+SMTP/STARTTLS Prober
+
+Connects to MX hosts the way a sending server would: reads the banner,
+issues EHLO, upgrades with STARTTLS when offered, checks the certificate
+chain and whether its names cover the MX hostname, repeats EHLO over TLS,
+and quits. Every step is timed, so the result shows where a slow host spends
+its handshake.
+
+All hosts are probed concurrently on the caller's event loop, bounded by an
+overall and a per-host connection limit. One SmtpProber keeps each host's
+result for its lifetime, so domains sharing MX hosts (everyone on Google
+Workspace or Microsoft 365) cost one connection per host, not one per
+domain.
+
+Many networks block outbound port 25; probes from there fail with a connect
+timeout, which is reported as such rather than as a dead MX.
+
+Usage (library):
+    prober = SmtpProber()
+    mx = await probe_mx(evaluate_mx(records), prober)
+
+Usage (CLI):
+    python smtp_probe.py example.com other.com
+    python smtp_probe.py --hosts mx1.example.com --port 2525 --json
+    python deliverability_async.py example.com --smtp
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import ssl
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from check_deliverability import evaluate_mx
+from dns_resolver import AsyncResolver, DnsError
+
+
+SMTP_PORT = 25
+
+# Certificates expiring sooner than this are reported
+CERT_EXPIRY_WARNING_DAYS = 14
+
+# Upper bounds on what a misbehaving server can make the prober buffer
+MAX_REPLY_LINE = 4096
+MAX_REPLY_LINES = 100
+
+
+class SmtpError(Exception):
+    """Raised for a malformed or unexpected SMTP reply."""
+
+
+class _SmtpProtocol(asyncio.Protocol):
+    """Splits the byte stream into complete (possibly multi-line) replies."""
+
+    def __init__(self):
+        self.replies: asyncio.Queue = asyncio.Queue()
+        self._buffer = b""
+        self._lines: List[str] = []
+
+    def data_received(self, data: bytes) -> None:
+        self._buffer += data
+        while b"\n" in self._buffer:
+            line, self._buffer = self._buffer.split(b"\n", 1)
+            text = line.rstrip(b"\r").decode("utf-8", "replace")
+            self._lines.append(text)
+            # "250-..." continues a reply, "250 ..." (or a bare "250") ends it
+            if len(text) < 4 or text[3] != "-":
+                self.replies.put_nowait(self._lines)
+                self._lines = []
+            elif len(self._lines) > MAX_REPLY_LINES:
+                self.replies.put_nowait(SmtpError(f"reply longer than {MAX_REPLY_LINES} lines"))
+                self._lines = []
+        if len(self._buffer) > MAX_REPLY_LINE:
+            self.replies.put_nowait(SmtpError(f"reply line longer than {MAX_REPLY_LINE} bytes"))
+            self._buffer = b""
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.replies.put_nowait(exc or ConnectionResetError("connection closed by server"))
+
+    async def reply(self, timeout: float) -> Tuple[int, List[str]]:
+        """Next reply as (code, lines with the code stripped)."""
+        lines = await asyncio.wait_for(self.replies.get(), timeout)
+        if isinstance(lines, Exception):
+            raise lines
+        try:
+            code = int(lines[-1][:3])
+        except ValueError:
+            raise SmtpError(f"malformed reply: {lines[-1][:80]!r}")
+        return code, [line[4:] for line in lines]
+
+
+def certificate_names(cert: Dict[str, Any]) -> List[str]:
+    """DNS names a certificate covers (subjectAltName, else the subject CN)."""
+    names = [value for kind, value in cert.get("subjectAltName", ()) if kind == "DNS"]
+    if not names:
+        names = [value for rdn in cert.get("subject", ()) for key, value in rdn if key == "commonName"]
+    return names
+
+
+def name_matches(host: str, names: List[str]) -> bool:
+    """RFC 6125 matching: exact, or a wildcard standing for one left-most label."""
+    host = host.lower().rstrip(".")
+    for name in names:
+        name = name.lower().rstrip(".")
+        if name == host:
+            return True
+        if name.startswith("*.") and "." in host and host.split(".", 1)[1] == name[2:]:
+            return True
+    return False
+
+
+def _ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 3)
+
+
+class SmtpProber:
+    """
+    Probes SMTP servers, reusing each host's result across domains.
+
+    Args:
+        timeout: Seconds allowed for each step (connect, each reply, TLS handshake)
+        port: Server port (non-default only for local stand-in servers)
+        max_concurrency: Upper bound on simultaneous connections
+        per_host: Upper bound on simultaneous connections to one host
+        helo_name: Name sent in EHLO (defaults to this machine's FQDN)
+        ssl_context: Context for STARTTLS (defaults to the system trust store;
+            hostname checking is done by the prober so a mismatch is reported,
+            not fatal)
+        addresses: Host -> address to connect to instead of resolving the host
+            (for stand-in servers; the host is still used for SNI and name checks)
+        reuse: Keep results for the prober's lifetime (off for monitors that re-probe)
+    """
+
+    def __init__(self, timeout: float = 10.0, port: int = SMTP_PORT, max_concurrency: int = 32,
+                 per_host: int = 2, helo_name: Optional[str] = None,
+                 ssl_context: Optional[ssl.SSLContext] = None,
+                 addresses: Optional[Dict[str, str]] = None, reuse: bool = True):
+        self.timeout = timeout
+        self.port = port
+        self.per_host = per_host
+        self.helo_name = helo_name or socket.getfqdn()
+        self.addresses = addresses or {}
+        self.reuse = reuse
+        if ssl_context is None:
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+        self.ssl_context = ssl_context
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._results: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+
+    async def probe(self, host: str) -> Dict[str, Any]:
+        """Probe one host; concurrent and repeated calls for a host share one connection."""
+        host = host.lower().rstrip(".")
+        if not self.reuse:
+            return await self._probe(host)
+        if host not in self._results:
+            self._results[host] = asyncio.ensure_future(self._probe(host))
+        return await asyncio.shield(self._results[host])
+
+    async def probe_many(self, hosts: List[str]) -> List[Dict[str, Any]]:
+        return list(await asyncio.gather(*[self.probe(host) for host in hosts]))
+
+    async def _probe(self, host: str) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            "host": host,
+            "port": self.port,
+            "address": None,
+            "reachable": False,
+            "banner": None,
+            "esmtp": False,
+            "extensions": [],
+            "starttls": False,
+            "tls": None,
+            "certificate": None,
+            "latency_ms": {},  # elapsed ms when each step completed
+            "error": None,
+        }
+        slot = self._host_slots.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with self._semaphore, slot:
+            transport = None
+            step = "connect"
+            started = time.perf_counter()
+            try:
+                transport, protocol = await asyncio.wait_for(
+                    asyncio.get_running_loop().create_connection(
+                        _SmtpProtocol, self.addresses.get(host, host), self.port),
+                    self.timeout
+                )
+                result["latency_ms"]["connect"] = _ms(started)
+                result["address"] = (transport.get_extra_info("peername") or [None])[0]
+
+                step = "banner"
+                code, lines = await protocol.reply(self.timeout)
+                result["latency_ms"]["banner"] = _ms(started)
+                result["banner"] = lines[0]
+                if code != 220:
+                    raise SmtpError(f"banner {code} {lines[0]}")
+                result["reachable"] = True
+
+                step = "ehlo"
+                result["extensions"], result["esmtp"] = await self._ehlo(transport, protocol)
+                result["latency_ms"]["ehlo"] = _ms(started)
+
+                result["starttls"] = "STARTTLS" in result["extensions"]
+                if result["starttls"]:
+                    step = "starttls"
+                    transport = await self._starttls(host, transport, protocol, result)
+                    result["latency_ms"]["starttls"] = _ms(started)
+                    if result["tls"] is not None:
+                        step = "ehlo over tls"
+                        result["tls"]["extensions"], _ = await self._ehlo(transport, protocol)
+
+                step = "quit"
+                transport.write(b"QUIT\r\n")
+                try:
+                    await protocol.reply(min(self.timeout, 2.0))
+                except (asyncio.TimeoutError, OSError, SmtpError):
+                    pass  # the probe is complete; a slow goodbye is not a finding
+            except asyncio.TimeoutError:
+                result["error"] = f"{step}: timed out after {self.timeout:g}s"
+            except (OSError, SmtpError) as e:
+                result["error"] = f"{step}: {e}"
+            finally:
+                result["latency_ms"]["total"] = _ms(started)
+                if transport is not None:
+                    transport.close()
+        result["issues"] = host_issues(result)
+        return result
+
+    async def _ehlo(self, transport, protocol: _SmtpProtocol) -> Tuple[List[str], bool]:
+        """Extensions offered, and whether EHLO (rather than the HELO fallback) succeeded."""
+        transport.write(f"EHLO {self.helo_name}\r\n".encode())
+        code, lines = await protocol.reply(self.timeout)
+        if code == 250:
+            return [line.split(" ", 1)[0].upper() for line in lines[1:] if line], True
+        transport.write(f"HELO {self.helo_name}\r\n".encode())
+        code, lines = await protocol.reply(self.timeout)
+        if code != 250:
+            raise SmtpError(f"HELO rejected: {code} {lines[-1]}")
+        return [], False
+
+    async def _starttls(self, host: str, transport, protocol: _SmtpProtocol, result: Dict[str, Any]):
+        """Upgrade the connection; fills result["tls"] and result["certificate"]."""
+        transport.write(b"STARTTLS\r\n")
+        code, lines = await protocol.reply(self.timeout)
+        if code != 220:
+            raise SmtpError(f"STARTTLS refused: {code} {lines[-1]}")
+        try:
+            transport = await asyncio.wait_for(
+                asyncio.get_running_loop().start_tls(transport, protocol, self.ssl_context, server_hostname=host),
+                self.timeout
+            )
+        except ssl.SSLCertVerificationError as e:
+            # The handshake is aborted, but the server does offer TLS; senders
+            # using opportunistic TLS (most of them) would still encrypt
+            result["certificate"] = {"trusted": False, "error": e.verify_message or str(e)}
+            raise SmtpError(f"certificate not trusted: {e.verify_message or e}")
+
+        ssl_object = transport.get_extra_info("ssl_object")
+        cert = ssl_object.getpeercert() or {}
+        names = certificate_names(cert)
+        expires = cert.get("notAfter")
+        result["tls"] = {"version": ssl_object.version(), "cipher": ssl_object.cipher()[0]}
+        result["certificate"] = {
+            "trusted": self.ssl_context.verify_mode == ssl.CERT_REQUIRED,
+            "names": names,
+            "matches_host": name_matches(host, names),
+            "expires": expires,
+            "days_left": int((ssl.cert_time_to_seconds(expires) - time.time()) // 86400) if expires else None,
+        }
+        return transport
+
+
+def host_issues(result: Dict[str, Any]) -> List[str]:
+    """Findings for one probed host."""
+    cert = result["certificate"]
+    if cert is not None and not cert["trusted"] and cert.get("error"):
+        return [f"TLS certificate not trusted ({cert['error']})"]
+    if not result["reachable"]:
+        return [f"Not accepting mail ({result['error']})"]
+    issues = []
+    if result["error"]:
+        issues.append(f"Handshake failed at {result['error']}")
+    if not result["esmtp"]:
+        issues.append("EHLO rejected (no ESMTP)")
+    elif not result["starttls"]:
+        issues.append("STARTTLS not offered - mail to this host travels unencrypted")
+    if cert is not None and cert.get("names") is not None:
+        if not cert["matches_host"]:
+            issues.append("TLS certificate does not cover the MX hostname")
+        if cert["days_left"] is not None and cert["days_left"] < CERT_EXPIRY_WARNING_DAYS:
+            issues.append(f"TLS certificate expires in {cert['days_left']} days")
+    return issues
+
+
+async def probe_mx(mx: Dict[str, Any], prober: SmtpProber) -> Dict[str, Any]:
+    """
+    Probe every host of an evaluate_mx() result and attach the findings.
+
+    Adds "smtp" (one probe result per host, in priority order) and appends
+    host issues, prefixed with the host, to the result's issues.
+    """
+    hosts = [record["host"] for record in mx.get("records", []) if record["host"]]
+    if not hosts:
+        return mx
+    results = await prober.probe_many(hosts)
+    mx["smtp"] = results
+    for result in results:
+        mx["issues"].extend(f"{result['host']}: {issue}" for issue in result["issues"])
+    if not any(result["reachable"] for result in results):
+        mx["issues"].append("No reachable MX host found")
+    return mx
+
+
+def format_human_readable(results: List[Dict[str, Any]]) -> str:
+    output = []
+    for result in results:
+        latency = result["latency_ms"]
+        if result["reachable"]:
+            tls = result["tls"]["version"] if result["tls"] else ("STARTTLS failed" if result["starttls"] else "no TLS")
+            output.append(f"{result['host']}:{result['port']} ({result['address']})  {tls}  "
+                          f"banner {latency.get('banner', 0):.0f} ms, total {latency['total']:.0f} ms")
+            output.append(f"  {result['banner']}")
+        else:
+            output.append(f"{result['host']}:{result['port']}  unreachable  total {latency['total']:.0f} ms")
+        for issue in result["issues"]:
+            output.append(f"  ⚠ {issue}")
+    return "\n".join(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Probe MX hosts for reachability, STARTTLS and certificate names"
+    )
+    parser.add_argument(
+        "targets",
+        nargs="+",
+        help="Domains whose MX hosts are probed (or hosts, with --hosts)"
+    )
+    parser.add_argument(
+        "--hosts",
+        action="store_true",
+        help="Treat targets as SMTP hostnames instead of domains"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Output results as JSON"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=SMTP_PORT,
+        help=f"SMTP port (default: {SMTP_PORT})"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=10.0,
+        help="Seconds allowed per handshake step (default: 10)"
+    )
+    parser.add_argument(
+        "--per-host",
+        type=int,
+        default=2,
+        help="Maximum simultaneous connections to one host (default: 2)"
+    )
+    parser.add_argument(
+        "--helo",
+        help="Name to send in EHLO (default: this machine's FQDN)"
+    )
+
+    args = parser.parse_args()
+
+    async def run() -> Dict[str, Any]:
+        prober = SmtpProber(timeout=args.timeout, port=args.port, per_host=args.per_host, helo_name=args.helo)
+        if args.hosts:
+            return {"hosts": await prober.probe_many(args.targets)}
+        async with AsyncResolver() as resolver:
+            async def one(domain: str) -> Dict[str, Any]:
+                try:
+                    records = await resolver.lookup(domain, "MX")
+                except DnsError as e:
+                    return {"domain": domain, "error": str(e)}
+                return {"domain": domain, **await probe_mx(evaluate_mx(records), prober)}
+            return {"domains": await asyncio.gather(*[one(domain.lower().strip()) for domain in args.targets])}
+
+    results = asyncio.run(run())
+    probed = results.get("hosts") or [
+        probe for domain in results["domains"] for probe in domain.get("smtp", [])
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    elif args.hosts:
+        print(format_human_readable(probed))
+    else:
+        for domain in results["domains"]:
+            print(f"\n{domain['domain']}")
+            if "error" in domain:
+                print(f"  MX lookup failed: {domain['error']}")
+                continue
+            print(format_human_readable(domain.get("smtp", [])) or "  No MX records found")
+
+    if not probed or any(not probe["reachable"] for probe in probed):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
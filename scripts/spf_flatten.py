@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+SPF Flattening
+
+Receivers stop evaluating SPF after 10 DNS-querying terms (include, a, mx,
+ptr, exists, redirect), and every nested include costs them round trips on
+each message. This resolves a domain's whole include tree concurrently over
+one AsyncResolver, replaces `include`, `a` and `mx` terms with the ip4/ip6
+ranges they currently resolve to, merges adjacent and overlapping CIDRs, and
+packs the result into the apex record plus as few `_spfN` records as fit
+within DNS TXT size limits.
+
+Terms that cannot be flattened without changing their meaning (`exists`,
+`ptr`, macros, and non-pass qualifiers) are kept: at the apex they stay as
+written, and an include containing one is kept as an include. Receivers
+evaluate terms left to right, so ranges are only merged between kept terms
+and each run of them is published where its terms stood. Flattened
+ranges go stale when a provider changes its servers, so re-run and compare
+regularly; the output is refused (no records) if any lookup failed.
+
+Usage:
+    python spf_flatten.py example.com
+    python spf_flatten.py example.com --json
+    python spf_flatten.py example.com --max-length 255 --prefix _spf --trace trace.json
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import re
+import sys
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from check_deliverability import dns_failure
+from dns_resolver import AsyncResolver, DnsError
+from dns_trace import DnsTracer, format_summary, traced
+
+
+SPF_LOOKUP_LIMIT = 10
+
+# RFC 7208 limit on MX names evaluated by one `mx` term
+MX_NAME_LIMIT = 10
+
+# Include nesting followed before giving up
+MAX_INCLUDE_DEPTH = 10
+
+# Keeps each record's answer (with its name and headers) inside a 512-byte
+# UDP response; raise toward 2048 only if receivers are known to use EDNS0
+MAX_RECORD_LENGTH = 450
+
+# Longest single character-string in a TXT record
+TXT_STRING_LENGTH = 255
+
+# Terms that cost the receiver one DNS query each
+LOOKUP_MECHANISMS = ("include", "a", "mx", "ptr", "exists")
+
+_TERM_RE = re.compile(r'^([-+~?]?)([a-z][a-z0-9_.-]*)([:=]?)(.*)$', re.IGNORECASE)
+_CIDR_RE = re.compile(r'^(.*?)(?:/(\d{1,2}))?(?://(\d{1,3}))?$')
+
+
+class _Expansion(NamedTuple):
+    """What one SPF record contributes once its includes are resolved."""
+    record: Optional[str]
+    # In evaluation order: networks, and (term, lookups it still costs) for kept terms
+    terms: List[Any]
+    lookups: int
+    all: Optional[str]
+    opaque: bool  # contains terms that only make sense evaluated for this domain
+
+
+def parse_term(term: str) -> Tuple[str, str, str, str]:
+    """Split an SPF term into (qualifier, name, separator, value)."""
+    match = _TERM_RE.match(term)
+    if not match:
+        return "", term.lower(), "", ""
+    qualifier, name, separator, value = match.groups()
+    return qualifier or "+", name.lower(), separator, value
+
+
+def _cidr_lengths(value: str) -> Tuple[str, int, int]:
+    domain, v4, v6 = _CIDR_RE.match(value).groups()
+    return domain, int(v4) if v4 else 32, int(v6) if v6 else 128
+
+
+class SpfFlattener:
+    """
+    Expands SPF include trees over a shared resolver.
+
+    Give the resolver a cache (cache_size) so includes shared by several
+    branches are only queried once.
+    """
+
+    def __init__(self, resolver: AsyncResolver):
+        self.resolver = resolver
+        self.failures: List[Dict[str, str]] = []
+        self.warnings: List[str] = []
+
+    async def _lookup(self, name: str, rtype: str) -> List[str]:
+        try:
+            return await self.resolver.lookup(name, rtype)
+        except DnsError as e:
+            self.failures.append(dns_failure(name, rtype, e))
+            return []
+
+    async def spf_record(self, domain: str) -> Optional[str]:
+        """The domain's v=spf1 record, or None (with a warning if there are several)."""
+        records = [
+            record for record in await self._lookup(domain, "TXT")
+            if record.lower() == "v=spf1" or record.lower().startswith("v=spf1 ")
+        ]
+        if len(records) > 1:
+            self.warnings.append(f"{domain} publishes {len(records)} SPF records (permerror at receivers)")
+        return records[0] if records else None
+
+    async def _addresses(self, host: str, v4: int, v6: int) -> List[Any]:
+        a, aaaa = await asyncio.gather(self._lookup(host, "A"), self._lookup(host, "AAAA"))
+        return (
+            [ipaddress.ip_network(f"{address}/{v4}", strict=False) for address in a] +
+            [ipaddress.ip_network(f"{address}/{v6}", strict=False) for address in aaaa]
+        )
+
+    async def _mx_addresses(self, host: str, v4: int, v6: int) -> List[Any]:
+        hosts = [record.split()[-1].rstrip(".") for record in await self._lookup(host, "MX")]
+        if len(hosts) > MX_NAME_LIMIT:
+            self.warnings.append(f"mx:{host} has {len(hosts)} MX names; receivers evaluate at most {MX_NAME_LIMIT}")
+        found = await asyncio.gather(*[self._addresses(name, v4, v6) for name in hosts[:MX_NAME_LIMIT]])
+        return [network for networks in found for network in networks]
+
+    async def expand(self, domain: str, top: bool = True, stack: Tuple[str, ...] = ()) -> _Expansion:
+        """
+        Resolve one domain's SPF record and everything it includes.
+
+        Args:
+            domain: Domain whose record is expanded
+            top: True for the apex record, whose unflattenable terms are kept as written
+            stack: Includes being expanded above this one, for loop detection
+        """
+        domain = domain.lower().rstrip(".")
+        if domain in stack or len(stack) > MAX_INCLUDE_DEPTH:
+            self.warnings.append(f"include loop or nesting beyond {MAX_INCLUDE_DEPTH} at {domain}; not expanded")
+            return _Expansion(None, [], 0, None, True)
+        stack = stack + (domain,)
+
+        record = await self.spf_record(domain)
+        if record is None:
+            failed = any(failure["name"] == domain for failure in self.failures)
+            if not top and not failed:
+                self.warnings.append(f"include:{domain} has no SPF record (permerror at receivers)")
+            return _Expansion(None, [], 0, None, False)
+
+        slots: List[List[Any]] = []  # what each term contributes, in record order
+        lookups = 0
+        all_qualifier: Optional[str] = None
+        redirect: Optional[str] = None
+        opaque = False
+        jobs = []  # (slot, term, coroutine) resolved concurrently below
+
+        for term in record.split()[1:]:
+            qualifier, name, separator, value = parse_term(term)
+            if separator == "=":
+                if name == "redirect":
+                    redirect = value
+                elif top:
+                    slots.append([(term, 0)])  # exp= and unknown modifiers
+                continue
+            if name in LOOKUP_MECHANISMS:
+                lookups += 1
+            if name == "all":
+                all_qualifier = qualifier
+                continue
+            if "%" in value or name in ("exists", "ptr") or qualifier != "+":
+                # Macros expand against the evaluated domain; exists/ptr depend on
+                # the connecting client; non-pass results cannot be merged into
+                # ranges, and inside an include they decide what the ranges after
+                # them mean, so the whole include stays as written
+                if top:
+                    slots.append([(term, 1 if name in LOOKUP_MECHANISMS else 0)])
+                else:
+                    opaque = True
+                continue
+            if name in ("ip4", "ip6"):
+                try:
+                    slots.append([ipaddress.ip_network(value, strict=False)])
+                except ValueError:
+                    self.warnings.append(f"invalid {term} in {domain} ignored")
+            elif name == "include":
+                jobs.append((len(slots), term, self.expand(value, False, stack)))
+                slots.append([])
+            elif name in ("a", "mx"):
+                host, v4, v6 = _cidr_lengths(value)
+                host = host or domain
+                lookup = self._addresses if name == "a" else self._mx_addresses
+                jobs.append((len(slots), term, lookup(host, v4, v6)))
+                slots.append([])
+            else:
+                self.warnings.append(f"unknown mechanism {term} in {domain} ignored")
+
+        if redirect and all_qualifier is None:
+            lookups += 1
+            jobs.append((len(slots), "redirect=" + redirect, self.expand(redirect, top, stack)))
+            slots.append([])
+
+        for (slot, term, _), outcome in zip(jobs, await asyncio.gather(*[job for _, _, job in jobs])):
+            if isinstance(outcome, list):
+                slots[slot] = outcome
+                continue
+            lookups += outcome.lookups
+            if term.startswith("redirect="):
+                # The target's record replaces this one's, `all` included; an
+                # opaque target can only stay a redirect at the apex
+                all_qualifier = None if outcome.opaque else outcome.all
+                opaque = opaque or (outcome.opaque and not top)
+            if outcome.opaque:
+                # Kept as written; it still costs itself plus its subtree
+                slots[slot] = [(term, 1 + outcome.lookups)]
+            else:
+                slots[slot] = outcome.terms
+
+        if opaque and not top:
+            return _Expansion(record, [], lookups, all_qualifier, True)
+        terms = [term for contributed in slots for term in contributed]
+        return _Expansion(record, terms, lookups, all_qualifier, False)
+
+
+def merge_networks(networks: List[Any]) -> List[Any]:
+    """Collapse overlapping and adjacent ranges, IPv4 first."""
+    v4 = [network for network in networks if network.version == 4]
+    v6 = [network for network in networks if network.version == 6]
+    return list(ipaddress.collapse_addresses(v4)) + list(ipaddress.collapse_addresses(v6))
+
+
+def merge_runs(terms: List[Any]) -> List[Any]:
+    """
+    Merge each run of networks between kept terms, keeping the runs in place.
+
+    Returns:
+        The same sequence with every run as one list of merged networks, and
+        kept terms as their (term, lookups) tuples
+    """
+    merged: List[Any] = []
+    run: List[Any] = []
+    for term in terms:
+        if isinstance(term, tuple):
+            if run:
+                merged.append(merge_networks(run))
+                run = []
+            merged.append(term)
+        else:
+            run.append(term)
+    if run:
+        merged.append(merge_networks(run))
+    return merged
+
+
+def _range_term(network: Any) -> str:
+    if network.prefixlen == network.max_prefixlen:
+        return f"ip{network.version}:{network.network_address}"
+    return f"ip{network.version}:{network.with_prefixlen}"
+
+
+def split_txt(value: str, size: int = TXT_STRING_LENGTH) -> List[str]:
+    """Character-strings for publishing a TXT value longer than one string allows."""
+    return [value[i:i + size] for i in range(0, len(value), size)] or [""]
+
+
+def _record(name: str, value: str) -> Dict[str, Any]:
+    return {"name": name, "value": value, "length": len(value), "strings": split_txt(value)}
+
+
+def build_records(domain: str, segments: List[Any], all_term: Optional[str],
+                  max_length: int = MAX_RECORD_LENGTH, prefix: str = "_spf") -> List[Dict[str, Any]]:
+    """
+    Pack terms into the apex record and, if they do not fit, `<prefix>N.<domain>`
+    records that the apex includes where the ranges stood.
+
+    Args:
+        segments: merge_runs() output: kept (term, lookups) tuples and lists of
+            networks, in evaluation order
+
+    Raises:
+        ValueError: the kept terms alone do not fit in max_length
+    """
+    segments = [
+        [_range_term(network) for network in segment] if isinstance(segment, list) else segment[0]
+        for segment in segments
+    ]
+    tail = [all_term] if all_term else []
+
+    flat = [term for segment in segments for term in (segment if isinstance(segment, list) else [segment])]
+    apex = " ".join(["v=spf1"] + flat + tail)
+    if len(apex) <= max_length:
+        return [_record(domain, apex)]
+
+    # An include only matches when the included record passes, so "-all"
+    # ending each part sends non-matching senders on to the next one. A part
+    # never spans a kept term, so each run is still evaluated in its place
+    parts: List[List[str]] = []
+    apex_terms: List[str] = []
+    budget = max_length - len("v=spf1 -all")
+    for segment in segments:
+        if not isinstance(segment, list):
+            apex_terms.append(segment)
+            continue
+        first = len(parts)
+        for term in segment:
+            if len(term) + 1 > budget:
+                raise ValueError(f"{term} does not fit in a {max_length}-byte record")
+            if len(parts) == first or sum(len(t) + 1 for t in parts[-1]) + len(term) + 1 > budget:
+                parts.append([])
+            parts[-1].append(term)
+        apex_terms.extend(f"include:{prefix}{i}.{domain}" for i in range(first + 1, len(parts) + 1))
+
+    names = [f"{prefix}{i}.{domain}" for i in range(1, len(parts) + 1)]
+    apex = " ".join(["v=spf1"] + apex_terms + tail)
+    if len(apex) > max_length:
+        ranges = sum(len(part) for part in parts)
+        raise ValueError(f"{ranges} ranges need {len(names)} records, more than fit as includes "
+                         f"in one {max_length}-byte apex record")
+    return [_record(domain, apex)] + [
+        _record(name, " ".join(["v=spf1"] + terms + ["-all"])) for name, terms in zip(names, parts)
+    ]
+
+
+async def flatten_spf(domain: str, resolver: AsyncResolver,
+                      max_length: int = MAX_RECORD_LENGTH, prefix: str = "_spf") -> Dict[str, Any]:
+    """
+    Flatten a domain's SPF record.
+
+    Returns:
+        Dict with the current record, before/after lookup counts, range counts
+        before and after merging, the records to publish (empty if the
+        expansion was incomplete), warnings, DNS failures and issues
+    """
+    domain = domain.lower().strip().rstrip(".")
+    flattener = SpfFlattener(resolver)
+    with traced(domain, "spf_flatten"):
+        expansion = await flattener.expand(domain)
+    current = expansion.record
+
+    segments = merge_runs(expansion.terms)
+    kept = [segment for segment in segments if isinstance(segment, tuple)]
+    all_term = f"{expansion.all}all" if expansion.all else None
+
+    issues: List[str] = []
+    records: List[Dict[str, Any]] = []
+    if current is None:
+        issues.append("No SPF record found")
+    elif flattener.failures:
+        issues.append("DNS lookup incomplete - flattened ranges would be missing senders; no records emitted")
+    else:
+        try:
+            records = build_records(domain, segments, all_term, max_length, prefix)
+        except ValueError as e:
+            issues.append(str(e))
+
+    lookups_after = sum(cost for _, cost in kept) + max(0, len(records) - 1)
+    if records and lookups_after > SPF_LOOKUP_LIMIT:
+        issues.append(f"Kept terms still need {lookups_after} lookups (limit {SPF_LOOKUP_LIMIT})")
+
+    return {
+        "domain": domain,
+        "record": current,
+        "lookups_before": expansion.lookups,
+        "lookups_after": lookups_after if records else None,
+        "ranges_before": len(expansion.terms) - len(kept),
+        "ranges_after": sum(len(segment) for segment in segments if isinstance(segment, list)),
+        "kept_terms": [term for term, _ in kept],
+        "records": records,
+        "warnings": flattener.warnings,
+        "dns_failures": flattener.failures,
+        "issues": issues,
+    }
+
+
+def format_human_readable(result: Dict[str, Any]) -> str:
+    output = [f"\nSPF flattening for {result['domain']}", "=" * 50]
+    output.append(f"  Current: {result['record'] or 'none'}")
+    after = result["lookups_after"] if result["lookups_after"] is not None else "-"
+    output.append(f"  DNS lookups: {result['lookups_before']} -> {after} (limit {SPF_LOOKUP_LIMIT})")
+    output.append(f"  Ranges: {result['ranges_before']} resolved, {result['ranges_after']} after merging")
+    if result["records"]:
+        output.append("\nRecords to publish:")
+        for record in result["records"]:
+            strings = " ".join(f'"{s}"' for s in record["strings"])
+            output.append(f"  {record['name']}. IN TXT {strings}")
+    for failure in result["dns_failures"]:
+        output.append(f"  ! {failure['type']} {failure['name']}: {failure['error']}")
+    for warning in result["warnings"]:
+        output.append(f"  ~ {warning}")
+    for issue in result["issues"]:
+        output.append(f"  ✗ {issue}")
+    return "\n".join(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Flatten a domain's SPF include tree into ip4/ip6 records within the lookup limit"
+    )
+    parser.add_argument(
+        "domain",
+        help="Domain to flatten (e.g., example.com)"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Output results as JSON"
+    )
+    parser.add_argument(
+        "--max-length",
+        type=int,
+        default=MAX_RECORD_LENGTH,
+        help=f"Maximum bytes per TXT record (default: {MAX_RECORD_LENGTH})"
+    )
+    parser.add_argument(
+        "--prefix",
+        default="_spf",
+        help="Label prefix for the chained records (default: _spf, giving _spf1.<domain>, ...)"
+    )
+    parser.add_argument(
+        "--trace",
+        help="Write a JSON trace of every DNS query (spans plus slowest-query summary)"
+    )
+
+    args = parser.parse_args()
+    tracer = DnsTracer() if args.trace else None
+
+    async def run() -> Dict[str, Any]:
+        async with AsyncResolver(tracer=tracer, cache_size=4096) as resolver:
+            return await flatten_spf(args.domain, resolver, args.max_length, args.prefix)
+
+    result = asyncio.run(run())
+    if tracer is not None:
+        tracer.save(args.trace)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(format_human_readable(result))
+        if tracer is not None:
+            print("\n" + format_summary(tracer.summary()))
+
+    if result["issues"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
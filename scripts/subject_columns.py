@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Columnar Subject Line Scoring
+
+Scores a whole column of subject lines at once and produces the same scores
+as score_subject_line.score_subject_line(), without the per-subject
+recommendations and alternatives. With NumPy installed every feature
+(length, caps, punctuation, emoji, digits, dictionary matches) is computed
+with array string operations over the column; only rows that a cheap
+vectorized prefilter cannot decide (e.g. candidate power words needing a
+word-boundary check) fall back to a per-row check. Rule dictionaries too
+large for one pass per entry are matched per row through their index. Without
+NumPy a pure-Python row loop over the same component functions is used.
+
+Large CSV exports are streamed in chunks, and the score columns are appended
+to every input row.
+
+Usage:
+    python subject_columns.py export.csv --column subject --output scored.csv
+    python score_subject_line.py --csv export.csv --column subject --output scored.csv
+"""
+
+import argparse
+import csv
+import re
+import sys
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO
+
+from corpus_stats import CorpusStats, add_subject_columns
+from metrics import SUBJECTS
+from rule_dictionaries import contains_word
+from score_subject_line import (
+    MERGE_TAG_PATTERNS,
+    POWER_WORD_INDEX,
+    POWER_WORDS,
+    SPAM_TRIGGER_INDEX,
+    SPAM_TRIGGERS,
+    calculate_length_score,
+    check_engagement,
+    check_formatting,
+    check_personalization,
+    check_power_words,
+    check_spam_triggers,
+    count_words_and_chars,
+)
+
+try:
+    import numpy as np
+    # NumPy 2 ships C-level string ufuncs in np.strings; np.char is the older API
+    _S = getattr(np, "strings", None) or np.char
+except ImportError:
+    np = None
+    _S = None
+
+
+# Columns appended to each input row, in output order
+SCORE_COLUMNS = [
+    "score", "length_score", "spam_score", "format_score", "power_score",
+    "personalization_score", "engagement_score", "word_count", "char_count",
+]
+
+# Dictionaries longer than this are matched per row through their rule index
+# (see rule_dictionaries.py) instead of one bulk substring pass per entry
+VECTORIZED_DICTIONARY_LIMIT = 64
+
+# Merge tag patterns are escaped literals, so plain substring search is exact
+MERGE_TAG_LITERALS = [re.sub(r'\\(.)', r'\1', pattern) for pattern in MERGE_TAG_PATTERNS]
+
+QUESTION_STARTS = ('How', 'What', 'Why', 'When', 'Where', 'Who', 'Which')
+
+# ASCII characters other than ' ' that str.split() treats as separators
+_ASCII_SEPARATORS = "\t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"
+
+_TAG_RE = re.compile(r'\{[^}]+\}|\[[^\]]+\]')
+_FREE_RE = re.compile(r'\bFREE\b')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+
+
+def _contains(column, needle: str):
+    return _S.find(column, needle) >= 0
+
+
+def _refine(mask, column, predicate) -> None:
+    """Re-evaluate `predicate` per row where `mask` is True, in place."""
+    rows = np.flatnonzero(mask)
+    if rows.size:
+        mask[rows] = [bool(predicate(value)) for value in column[rows].tolist()]
+
+
+def _score_numpy(subjects: Sequence[str]) -> Dict[str, Any]:
+    s = np.asarray(subjects, dtype=str)
+    if s.size == 0:
+        return {name: np.zeros(0, dtype=np.int64) for name in SCORE_COLUMNS}
+    lower = _S.lower(s)
+
+    char_count = _S.str_len(s).astype(np.int64)
+    non_ascii = char_count - _S.str_len(_S.encode(s, "ascii", "ignore")).astype(np.int64)
+
+    # Word count: spaces + 1 is exact for single-space separated text; rows with
+    # other separators, edge or doubled spaces, or non-ASCII are split per row
+    word_count = np.where(char_count > 0, _S.count(s, " ") + 1, 0).astype(np.int64)
+    irregular = (
+        _contains(s, "  ") | _S.startswith(s, " ") | _S.endswith(s, " ") | (non_ascii > 0)
+    )
+    for sep in _ASCII_SEPARATORS:
+        irregular |= _contains(s, sep)
+    rows = np.flatnonzero(irregular)
+    if rows.size:
+        word_count[rows] = [len(value.split()) for value in s[rows].tolist()]
+
+    # Length (mirrors calculate_length_score)
+    good_words = (word_count >= 6) & (word_count <= 10)
+    good_chars = (char_count >= 30) & (char_count <= 50)
+    length_score = np.select(
+        [
+            good_words & good_chars,
+            good_words,
+            good_chars,
+            ((word_count >= 4) & (word_count <= 5)) | ((word_count >= 11) & (word_count <= 12)),
+            (word_count == 3) | ((word_count >= 13) & (word_count <= 15)),
+        ],
+        [30, 25, 25, 20, 10],
+        default=0
+    )
+
+    # Spam triggers, one bulk substring pass per dictionary entry
+    trigger_count = np.zeros(s.size, dtype=np.int64)
+    if "free" in SPAM_TRIGGER_INDEX:
+        free = _contains(s, "FREE")
+        _refine(free, s, _FREE_RE.search)
+        trigger_count += free | _contains(lower, "free!")
+    if len(SPAM_TRIGGERS) <= VECTORIZED_DICTIONARY_LIMIT:
+        for trigger in SPAM_TRIGGERS:
+            if trigger != "free":
+                trigger_count += _contains(lower, trigger)
+    else:
+        trigger_count += np.fromiter(
+            (sum(trigger != "free" for trigger in SPAM_TRIGGER_INDEX.find(value)) for value in lower.tolist()),
+            dtype=np.int64, count=s.size
+        )
+    spam_score = np.maximum(trigger_count * -5, -25)
+
+    # Formatting
+    has_tag = _contains(s, "{") | _contains(s, "[")
+    all_caps = np.zeros(s.size, dtype=bool)
+    plain = ~has_tag
+    all_caps[plain] = _S.isupper(s[plain]) & (char_count[plain] > 5)
+    rows = np.flatnonzero(has_tag)
+    if rows.size:
+        stripped = [_TAG_RE.sub('', value) for value in s[rows].tolist()]
+        all_caps[rows] = [text.isupper() and len(text) > 5 for text in stripped]
+    exclamations = _S.count(s, "!")
+    questions = _S.count(s, "?")
+    format_score = (
+        np.where(all_caps, -15, 0) +
+        np.where(exclamations >= 2, (exclamations - 1) * -10, 0) +
+        np.where(questions >= 2, -5, 0) +
+        np.where(non_ascii >= 3, -5, 0)
+    )
+
+    # Power words: substring prefilter, word-boundary check only on candidates
+    power_count = np.zeros(s.size, dtype=np.int64)
+    if len(POWER_WORDS) <= VECTORIZED_DICTIONARY_LIMIT:
+        for word in POWER_WORDS:
+            found = _contains(lower, word)
+            _refine(found, lower, lambda value, word=word: contains_word(value, word))
+            power_count += found
+    else:
+        power_count += np.fromiter(
+            (len(POWER_WORD_INDEX.find(value)) for value in lower.tolist()), dtype=np.int64, count=s.size
+        )
+    power_score = np.minimum(power_count * 3, 15)
+
+    # Personalization
+    merge_tags = np.zeros(s.size, dtype=bool)
+    for literal in MERGE_TAG_LITERALS:
+        merge_tags |= _contains(s, literal)
+    numbers = non_ascii > 0  # \d also matches non-ASCII digits
+    for digit in "0123456789":
+        numbers |= _contains(s, digit)
+    _refine(numbers, s, _NUMBER_RE.search)
+    personalization_score = np.where(merge_tags, 10, 0) + np.where(numbers, 5, 0)
+
+    # Engagement
+    leading = _S.lstrip(s)
+    question = np.zeros(s.size, dtype=bool)
+    for word in QUESTION_STARTS:
+        question |= _S.startswith(leading, word)
+    colon = _contains(s, ":") & ~_S.endswith(s, ":")
+    brackets = _contains(s, "[") & _contains(s, "]")
+    engagement_score = np.where(question, 5, 0) + np.where(colon, 3, 0) + np.where(brackets, 3, 0)
+
+    score = np.clip(
+        50 + length_score + spam_score + format_score + power_score +
+        personalization_score + engagement_score,
+        0, 100
+    )
+
+    return {
+        "score": score,
+        "length_score": length_score,
+        "spam_score": spam_score,
+        "format_score": format_score,
+        "power_score": power_score,
+        "personalization_score": personalization_score,
+        "engagement_score": engagement_score,
+        "word_count": word_count,
+        "char_count": char_count,
+    }
+
+
+def _score_python(subjects: Sequence[str]) -> Dict[str, List[int]]:
+    columns: Dict[str, List[int]] = {name: [] for name in SCORE_COLUMNS}
+    for subject in subjects:
+        word_count, char_count = count_words_and_chars(subject)
+        parts = {
+            "length_score": calculate_length_score(word_count, char_count)[0],
+            "spam_score": check_spam_triggers(subject)[0],
+            "format_score": check_formatting(subject)[0],
+            "power_score": check_power_words(subject)[0],
+            "personalization_score": check_personalization(subject)[0],
+            "engagement_score": check_engagement(subject)[0],
+        }
+        columns["score"].append(max(0, min(100, 50 + sum(parts.values()))))
+        for name, value in parts.items():
+            columns[name].append(value)
+        columns["word_count"].append(word_count)
+        columns["char_count"].append(char_count)
+    return columns
+
+
+def score_subject_columns(subjects: Sequence[str]) -> Dict[str, Any]:
+    """
+    Score a column of subject lines.
+
+    Returns:
+        Dict of column name -> per-row values (NumPy int arrays when NumPy
+        is available, otherwise lists), keyed by SCORE_COLUMNS
+    """
+    SUBJECTS.inc(len(subjects))
+    if np is not None:
+        return _score_numpy(subjects)
+    return _score_python(subjects)
+
+
+def _chunks(rows: Iterable[List[str]], size: int) -> Iterator[List[List[str]]]:
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def score_csv(source: TextIO, dest: TextIO, column: str, chunk_size: int = 100_000,
+              prefix: str = "", stats: Optional[CorpusStats] = None) -> int:
+    """
+    Stream a CSV, appending score columns for the subject in `column`.
+
+    Args:
+        column: Header name, or a zero-based index if the name is not found
+        prefix: Prepended to each appended column name (avoids header clashes)
+        stats: corpus_stats.CorpusStats to fold each scored chunk into
+
+    Returns:
+        Number of data rows scored
+    """
+    reader = csv.reader(source)
+    writer = csv.writer(dest)
+    header = next(reader, None)
+    if header is None:
+        return 0
+
+    if column in header:
+        index = header.index(column)
+    elif column.isdigit() and int(column) < len(header):
+        index = int(column)
+    else:
+        raise ValueError(f"Column not found: {column}")
+
+    writer.writerow(header + [prefix + name for name in SCORE_COLUMNS])
+
+    total = 0
+    for chunk in _chunks(reader, chunk_size):
+        subjects = [row[index] if index < len(row) else "" for row in chunk]
+        scores = score_subject_columns(subjects)
+        if stats is not None:
+            add_subject_columns(stats, scores)
+        values = zip(*(
+            scores[name].tolist() if hasattr(scores[name], "tolist") else scores[name]
+            for name in SCORE_COLUMNS
+        ))
+        writer.writerows(row + list(row_scores) for row, row_scores in zip(chunk, values))
+        total += len(chunk)
+
+    return total
+
+
+def run_csv(input_path: str, output_path: Optional[str], column: str,
+            chunk_size: int = 100_000, prefix: str = "", stats: Optional[CorpusStats] = None) -> int:
+    """Open files (or stdout for output) and run score_csv."""
+    with open(input_path, "r", encoding="utf-8", newline="") as source:
+        if output_path:
+            with open(output_path, "w", encoding="utf-8", newline="") as dest:
+                return score_csv(source, dest, column, chunk_size, prefix, stats)
+        return score_csv(source, sys.stdout, column, chunk_size, prefix, stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Append subject line score columns to a CSV export"
+    )
+    parser.add_argument(
+        "csv",
+        help="Input CSV file with a header row"
+    )
+    parser.add_argument(
+        "--column",
+        default="subject",
+        help="Header name (or zero-based index) of the subject column (default: subject)"
+    )
+    parser.add_argument(
+        "--output",
+        help="Output CSV path (default: stdout)"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=100_000,
+        help="Rows scored per vectorized chunk (default: 100000)"
+    )
+    parser.add_argument(
+        "--prefix",
+        default="",
+        help="Prefix for appended column names"
+    )
+
+    args = parser.parse_args()
+
+    try:
+        count = run_csv(args.csv, args.output, args.column, args.chunk_size, args.prefix)
+    except FileNotFoundError:
+        print(f"ERROR: File not found: {args.csv}", file=sys.stderr)
+        sys.exit(1)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.output:
+        print(f"Scored {count} rows -> {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Subject Rules
+
+Spam trigger and formatting checks for subject lines, shared by
+score_subject_line.py and the pre-send hook. Only the standard library and
+rule_dictionaries.py (whose cache hit costs a stat per dictionary) are
+imported, and no regular expressions are compiled, so the hook loads it
+without paying for the scorer's metrics, caches or regex tables.
+"""
+
+import bisect
+
+from rule_dictionaries import RULES, contains_word
+
+
+SPAM_TRIGGER_INDEX = RULES.spam_trigger_index
+
+
+def strip_merge_tags(subject: str) -> str:
+    """Remove non-empty {...} and [...] spans (merge tags), scanning left to right."""
+    parts = []
+    start = position = 0
+    while position < len(subject):
+        close = {"{": "}", "[": "]"}.get(subject[position])
+        end = subject.find(close, position + 2) if close else -1
+        if end < 0 or subject[position + 1] == close:
+            position += 1
+            continue
+        parts.append(subject[start:position])
+        start = position = end + 1
+    parts.append(subject[start:])
+    return "".join(parts)
+
+
+def check_spam_triggers(subject: str) -> tuple[int, list[str]]:
+    """
+    Check for spam trigger words.
+    Returns: (penalty, list of triggers found)
+
+    -5 points per trigger, max -25
+    """
+    subject_lower = subject.lower()
+    triggers_found = [trigger for trigger in SPAM_TRIGGER_INDEX.find(subject_lower) if trigger != "free"]
+
+    # Special case for "free" - only flag if it's emphasized
+    if (contains_word(subject, "FREE") or 'free!' in subject_lower) and "free" in SPAM_TRIGGER_INDEX:
+        bisect.insort(triggers_found, "free", key=SPAM_TRIGGER_INDEX.rank)
+
+    penalty = max(len(triggers_found) * -5, -25)
+    return penalty, triggers_found
+
+
+def check_formatting(subject: str) -> tuple[int, list[str]]:
+    """
+    Check formatting issues.
+    Returns: (penalty, list of issues)
+
+    - ALL CAPS (entire subject): -15
+    - Excessive exclamation marks (2+): -10 per extra
+    - Excessive question marks (2+): -5
+    - Multiple emoji (3+): -5
+    """
+    penalty = 0
+    issues = []
+
+    # Check for ALL CAPS (ignore merge tags and common acronyms)
+    text_without_tags = strip_merge_tags(subject)
+    if text_without_tags.isupper() and len(text_without_tags) > 5:
+        penalty -= 15
+        issues.append("ALL CAPS detected")
+
+    # Check exclamation marks
+    exclamation_count = subject.count('!')
+    if exclamation_count >= 2:
+        penalty -= (exclamation_count - 1) * 10
+        issues.append(f"{exclamation_count} exclamation marks - excessive")
+
+    # Check question marks
+    question_count = subject.count('?')
+    if question_count >= 2:
+        penalty -= 5
+        issues.append(f"{question_count} question marks - excessive")
+
+    # Check emoji (rough heuristic - non-ASCII characters)
+    emoji_count = sum(1 for char in subject if ord(char) > 127)
+    if emoji_count >= 3:
+        penalty -= 5
+        issues.append(f"Multiple emoji detected ({emoji_count})")
+
+    return penalty, issues
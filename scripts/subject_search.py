@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Subject Line Candidate Search
+
+Best-of-N search driven by the scorer: generates thousands of variants of a
+subject line (formatting fixes, word reorderings, power-word substitutions
+and insertions, merge-tag insertion, trimming to the 30-50 character window),
+scores them all at once with the columnar scorer, and returns the top-k with
+full score breakdowns.
+
+Usage:
+    python subject_search.py "your subject here"
+    python subject_search.py "your subject here" --top 5 --json
+    python score_subject_line.py "your subject here" --search
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+from typing import Any, Dict, List
+
+from score_subject_line import (
+    MERGE_TAG_PLACEHOLDER,
+    MERGE_TAG_RE,
+    POWER_WORDS,
+    SPAM_TRIGGERS,
+    score_subject_line,
+)
+from subject_columns import score_subject_columns
+
+
+# Words dropped first when trimming a candidate into the 30-50 character window
+FILLER_WORDS = {
+    "the", "a", "an", "this", "that", "these", "really", "very", "just",
+    "actually", "all", "of", "our", "so", "now", "today",
+}
+
+# Upper bound on generated candidates scored per subject
+DEFAULT_MAX_CANDIDATES = 5000
+
+_REPEATED_PUNCT_RE = re.compile(r'([!?])[!?]+')
+
+
+def _is_tag(word: str) -> bool:
+    return bool(MERGE_TAG_RE.search(word))
+
+
+def _title(word: str) -> str:
+    return word[:1].upper() + word[1:]
+
+
+def _lower_first(words: List[str]) -> List[str]:
+    """Lowercase the first word unless it is an acronym, label or merge tag."""
+    if words and not _is_tag(words[0]) and not words[0].isupper() and not words[0].endswith(":"):
+        return [words[0][:1].lower() + words[0][1:]] + words[1:]
+    return words
+
+
+def _sentence(words: List[str]) -> str:
+    """Join words, capitalizing the new first word."""
+    if not words:
+        return ""
+    if _is_tag(words[0]):
+        return " ".join(words)
+    return " ".join([_title(words[0])] + words[1:])
+
+
+def clean_formatting(subject: str) -> str:
+    """Remove spam triggers, repeated punctuation and shouting."""
+    text = _REPEATED_PUNCT_RE.sub(r'\1', subject)
+    for trigger in SPAM_TRIGGERS:
+        text = re.sub(rf'\b{re.escape(trigger)}\b!?', '', text, flags=re.IGNORECASE)
+    words = text.split()
+    if sum(1 for w in words if w.isupper() and len(w) > 3) > len(words) // 2:
+        words = [w if _is_tag(w) else w.capitalize() for w in words]
+    return _sentence(words)
+
+
+def trim_to_window(subject: str, max_chars: int = 50) -> str:
+    """Drop filler words, then trailing words, until the subject fits max_chars."""
+    words = subject.split()
+    i = len(words) - 1
+    while len(" ".join(words)) > max_chars and i > 0:
+        if words[i].lower().strip(",:") in FILLER_WORDS:
+            del words[i]
+        i -= 1
+    while len(" ".join(words)) > max_chars and len(words) > 1:
+        drop = len(words) - 1
+        while drop > 0 and _is_tag(words[drop]):
+            drop -= 1
+        if drop == 0:
+            break
+        del words[drop]
+    return " ".join(words).rstrip(",:;-")
+
+
+def _reorderings(words: List[str]) -> List[List[str]]:
+    variants = []
+    for i in range(1, len(words)):
+        variants.append(_lower_first(words[i:]) + _lower_first(words[:i]))
+    for i in range(len(words) - 1):
+        swapped = list(words)
+        swapped[i], swapped[i + 1] = swapped[i + 1], swapped[i]
+        variants.append(swapped)
+    text = " ".join(words)
+    if ":" in text:
+        head, _, tail = text.partition(":")
+        if head.strip() and tail.strip():
+            variants.append(f"{tail.strip()}: {head.strip()}".split())
+    return variants
+
+
+def _power_word_variants(words: List[str]) -> List[List[str]]:
+    present = {w.lower().strip(",:!?.") for w in words}
+    variants = []
+    for power in POWER_WORDS:
+        if power in present:
+            continue
+        variants.append([_title(power)] + _lower_first(words))
+        variants.append([f"{_title(power)}:"] + words)
+        for i, word in enumerate(words):
+            core = word.strip(",:!?.")
+            if len(core) <= 3 or not core.isalpha() or core.lower() in POWER_WORDS:
+                continue
+            replacement = _title(power) if word[:1].isupper() else power
+            variants.append(words[:i] + [word.replace(core, replacement)] + words[i + 1:])
+    return variants
+
+
+def generate_candidates(subject: str, max_candidates: int = DEFAULT_MAX_CANDIDATES,
+                        seed: int = 0) -> List[str]:
+    """
+    Generate distinct variants of a subject line (the original included first).
+
+    If more than `max_candidates` are produced, a deterministic sample is kept.
+    """
+    original = " ".join(subject.split())
+    if not original:
+        return []
+
+    bases = [original]
+    cleaned = clean_formatting(original)
+    if cleaned and cleaned != original:
+        bases.append(cleaned)
+
+    first_level = set(bases)
+    for base in bases:
+        words = base.split()
+        for variant in _reorderings(words) + _power_word_variants(words):
+            first_level.add(_sentence(variant))
+
+    candidates = set(first_level)
+    for candidate in first_level:
+        if not MERGE_TAG_RE.search(candidate):
+            words = candidate.split()
+            candidates.add(f"{MERGE_TAG_PLACEHOLDER}, " + " ".join(_lower_first(words)))
+            candidates.add(f"{candidate.rstrip('.!?')}, {MERGE_TAG_PLACEHOLDER}")
+
+    for candidate in list(candidates):
+        if len(candidate) > 50:
+            trimmed = trim_to_window(candidate)
+            if trimmed:
+                candidates.add(trimmed)
+
+    candidates.discard(original)
+    ordered = sorted(candidates)
+    if len(ordered) > max_candidates - 1:
+        ordered = sorted(random.Random(seed).sample(ordered, max_candidates - 1))
+    return [original] + ordered
+
+
+def search_subject_lines(subject: str, top_k: int = 5,
+                         max_candidates: int = DEFAULT_MAX_CANDIDATES,
+                         seed: int = 0) -> Dict[str, Any]:
+    """
+    Score generated variants in bulk and return the best ones.
+
+    Returns:
+        Dict with the original score, candidate count, elapsed time and the
+        top-k candidates with score breakdowns
+    """
+    start = time.perf_counter()
+    candidates = generate_candidates(subject, max_candidates, seed)
+    if not candidates:
+        return {"subject": subject, "score": 0, "candidates_evaluated": 0,
+                "elapsed_ms": 0.0, "top": []}
+
+    scores = score_subject_columns(candidates)["score"]
+    scores = scores.tolist() if hasattr(scores, "tolist") else scores
+
+    # Highest score first; shorter edits (closer to the original length) break ties
+    ranked = sorted(
+        range(1, len(candidates)),
+        key=lambda i: (-scores[i], abs(len(candidates[i]) - len(candidates[0])), candidates[i])
+    )
+
+    top = []
+    for i in ranked[:top_k]:
+        result = score_subject_line(candidates[i])
+        top.append({
+            "subject": candidates[i],
+            "score": result["score"],
+            "improvement": result["score"] - scores[0],
+            "breakdown": result["breakdown"],
+        })
+
+    return {
+        "subject": subject,
+        "score": scores[0],
+        "candidates_evaluated": len(candidates),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        "top": top,
+    }
+
+
+def format_human_readable(result: Dict[str, Any]) -> str:
+    """Format search results as a ranked list."""
+    GREEN = "\033[92m"
+    BOLD = "\033[1m"
+    RESET = "\033[0m"
+
+    output = []
+    output.append(f"\n{BOLD}Subject Line Search{RESET}")
+    output.append(f"\nOriginal: \"{result['subject']}\" ({result['score']}/100)")
+    output.append(f"Evaluated {result['candidates_evaluated']} candidates in {result['elapsed_ms']} ms")
+    output.append(f"\n{BOLD}Top Candidates:{RESET}")
+    for i, candidate in enumerate(result["top"], 1):
+        delta = candidate["improvement"]
+        change = f"{GREEN}+{delta}{RESET}" if delta > 0 else str(delta)
+        output.append(f"  {i}. \"{candidate['subject']}\" - {candidate['score']}/100 ({change})")
+    return "\n".join(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Search generated variants of a subject line for higher scores"
+    )
+    parser.add_argument(
+        "subject",
+        help="Subject line to improve"
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=5,
+        help="Number of candidates to return (default: 5)"
+    )
+    parser.add_argument(
+        "--max-candidates",
+        type=int,
+        default=DEFAULT_MAX_CANDIDATES,
+        help=f"Candidates scored per subject (default: {DEFAULT_MAX_CANDIDATES})"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Sampling seed when candidates exceed --max-candidates"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Output results as JSON"
+    )
+
+    args = parser.parse_args()
+    result = search_subject_lines(args.subject, args.top, args.max_candidates, args.seed)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(format_human_readable(result))
+
+
+if __name__ == "__main__":
+    main()